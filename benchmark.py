@@ -0,0 +1,434 @@
+"""
+Benchmarks for the engine.
+Usage: python benchmark.py <name>
+
+startup: time to readyok of main.py with a cold Numba cache, a warm cache and a built engine (engine_build.py).
+         A temporary cache directory is used, so the cache next to the sources is left untouched.
+tt:      searches the positions of a game move by move to a fixed depth, keeping the transposition table
+         between moves like in a real game. For a small and the default Hash size, it reports the entries
+         per mb, the nodes to reach the depth, the table hit rate and the nps.
+shared:  searches the positions of the same game split over worker processes, each with a private table
+         and then all on one table in shared memory (shared_table.py). Reports the nodes, the hit rate and the time.
+smp:     searches a few positions of the game to a fixed depth with 1 to 16 threads (Lazy SMP, smp.py),
+         reporting the time to reach the depth and the nps of all processes together.
+multipv: searches positions of the game to a fixed depth with 1 and more pv lines, reporting the nodes
+         and the time relative to a single pv line.
+stop:    sends 'stop' to main.py during long searches and reports the latency until the bestmove.
+nps:     searches a few positions to a fixed depth on a cleared table, and runs perft on the standard perft
+         positions, reporting the nodes, the time and the nodes per second of both. For the search, it also
+         reports per million nodes the calls of the capture and of the quiet move generators by the staged
+         move picker, and the quiet generations skipped by a cutoff before them.
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ENGINE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# A Ruy Lopez, the position after each move is searched in turn
+GAME_MOVES = ("e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 "
+              "f1e1 b7b5 a4b3 d7d6 c2c3 e8g8 h2h3 c6a5 b3c2 c7c5").split()
+TT_BENCHMARK_DEPTH = 9
+TT_BENCHMARK_HASH_SIZES = (4, 64)
+SHARED_BENCHMARK_WORKERS = 4
+SMP_BENCHMARK_THREADS = (1, 2, 4, 8, 16)
+SMP_BENCHMARK_PLIES = (0, 10, 20)
+SMP_BENCHMARK_DEPTH = 10
+MULTIPV_BENCHMARK_LINES = (1, 2, 4)
+MULTIPV_BENCHMARK_DEPTH = 8
+STOP_BENCHMARK_SEARCHES = 10
+STOP_BENCHMARK_DELAY = 1        # seconds of search before the stop
+NPS_BENCHMARK_DEPTH = 11
+NPS_BENCHMARK_FENS = ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                      "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                      "r1bq1rk1/4bppp/p1np1n2/1pp1p3/4P3/2PP1N1P/PPB2PP1/RNBQR1K1 w - - 0 12",
+                      "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1")
+# The fens with the perft depth and node count
+PERFT_BENCHMARK_POSITIONS = (("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 5, 4865609),
+                             ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 4, 4085603),
+                             ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", 6, 11030083),
+                             ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", 4, 422333),
+                             ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", 4, 2103487))
+
+
+def time_to_readyok(env):
+    start_time = time.time()
+
+    engine = subprocess.Popen([sys.executable, os.path.join(ENGINE_DIR, "main.py")], cwd=ENGINE_DIR, env=env,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    engine.stdin.write("uci\nisready\n")
+    engine.stdin.flush()
+
+    for line in engine.stdout:
+        if line.strip() == "readyok":
+            break
+
+    elapsed_time = time.time() - start_time
+
+    engine.stdin.write("quit\n")
+    engine.stdin.flush()
+    engine.wait()
+
+    return elapsed_time
+
+
+def startup_benchmark():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+
+        cold_time = time_to_readyok(env)
+        warm_time = time_to_readyok(env)
+
+        subprocess.run([sys.executable, os.path.join(ENGINE_DIR, "engine_build.py")], cwd=ENGINE_DIR, env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        built_time = time_to_readyok(env)
+
+    print(f"{'start':<8}{'readyok (s)':>12}")
+    print(f"{'cold':<8}{cold_time:>12.2f}")
+    print(f"{'warm':<8}{warm_time:>12.2f}")
+    print(f"{'built':<8}{built_time:>12.2f}")
+
+
+def tt_benchmark():
+    from main import get_default_options, parse_position, parse_setoption
+    from position_class import init_position
+    from search import compile_engine, iterative_search, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time
+    from utilities import NO_MOVE, TT_BUCKET_BYTES, TT_BUCKET_SIZE
+
+    engine = init_search()
+    position = init_position()
+
+    compile_engine(engine, position)
+
+    print(f"{'hash (mb)':<10}{'entries/mb':>12}{'nodes':>12}{'tt hit rate':>14}{'time (s)':>10}{'nps':>10}")
+
+    options = get_default_options()
+
+    for hash_size in TT_BENCHMARK_HASH_SIZES:
+        parse_setoption(engine, options, ["setoption", "name", "Hash", "value", str(hash_size)])
+        new_game(engine)
+
+        SearchStruct_set_max_time(engine, 10 ** 9)
+        SearchStruct_set_max_depth(engine, TT_BENCHMARK_DEPTH)
+
+        total_nodes = 0
+        total_probes = 0
+        total_hits = 0
+        start_time = time.time()
+
+        for ply in range(len(GAME_MOVES) + 1):
+            parse_position(engine, position, ["position", "startpos", "moves"] + GAME_MOVES[:ply], NO_MOVE)
+            iterative_search(engine, position, True)
+
+            total_nodes += engine.node_count
+            total_probes += engine.tt_probes
+            total_hits += engine.tt_hits
+
+        elapsed_time = time.time() - start_time
+        entries_per_mb = 1024 * 1024 // TT_BUCKET_BYTES * TT_BUCKET_SIZE
+
+        print(f"{hash_size:<10}{entries_per_mb:>12}{total_nodes:>12}{total_hits / max(total_probes, 1):>14.1%}"
+              f"{elapsed_time:>10.2f}{int(total_nodes / elapsed_time):>10}")
+
+
+# The engine of a shared benchmark worker process, with its position and shared memory block if any
+worker_state = None
+
+
+def init_shared_worker(table_name, bucket_count):
+    global worker_state
+
+    from main import get_default_options, parse_setoption
+    from position_class import init_position
+    from search import compile_engine, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time
+    from shared_table import attach_shared_table
+    from utilities import DEFAULT_HASH_SIZE
+
+    engine = init_search()
+    position = init_position()
+
+    compile_engine(engine, position)
+
+    memory = None
+    if table_name is None:
+        parse_setoption(engine, get_default_options(), ["setoption", "name", "Hash", "value", str(DEFAULT_HASH_SIZE)])
+        new_game(engine)
+    else:
+        memory = attach_shared_table(engine, table_name, bucket_count)
+        new_game(engine, False)
+
+    SearchStruct_set_max_time(engine, 10 ** 9)
+    SearchStruct_set_max_depth(engine, TT_BENCHMARK_DEPTH)
+
+    worker_state = (engine, position, memory)
+
+
+def search_shared_worker(ply):
+    from main import parse_position
+    from search import iterative_search
+    from utilities import NO_MOVE
+
+    engine, position, _ = worker_state
+
+    parse_position(engine, position, ["position", "startpos", "moves"] + GAME_MOVES[:ply], NO_MOVE)
+    iterative_search(engine, position, True)
+
+    return engine.node_count, engine.tt_probes, engine.tt_hits
+
+
+def run_shared_workers(table_name, bucket_count):
+    context = multiprocessing.get_context("spawn")
+
+    with context.Pool(SHARED_BENCHMARK_WORKERS, init_shared_worker, (table_name, bucket_count)) as pool:
+        # Waits for every worker to compile before the clock starts
+        pool.map(time.sleep, [0.1] * SHARED_BENCHMARK_WORKERS, chunksize=1)
+
+        start_time = time.time()
+        results = pool.map(search_shared_worker, range(len(GAME_MOVES) + 1), chunksize=1)
+        elapsed_time = time.time() - start_time
+
+    total_nodes = sum(result[0] for result in results)
+    hit_rate = sum(result[2] for result in results) / max(sum(result[1] for result in results), 1)
+
+    return total_nodes, hit_rate, elapsed_time
+
+
+def shared_benchmark():
+    from search_class import init_search, get_tt_bucket_count
+    from shared_table import create_shared_table, release_shared_table
+    from utilities import DEFAULT_HASH_SIZE
+
+    print(f"{'table':<10}{'workers':>8}{'nodes':>12}{'tt hit rate':>14}{'time (s)':>10}")
+
+    total_nodes, hit_rate, elapsed_time = run_shared_workers(None, 0)
+    print(f"{'private':<10}{SHARED_BENCHMARK_WORKERS:>8}{total_nodes:>12}{hit_rate:>14.1%}{elapsed_time:>10.2f}")
+
+    engine = init_search()
+    memory = create_shared_table(engine, DEFAULT_HASH_SIZE)
+
+    try:
+        total_nodes, hit_rate, elapsed_time = run_shared_workers(memory.name, get_tt_bucket_count(DEFAULT_HASH_SIZE))
+    finally:
+        release_shared_table(engine, memory, True)
+
+    print(f"{'shared':<10}{SHARED_BENCHMARK_WORKERS:>8}{total_nodes:>12}{hit_rate:>14.1%}{elapsed_time:>10.2f}")
+
+
+def smp_benchmark():
+    from main import get_default_options, parse_position, parse_setoption
+    from position_class import init_position
+    from search import compile_engine, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time
+    from smp import search
+    from utilities import NO_MOVE
+
+    engine = init_search()
+    position = init_position()
+
+    compile_engine(engine, position)
+
+    print(f"{'threads':<8}{'nodes':>12}{'time to depth (s)':>20}{'nps':>10}")
+
+    options = get_default_options()
+
+    for thread_count in SMP_BENCHMARK_THREADS:
+        # Starts the helpers, which is not timed
+        parse_setoption(engine, options, ["setoption", "name", "Threads", "value", str(thread_count)])
+
+        total_nodes = 0
+        elapsed_time = 0
+
+        for ply in SMP_BENCHMARK_PLIES:
+            position_tokens = ["position", "startpos", "moves"] + GAME_MOVES[:ply]
+
+            new_game(engine)
+            parse_position(engine, position, position_tokens, NO_MOVE)
+
+            SearchStruct_set_max_time(engine, 10 ** 9)
+            SearchStruct_set_max_depth(engine, SMP_BENCHMARK_DEPTH)
+
+            start_time = time.time()
+            _, node_count = search(engine, position, position_tokens, True)
+            total_nodes += node_count
+            elapsed_time += time.time() - start_time
+
+        print(f"{thread_count:<8}{total_nodes:>12}{elapsed_time:>20.2f}{int(total_nodes / elapsed_time):>10}")
+
+    parse_setoption(engine, options, ["setoption", "name", "Threads", "value", "1"])
+
+
+def multipv_benchmark():
+    from main import get_default_options, parse_position, parse_setoption
+    from position_class import init_position
+    from search import compile_engine, iterative_search, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time
+    from utilities import NO_MOVE
+
+    engine = init_search()
+    position = init_position()
+
+    compile_engine(engine, position)
+
+    print(f"{'lines':<8}{'nodes':>12}{'time (s)':>10}{'nodes / 1 line':>16}")
+
+    options = get_default_options()
+    single_line_nodes = 0
+
+    for line_count in MULTIPV_BENCHMARK_LINES:
+        parse_setoption(engine, options, ["setoption", "name", "MultiPV", "value", str(line_count)])
+
+        total_nodes = 0
+        start_time = time.time()
+
+        for ply in SMP_BENCHMARK_PLIES:
+            new_game(engine)
+            parse_position(engine, position, ["position", "startpos", "moves"] + GAME_MOVES[:ply], NO_MOVE)
+
+            SearchStruct_set_max_time(engine, 10 ** 9)
+            SearchStruct_set_max_depth(engine, MULTIPV_BENCHMARK_DEPTH)
+
+            iterative_search(engine, position, True)
+            total_nodes += engine.node_count
+
+        elapsed_time = time.time() - start_time
+        single_line_nodes = single_line_nodes or total_nodes
+
+        print(f"{line_count:<8}{total_nodes:>12}{elapsed_time:>10.2f}{total_nodes / single_line_nodes:>16.2f}")
+
+
+def stop_benchmark():
+    engine = subprocess.Popen([sys.executable, os.path.join(ENGINE_DIR, "main.py")], cwd=ENGINE_DIR,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    def send(command, wait_for=None):
+        engine.stdin.write(command + "\n")
+        engine.stdin.flush()
+
+        if wait_for is None:
+            return
+
+        for line in engine.stdout:
+            if line.startswith(wait_for):
+                return
+
+    send("uci", "uciok")
+    send("isready", "readyok")
+
+    latencies = []
+
+    for ply in range(STOP_BENCHMARK_SEARCHES):
+        send("ucinewgame")
+        send("position startpos moves " + " ".join(GAME_MOVES[:ply]))
+        send("go movetime 600000")
+
+        time.sleep(STOP_BENCHMARK_DELAY)
+
+        # isready has to be answered during the search as well
+        send("isready", "readyok")
+
+        start_time = time.perf_counter()
+        send("stop", "bestmove")
+        latencies.append(1000 * (time.perf_counter() - start_time))
+
+    send("quit")
+    engine.wait()
+
+    print(f"{'searches':<10}{'min (ms)':>10}{'mean (ms)':>10}{'max (ms)':>10}")
+    print(f"{len(latencies):<10}{min(latencies):>10.1f}{sum(latencies) / len(latencies):>10.1f}"
+          f"{max(latencies):>10.1f}")
+
+
+def nps_benchmark():
+    from perft import fast_perft
+    from position import parse_fen
+    from position_class import init_position
+    from search import compile_engine, iterative_search, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time
+
+    engine = init_search()
+    position = init_position()
+
+    compile_engine(engine, position)
+    fast_perft(position, 1)
+
+    print(f"{'search':<8}{'nodes':>12}{'time (s)':>10}{'nps':>10}"
+          f"{'captures/M':>12}{'quiets/M':>10}{'skipped/M':>11}")
+
+    total_nodes = 0
+    total_time = 0
+    total_generations = [0, 0, 0]
+
+    for index, fen in enumerate(NPS_BENCHMARK_FENS):
+        new_game(engine)
+        parse_fen(position, fen)
+
+        SearchStruct_set_max_time(engine, 10 ** 9)
+        SearchStruct_set_max_depth(engine, NPS_BENCHMARK_DEPTH)
+
+        start_time = time.time()
+        iterative_search(engine, position, True)
+        elapsed_time = time.time() - start_time
+
+        total_nodes += engine.node_count
+        total_time += elapsed_time
+
+        # A quiet generation is skipped at each node of the picker cut off before reaching the quiet moves
+        generations = (engine.capture_generations, engine.quiet_generations,
+                       engine.picker_nodes - engine.quiet_generations)
+        total_generations = [total + count for total, count in zip(total_generations, generations)]
+
+        print(f"{index + 1:<8}{engine.node_count:>12}{elapsed_time:>10.2f}{int(engine.node_count / elapsed_time):>10}"
+              f"{generations[0] * 10 ** 6 // engine.node_count:>12}{generations[1] * 10 ** 6 // engine.node_count:>10}"
+              f"{generations[2] * 10 ** 6 // engine.node_count:>11}")
+
+    print(f"{'total':<8}{total_nodes:>12}{total_time:>10.2f}{int(total_nodes / total_time):>10}"
+          f"{total_generations[0] * 10 ** 6 // total_nodes:>12}{total_generations[1] * 10 ** 6 // total_nodes:>10}"
+          f"{total_generations[2] * 10 ** 6 // total_nodes:>11}")
+    print()
+    print(f"{'perft':<8}{'nodes':>12}{'time (s)':>10}{'nps':>10}")
+
+    total_nodes = 0
+    total_time = 0
+
+    for index, (fen, depth, expected_nodes) in enumerate(PERFT_BENCHMARK_POSITIONS):
+        parse_fen(position, fen)
+
+        start_time = time.time()
+        nodes = fast_perft(position, depth)
+        elapsed_time = time.time() - start_time
+
+        assert nodes == expected_nodes, f"perft {depth} of {fen}: {nodes} nodes instead of {expected_nodes}"
+
+        total_nodes += nodes
+        total_time += elapsed_time
+
+        print(f"{index + 1:<8}{nodes:>12}{elapsed_time:>10.2f}{int(nodes / elapsed_time):>10}")
+
+    print(f"{'total':<8}{total_nodes:>12}{total_time:>10.2f}{int(total_nodes / total_time):>10}")
+
+
+BENCHMARKS = {
+    "startup": startup_benchmark,
+    "tt": tt_benchmark,
+    "shared": shared_benchmark,
+    "smp": smp_benchmark,
+    "multipv": multipv_benchmark,
+    "stop": stop_benchmark,
+    "nps": nps_benchmark,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in BENCHMARKS:
+        print("usage: python benchmark.py [" + "|".join(BENCHMARKS) + "]")
+        sys.exit(1)
+
+    BENCHMARKS[sys.argv[1]]()
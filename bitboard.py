@@ -0,0 +1,191 @@
+"""
+Bitboards.
+
+Alongside the 10x12 mailbox, the position keeps a bitboard per piece and the occupancy of each side,
+with bit i standing for square i of the standard 8x8 indexing (MAILBOX_TO_STANDARD, a8 is 0 and h1 is 63).
+
+Knight, king and pawn attacks are looked up in tables. Sliding attacks use the classical approach, without
+magics or PEXT: the ray of each direction from the square is cut at its first blocker, found with a bitscan.
+The tables are built with numpy when the module is imported, and frozen into the compiled code as constants.
+"""
+
+from utilities import *
+
+
+# Directions, the rays of the first four go towards higher square indices, so their first blocker is the lowest bit
+SOUTH, EAST, SOUTH_EAST, SOUTH_WEST, NORTH, WEST, NORTH_EAST, NORTH_WEST = range(8)
+DIRECTION_STEPS = ((1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, 1), (-1, -1))   # (row, file)
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# The de Bruijn bitscan: the bits up to the scanned one, multiplied by the de Bruijn number,
+# have a unique top six bits indexing DEBRUIJN_INDICES
+DEBRUIJN_NUMBER = 0x03f79d71b4cb0a89
+
+
+def get_bit(row, file):
+    return 1 << (row * 8 + file)
+
+
+def is_on_board(row, file):
+    return 0 <= row < 8 and 0 <= file < 8
+
+
+def get_step_attacks(steps):
+    attacks = np.zeros(64, dtype=np.uint64)
+
+    for square in range(64):
+        row, file = divmod(square, 8)
+        for row_step, file_step in steps:
+            if is_on_board(row + row_step, file + file_step):
+                attacks[square] |= np.uint64(get_bit(row + row_step, file + file_step))
+
+    return attacks
+
+
+def get_rays():
+    rays = np.zeros((8, 64), dtype=np.uint64)
+
+    for direction, (row_step, file_step) in enumerate(DIRECTION_STEPS):
+        for square in range(64):
+            row, file = divmod(square, 8)
+            row, file = row + row_step, file + file_step
+
+            while is_on_board(row, file):
+                rays[direction][square] |= np.uint64(get_bit(row, file))
+                row, file = row + row_step, file + file_step
+
+    return rays
+
+
+def get_lines():
+    # The squares strictly between two squares on a line, and the whole line through them
+    between = np.zeros((64, 64), dtype=np.uint64)
+    lines = np.zeros((64, 64), dtype=np.uint64)
+
+    for direction, (row_step, file_step) in enumerate(DIRECTION_STEPS):
+        # Each line is made of the rays of a direction and of the opposite one
+        opposite = DIRECTION_STEPS.index((-row_step, -file_step))
+
+        for square in range(64):
+            row, file = divmod(square, 8)
+            squares = 0
+            row, file = row + row_step, file + file_step
+
+            while is_on_board(row, file):
+                target = row * 8 + file
+                between[square][target] = np.uint64(squares)
+                lines[square][target] = RAYS[direction][square] | RAYS[opposite][square] | np.uint64(1 << square)
+
+                squares |= get_bit(row, file)
+                row, file = row + row_step, file + file_step
+
+    return between, lines
+
+
+def get_debruijn_indices():
+    indices = np.full(64, -1, dtype=np.int64)
+
+    for i in range(64):
+        key = (((1 << (i + 1)) - 1) * DEBRUIJN_NUMBER & (2 ** 64 - 1)) >> 58
+        assert indices[key] == -1
+        indices[key] = i
+
+    return indices
+
+
+KNIGHT_ATTACKS = get_step_attacks(KNIGHT_STEPS)
+KING_ATTACKS = get_step_attacks(KING_STEPS)
+
+# PAWN_ATTACKS[side][square], the squares a pawn of the side attacks from the square. White pawns move up (row - 1).
+# A square is attacked by the pawns of a side if they stand on the squares a pawn of the other side would attack.
+PAWN_ATTACKS = np.array((get_step_attacks(((-1, -1), (-1, 1))), get_step_attacks(((1, -1), (1, 1)))))
+
+RAYS = get_rays()
+DEBRUIJN_INDICES = get_debruijn_indices()
+
+# BETWEEN[a][b], the squares between two squares on a rank, file or diagonal, 0 otherwise.
+# LINES[a][b], the whole line through them, a pinned piece can only move along the line through its king and itself.
+BETWEEN, LINES = get_lines()
+
+# The attacks of the sliding pieces on an empty board, a slider outside of them can't attack the square
+BISHOP_RAYS = RAYS[SOUTH_EAST] | RAYS[SOUTH_WEST] | RAYS[NORTH_EAST] | RAYS[NORTH_WEST]
+ROOK_RAYS = RAYS[SOUTH] | RAYS[EAST] | RAYS[NORTH] | RAYS[WEST]
+
+# Pawn structure masks
+FILE_MASKS = np.array([sum(get_bit(row, file) for row in range(8)) for file in range(8)], dtype=np.uint64)
+ADJACENT_FILE_MASKS = np.array([sum(int(FILE_MASKS[adjacent]) for adjacent in (file - 1, file + 1) if 0 <= adjacent < 8)
+                                for file in range(8)], dtype=np.uint64)
+
+# [side][square], the squares in front of the square on its file, from the point of view of the side
+FORWARD_FILE_MASKS = np.array((RAYS[NORTH], RAYS[SOUTH]))
+
+# [side][square], the squares in front of the square on its file and the adjacent ones,
+# a pawn is passed when no enemy pawn stands on them
+PASSED_PAWN_MASKS = np.array([[int(FORWARD_FILE_MASKS[side][square]) |
+                               int(FORWARD_FILE_MASKS[side][square - 1] if square % 8 > 0 else 0) |
+                               int(FORWARD_FILE_MASKS[side][square + 1] if square % 8 < 7 else 0)
+                               for square in range(64)] for side in range(2)], dtype=np.uint64)
+
+
+@nb.njit(cache=True)
+def get_lsb_index(bitboard):
+    # The bits up to and including the lowest one
+    return DEBRUIJN_INDICES[((bitboard ^ (bitboard - nb.uint64(1))) * nb.uint64(DEBRUIJN_NUMBER)) >> nb.uint64(58)]
+
+
+@nb.njit(cache=True)
+def get_msb_index(bitboard):
+    # The bits up to and including the highest one
+    bitboard |= bitboard >> nb.uint64(1)
+    bitboard |= bitboard >> nb.uint64(2)
+    bitboard |= bitboard >> nb.uint64(4)
+    bitboard |= bitboard >> nb.uint64(8)
+    bitboard |= bitboard >> nb.uint64(16)
+    bitboard |= bitboard >> nb.uint64(32)
+
+    return DEBRUIJN_INDICES[(bitboard * nb.uint64(DEBRUIJN_NUMBER)) >> nb.uint64(58)]
+
+
+@nb.njit(cache=True)
+def get_ray_attacks(square, occupancy, direction):
+    # The squares after the first blocker are the ray of the blocker, which is removed
+    attacks = RAYS[direction][square]
+    blockers = attacks & occupancy
+
+    if blockers:
+        blocker = get_lsb_index(blockers) if direction < NORTH else get_msb_index(blockers)
+        attacks ^= RAYS[direction][blocker]
+
+    return attacks
+
+
+@nb.njit(cache=True)
+def get_bishop_attacks(square, occupancy):
+    return get_ray_attacks(square, occupancy, SOUTH_EAST) | get_ray_attacks(square, occupancy, SOUTH_WEST) | \
+        get_ray_attacks(square, occupancy, NORTH_EAST) | get_ray_attacks(square, occupancy, NORTH_WEST)
+
+
+@nb.njit(cache=True)
+def get_rook_attacks(square, occupancy):
+    return get_ray_attacks(square, occupancy, SOUTH) | get_ray_attacks(square, occupancy, EAST) | \
+        get_ray_attacks(square, occupancy, NORTH) | get_ray_attacks(square, occupancy, WEST)
+
+
+@nb.njit(cache=True)
+def get_piece_attacks(piece, side, square, occupancy):
+    """The squares attacked by a piece of the side, the piece given as its white piece."""
+
+    if piece == WHITE_PAWN:
+        return PAWN_ATTACKS[side][square]
+    if piece == WHITE_KNIGHT:
+        return KNIGHT_ATTACKS[square]
+    if piece == WHITE_BISHOP:
+        return get_bishop_attacks(square, occupancy)
+    if piece == WHITE_ROOK:
+        return get_rook_attacks(square, occupancy)
+    if piece == WHITE_QUEEN:
+        return get_bishop_attacks(square, occupancy) | get_rook_attacks(square, occupancy)
+
+    return KING_ATTACKS[square]
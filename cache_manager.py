@@ -0,0 +1,265 @@
+"""
+Numba cache management for the engine.
+
+The compiled functions are stored in <cache root>/<runtime key>/<module>-<fingerprint>/
+-The cache root is ANTARES_CACHE_DIR, then NUMBA_CACHE_DIR, then __pycache__/numba next to the sources.
+-The runtime key holds the Numba and Python versions and the host cpu name and features,
+ so a cache built on another machine or with another Numba is never loaded.
+-The module fingerprint hashes the source of the module and of every engine module it imports,
+ since Numba inlines the jitted functions of imported modules into the callers.
+
+Numba itself keys its cache on file modification times, so a fresh checkout with unchanged
+sources recompiles everything. Keying on the source hash instead means a deploy only recompiles
+the modules that changed (or that import one that changed), and prune_cache removes exactly the
+directories that no longer match a module.
+
+Usage: python cache_manager.py [info|prune|clear|report]
+report prints the time taken to load or compile each of the engine's kernels.
+"""
+
+import ast
+import functools
+import hashlib
+import inspect
+import os
+import shutil
+import sys
+
+import llvmlite.binding as llvm
+import numba as nb
+from numba.core import caching
+
+
+ENGINE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+CACHE_DIR_VARIABLE = "ANTARES_CACHE_DIR"
+
+
+def get_cache_root():
+    cache_root = os.environ.get(CACHE_DIR_VARIABLE) or nb.config.CACHE_DIR
+    return cache_root or os.path.join(ENGINE_DIR, "__pycache__", "numba")
+
+
+@functools.lru_cache(maxsize=None)
+def get_runtime_key():
+    cpu_name = nb.config.CPU_NAME or llvm.get_host_cpu_name()
+    cpu_features = nb.config.CPU_FEATURES or llvm.get_host_cpu_features().flatten()
+    features_hash = hashlib.sha256(cpu_features.encode()).hexdigest()[:12]
+
+    return f"numba{nb.__version__}-py{sys.version_info[0]}{sys.version_info[1]}-{cpu_name}-{features_hash}"
+
+
+def get_cache_dir():
+    return os.path.join(get_cache_root(), get_runtime_key())
+
+
+def get_engine_modules():
+    return sorted(file_name[:-3] for file_name in os.listdir(ENGINE_DIR) if file_name.endswith(".py"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_module_imports(module_name):
+    """Returns the engine modules imported directly by the module."""
+
+    with open(os.path.join(ENGINE_DIR, module_name + ".py"), "rb") as f:
+        tree = ast.parse(f.read())
+
+    # Only module level imports, the ones inside functions are for python code
+    imported = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            imported.add(node.module)
+
+    # This module holds no jitted code, the locator it installs is covered by the runtime key
+    imported.discard("cache_manager")
+
+    return imported.intersection(get_engine_modules())
+
+
+@functools.lru_cache(maxsize=None)
+def get_module_fingerprint(module_name):
+    """Hashes the source of the module and of all the engine modules it imports, directly or not."""
+
+    dependencies = set()
+    pending = [module_name]
+
+    while pending:
+        current_module = pending.pop()
+        if current_module in dependencies:
+            continue
+        dependencies.add(current_module)
+        pending.extend(get_module_imports(current_module))
+
+    fingerprint = hashlib.sha256()
+    for dependency in sorted(dependencies):
+        with open(os.path.join(ENGINE_DIR, dependency + ".py"), "rb") as f:
+            fingerprint.update(dependency.encode())
+            fingerprint.update(f.read())
+
+    return fingerprint.hexdigest()[:16]
+
+
+def get_module_cache_name(module_name):
+    return module_name + "-" + get_module_fingerprint(module_name)
+
+
+class EngineCacheLocator(caching._CacheLocator):
+    """
+    Locates the cache of the functions defined in the engine's own modules,
+    functions from anywhere else are left to Numba's default locators.
+    """
+
+    def __init__(self, py_func, py_file):
+        self._module_name = os.path.splitext(os.path.basename(py_file))[0]
+        self._lineno = py_func.__code__.co_firstlineno
+        self._cache_path = os.path.join(get_cache_dir(), get_module_cache_name(self._module_name))
+
+    def get_cache_path(self):
+        return self._cache_path
+
+    def get_source_stamp(self):
+        return get_module_fingerprint(self._module_name)
+
+    def get_disambiguator(self):
+        return str(self._lineno)
+
+    @classmethod
+    def from_function(cls, py_func, py_file):
+        if os.path.dirname(os.path.realpath(py_file)) != ENGINE_DIR:
+            return None
+
+        locator = cls(py_func, py_file)
+        try:
+            locator.ensure_cache_path()
+        except OSError:
+            # Not writable, fall back to Numba's own locators
+            return None
+
+        return locator
+
+
+def install_cache_locator():
+    """Has to run before the first function with cache=True is decorated."""
+
+    # The class was renamed from _CacheImpl in newer Numba versions
+    cache_impl = getattr(caching, "CacheImpl", None) or caching._CacheImpl
+    # Compared by name, as running this file as a script imports it a second time as cache_manager
+    if all(locator.__name__ != EngineCacheLocator.__name__ for locator in cache_impl._locator_classes):
+        cache_impl._locator_classes.insert(0, EngineCacheLocator)
+
+
+def get_stale_paths():
+    """Returns the cache directories that belong to another runtime or to an outdated module source."""
+
+    cache_root = get_cache_root()
+    if not os.path.isdir(cache_root):
+        return []
+
+    stale_paths = []
+    runtime_key = get_runtime_key()
+
+    for entry in sorted(os.listdir(cache_root)):
+        if entry != runtime_key:
+            stale_paths.append(os.path.join(cache_root, entry))
+
+    cache_dir = get_cache_dir()
+    if os.path.isdir(cache_dir):
+        current_entries = {get_module_cache_name(module_name) for module_name in get_engine_modules()}
+
+        for entry in sorted(os.listdir(cache_dir)):
+            entry_path = os.path.join(cache_dir, entry)
+            if os.path.isdir(entry_path) and entry not in current_entries:
+                stale_paths.append(entry_path)
+
+    return stale_paths
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def prune_cache():
+    stale_paths = get_stale_paths()
+
+    for path in stale_paths:
+        remove_path(path)
+
+    return stale_paths
+
+
+def get_index_path(kernel):
+    """
+    The path of the cache index of a kernel defined in the engine's modules, found with EngineCacheLocator
+    and named like Numba names its index files: <module>.<qualname>-<line>.py<version><abiflags>.nbi
+    """
+
+    py_func = kernel.py_func
+    py_file = inspect.getfile(py_func)
+    locator = EngineCacheLocator(py_func, py_file)
+
+    module_name = os.path.splitext(os.path.basename(py_file))[0]
+    full_name = f"{module_name}.{py_func.__qualname__}".replace("<", "").replace(">", "")
+    python_version = f"{sys.version_info[0]}{sys.version_info[1]}{getattr(sys, 'abiflags', '')}"
+
+    return os.path.join(locator.get_cache_path(),
+                        f"{full_name}-{locator.get_disambiguator()}.py{python_version}.nbi")
+
+
+def is_cached(kernel):
+    """True if the kernel has an index in the cache, though it may not hold every signature."""
+    return os.path.exists(get_index_path(kernel))
+
+
+def clear_cache():
+    shutil.rmtree(get_cache_root(), ignore_errors=True)
+
+
+def report_kernels():
+    """Loads or compiles each kernel of the engine build and prints the time it took."""
+
+    from engine_build import compile_kernels, print_timings
+
+    print_timings(compile_kernels())
+
+
+def print_info():
+    print(f"cache root:  {get_cache_root()}")
+    print(f"runtime key: {get_runtime_key()}")
+
+    cache_dir = get_cache_dir()
+    for module_name in get_engine_modules():
+        module_path = os.path.join(cache_dir, get_module_cache_name(module_name))
+        if os.path.isdir(module_path):
+            print(f"{get_module_cache_name(module_name):<40}{len(os.listdir(module_path)):>6} files")
+
+    for path in get_stale_paths():
+        print(f"stale: {path}")
+
+
+install_cache_locator()
+
+
+if __name__ == "__main__":
+    commands = ("info", "prune", "clear", "report")
+
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print("usage: python cache_manager.py [" + "|".join(commands) + "]")
+        sys.exit(1)
+
+    if sys.argv[1] == "info":
+        print_info()
+    elif sys.argv[1] == "prune":
+        for pruned_path in prune_cache():
+            print(f"pruned {pruned_path}")
+    elif sys.argv[1] == "clear":
+        clear_cache()
+    else:
+        report_kernels()
@@ -0,0 +1,220 @@
+"""
+Ahead of time build of the engine.
+
+Running this file compiles the hot kernels with explicit signatures into Numba's on-disk cache
+and writes a stamp holding a fingerprint of the engine sources and the Numba version.
+main.py loads the kernels straight from the cache when the stamp is fresh, and falls back
+to JIT compiling through jit_engine when the stamp is missing or stale.
+
+The leaf kernels don't depend on each other, so they are compiled concurrently in a pool of processes,
+then the recursive search kernels are compiled in this process on top of them.
+Numba holds a global compiler lock, which is why threads wouldn't help. The workers write to the
+on-disk cache, and this process then loads the leaves from it in a few milliseconds.
+
+numba.pycc cannot export functions that take structrefs or typed lists as arguments,
+so the cache itself is the build artifact rather than an extension module.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba as nb
+
+from cache_manager import get_cache_dir, is_cached, prune_cache
+from evaluation import evaluate, score_move, score_capture
+from move_generator import get_legal_moves, get_legal_captures, get_legal_quiets, get_move_scores, \
+    get_capture_scores, sort_next_move, is_legal_move, pick_next_move
+from position import make_move, undo_move, load_position, is_attacked, compute_hash
+from position_class import POSITION_STRUCT_TYPE, init_position
+from search import negamax, qsearch, compile_engine
+from search_class import SEARCH_STRUCT_TYPE, init_search
+from transposition import probe_tt_entry, record_tt_entry, probe_tt_entry_q, record_tt_entry_q, probe_tt_move
+from utilities import MOVE_TYPE, SCORE_TYPE
+
+
+ENGINE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# The files containing jitted code, any change in them invalidates the build.
+ENGINE_SOURCES = (
+    "utilities.py",
+    "move.py",
+    "bitboard.py",
+    "position.py",
+    "position_class.py",
+    "move_generator.py",
+    "evaluation.py",
+    "transposition.py",
+    "search.py",
+    "search_class.py",
+)
+
+STAMP_FILE = "antares_build.stamp"
+
+# The rows of the move stack the move generators write into
+MOVE_ROW_TYPE = MOVE_TYPE[::1]
+SCORE_ROW_TYPE = SCORE_TYPE[::1]
+
+# The argument types match the ones used by the callers, so the cached
+# entries are the same ones that are looked up during a search.
+LEAF_SIGNATURES = (
+    (evaluate, (POSITION_STRUCT_TYPE,)),
+    (score_move, (SEARCH_STRUCT_TYPE, MOVE_TYPE, nb.int64)),
+    (score_capture, (MOVE_TYPE, nb.int64)),
+    (get_legal_moves, (POSITION_STRUCT_TYPE, MOVE_ROW_TYPE)),
+    (get_legal_captures, (POSITION_STRUCT_TYPE, MOVE_ROW_TYPE)),
+    (get_legal_quiets, (POSITION_STRUCT_TYPE, MOVE_ROW_TYPE)),
+    (is_legal_move, (POSITION_STRUCT_TYPE, MOVE_TYPE)),
+    (get_move_scores, (SEARCH_STRUCT_TYPE, MOVE_ROW_TYPE, SCORE_ROW_TYPE, nb.int64, nb.int64)),
+    (get_capture_scores, (MOVE_ROW_TYPE, SCORE_ROW_TYPE, nb.int64, nb.int64)),
+    (sort_next_move, (MOVE_ROW_TYPE, SCORE_ROW_TYPE, nb.int64, nb.int64)),
+    (pick_next_move, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, MOVE_ROW_TYPE, SCORE_ROW_TYPE,
+                      nb.int64, nb.int64, nb.int64, nb.int64)),
+    (make_move, (POSITION_STRUCT_TYPE, MOVE_TYPE)),
+    (undo_move, (POSITION_STRUCT_TYPE, MOVE_TYPE, nb.int8, nb.uint8, nb.uint64)),
+    (is_attacked, (POSITION_STRUCT_TYPE, nb.uint8)),
+    (compute_hash, (POSITION_STRUCT_TYPE,)),
+    (load_position, (POSITION_STRUCT_TYPE, nb.uint8[::1], nb.int64, nb.int64, nb.int64)),
+    (probe_tt_entry, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64, nb.int64)),
+    (record_tt_entry, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64, nb.int64, nb.int64)),
+    (probe_tt_entry_q, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64)),
+    (record_tt_entry_q, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64, nb.int64)),
+    (probe_tt_move, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE)),
+)
+
+SEARCH_SIGNATURES = (
+    (qsearch, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64, nb.int64)),
+    (negamax, (SEARCH_STRUCT_TYPE, POSITION_STRUCT_TYPE, nb.int64, nb.int64, nb.int64, nb.boolean)),
+)
+
+# The leaves come first, so the time of each kernel doesn't include the functions it calls.
+KERNEL_SIGNATURES = LEAF_SIGNATURES + SEARCH_SIGNATURES
+
+
+def get_stamp_path():
+    return os.path.join(get_cache_dir(), STAMP_FILE)
+
+
+def get_build_fingerprint():
+    fingerprint = hashlib.sha256()
+
+    for file_name in ENGINE_SOURCES:
+        with open(os.path.join(ENGINE_DIR, file_name), "rb") as f:
+            fingerprint.update(f.read())
+
+    fingerprint.update(nb.__version__.encode())
+    fingerprint.update(sys.version.encode())
+
+    return fingerprint.hexdigest()
+
+
+def is_build_fresh():
+    try:
+        with open(get_stamp_path()) as f:
+            return f.read().strip() == get_build_fingerprint()
+    except OSError:
+        return False
+
+
+def compile_kernel(kernel, signature):
+    """Compiles the kernel, or loads it from the cache, and returns its name, what happened and the time taken."""
+
+    cache_hits = sum(kernel.stats.cache_hits.values())
+
+    start_time = time.perf_counter()
+    kernel.compile(signature)
+    elapsed_time = time.perf_counter() - start_time
+
+    if sum(kernel.stats.cache_hits.values()) > cache_hits:
+        result = "load"
+    elif elapsed_time < 0.001:
+        # Already compiled as a callee of an earlier kernel
+        result = "ready"
+    else:
+        result = "compile"
+
+    return kernel.py_func.__name__, result, elapsed_time
+
+
+def compile_leaf_kernel(index):
+    # Runs in a pool process, the code reaches the parent through the on-disk cache
+    name, result, elapsed_time = compile_kernel(*LEAF_SIGNATURES[index])
+    return name, f"worker {os.getpid()}", result, elapsed_time
+
+
+def compile_kernels(workers=1):
+    """
+    Compiles every kernel and returns a timing row per kernel.
+    With more than one worker, the leaf kernels missing from the cache are first compiled in a process pool.
+    """
+
+    timings = []
+
+    missing_leaves = [i for i, (kernel, _) in enumerate(LEAF_SIGNATURES) if not is_cached(kernel)]
+
+    if workers > 1 and len(missing_leaves) > 1:
+        # Spawned rather than forked, as forking a process that has initialized LLVM isn't safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(min(workers, len(missing_leaves)), mp_context=context) as pool:
+            timings.extend(pool.map(compile_leaf_kernel, missing_leaves))
+
+    for kernel, signature in KERNEL_SIGNATURES:
+        name, result, elapsed_time = compile_kernel(kernel, signature)
+        timings.append((name, "main", result, elapsed_time))
+
+    return timings
+
+
+def print_timings(timings, file=sys.stdout):
+    print(f"{'kernel':<28}{'process':<16}{'result':>10}{'time (ms)':>12}", file=file)
+
+    for name, process, result, elapsed_time in timings:
+        print(f"{name:<28}{process:<16}{result:>10}{elapsed_time * 1000:>12.1f}", file=file)
+
+
+def load_engine(engine, position):
+    """
+    Loads the prebuilt kernels from the cache. The compile_engine warm-up search
+    then only touches cached functions, and it leaves the engine in the same state as the JIT path.
+    """
+    compile_kernels()
+    compile_engine(engine, position)
+
+
+def jit_engine(engine, position, workers=None):
+    """
+    Compiles the engine without a fresh build, using every cpu for the leaf kernels.
+    The timing table goes to stderr, since stdout belongs to the uci protocol.
+    """
+    start_time = time.time()
+
+    timings = compile_kernels(workers or os.cpu_count())
+    compile_engine(engine, position)
+
+    print_timings(timings, file=sys.stderr)
+    print(f"compiled engine in {time.time() - start_time:.2f}s", file=sys.stderr)
+
+
+def build_engine():
+    start_time = time.time()
+
+    for pruned_path in prune_cache():
+        print(f"pruned stale cache {pruned_path}")
+
+    timings = compile_kernels(os.cpu_count())
+    compile_engine(init_search(), init_position())
+
+    stamp_path = get_stamp_path()
+    os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, "w") as f:
+        f.write(get_build_fingerprint())
+
+    print_timings(timings)
+    print(f"built engine in {time.time() - start_time:.2f}s, stamp written to {stamp_path}")
+
+
+if __name__ == "__main__":
+    build_engine()
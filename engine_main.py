@@ -4,7 +4,6 @@ This file is solely for testing purposes.
 The main file which handles uci is main.py
 """
 
-from cache_clearer import kill_numba_cache
 from perft import *
 from search import iterative_search, new_game
 from search_class import init_search, SearchStruct_set_max_time, SearchStruct_set_max_depth
@@ -44,7 +43,8 @@ def main():
     new_game(main_engine)
     SearchStruct_set_max_time(main_engine, 60000)
     SearchStruct_set_max_depth(main_engine, 64)
-    iterative_search(main_engine, main_position, False)
+    best_pv = iterative_search(main_engine, main_position, False)
+    print("bestmove", best_pv[0])
 
     '''for i in range(1, 6):
         start = time.time()
@@ -62,10 +62,5 @@ def main():
     print(CASTLE_HASH_KEYS)'''
 
 
-def clear_cache():
-    kill_numba_cache()
-
-
 if __name__ == "__main__":
     main()
-    # clear_cache()
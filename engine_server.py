@@ -0,0 +1,203 @@
+"""
+Pre-fork UCI server.
+
+The server compiles the engine once, then listens on a unix socket and forks a child per connection.
+Each child runs the usual UCI loop of main.py on the engine and position the server built before forking,
+with the compiled code already mapped and the transposition table allocated, so it is ready in milliseconds.
+
+Start the server:
+    python engine_server.py --socket /tmp/antares.sock --workers 8 --memory-limit 1024
+Use this as the engine command in the GUI / tournament manager:
+    python engine_server.py --connect /tmp/antares.sock
+
+--workers caps the number of children running at once, further connections wait for a child to exit.
+--memory-limit caps the address space of each child in megabytes (RLIMIT_AS). A compiled engine with the
+default hash uses around 350mb of address space, so the limit should be well above that.
+
+Forking a process that has initialized LLVM isn't safe in general, which is why engine_build.py spawns its
+compile workers. Here the fork is safe since nothing is compiled after it: warm_up compiles every jitted function
+the UCI loop can reach, and the server is single threaded when it forks. A child only runs machine code
+already loaded by the server, and never calls into LLVM.
+"""
+
+import argparse
+import os
+import resource
+import selectors
+import socket
+import sys
+import tempfile
+
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "antares.sock")
+
+
+def warm_up():
+    """
+    Compiles everything the UCI loop uses, the same way main.py would, and returns the engine and the position
+    the children inherit. The table is cleared in place after the warm-up search, so every child starts
+    with an empty one without allocating it again.
+    """
+
+    from engine_build import is_build_fresh, load_engine, jit_engine
+    from hash_file import map_hash_file, unmap_hash_file
+    from main import compile_uci, get_default_options, parse_setoption
+    from position_class import init_position, position_spec
+    from search import new_game
+    from search_class import init_search, search_spec
+    from shared_table import create_shared_table, release_shared_table
+
+    engine = init_search()
+    position = init_position()
+
+    if is_build_fresh():
+        load_engine(engine, position)
+    else:
+        jit_engine(engine, position)
+
+    # On scratch structs, since it sets the Hash option to 1 mb
+    scratch_engine = init_search()
+    scratch_position = init_position()
+    compile_uci(scratch_engine, scratch_position)
+
+    # The fields read from python go through jitted getters, compiled on the first read
+    for name, _ in search_spec:
+        getattr(scratch_engine, name)
+    for name, _ in position_spec:
+        getattr(scratch_position, name)
+
+    # The option setters compile_uci leaves out, and the tables of the Threads and Hash File options,
+    # which are typed apart from the private table
+    parse_setoption(scratch_engine, get_default_options(), "setoption name MultiPV value 1".split())
+    release_shared_table(scratch_engine, create_shared_table(scratch_engine, 1), True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        map_hash_file(scratch_engine, os.path.join(directory, "warm_up.hash"), 1)
+        unmap_hash_file(scratch_engine, 1)
+
+    new_game(engine, True)
+
+    return engine, position
+
+
+def run_child(connection, memory_limit, engine, position):
+    """Runs the UCI loop of main.py over the connection, on the engine and position of the server. Never returns."""
+
+    import main
+
+    exit_code = 0
+
+    try:
+        if memory_limit:
+            limit = memory_limit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        os.dup2(connection.fileno(), 0)
+        os.dup2(connection.fileno(), 1)
+        connection.close()
+
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+
+        main.uci_loop(engine, position)
+
+    except (SystemExit, EOFError, BrokenPipeError):
+        pass
+    except MemoryError:
+        print("engine worker exceeded its memory limit", file=sys.stderr)
+        exit_code = 1
+
+    os._exit(exit_code)
+
+
+def reap_children(children, block):
+    while children:
+        pid, _ = os.waitpid(-1, 0 if block else os.WNOHANG)
+        if pid == 0:
+            return
+        children.discard(pid)
+        if block:
+            return
+
+
+def serve(socket_path, workers, memory_limit):
+    engine, position = warm_up()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+
+    print(f"serving on {socket_path} with {workers} workers", file=sys.stderr)
+
+    children = set()
+
+    try:
+        while True:
+            reap_children(children, False)
+
+            # Wait for a worker slot before accepting another connection
+            if len(children) >= workers:
+                reap_children(children, True)
+                continue
+
+            connection, _ = server.accept()
+
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                run_child(connection, memory_limit, engine, position)
+
+            connection.close()
+            children.add(pid)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
+def connect(socket_path):
+    """Relays stdin and stdout to a server child, this doesn't import Numba so it starts instantly."""
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(socket_path)
+
+    selector = selectors.DefaultSelector()
+    selector.register(sys.stdin.fileno(), selectors.EVENT_READ, connection.fileno())
+    selector.register(connection.fileno(), selectors.EVENT_READ, sys.stdout.fileno())
+
+    while True:
+        for key, _ in selector.select():
+            data = os.read(key.fd, 65536)
+
+            if not data:
+                if key.fd == connection.fileno():
+                    return
+                connection.shutdown(socket.SHUT_WR)
+                selector.unregister(key.fd)
+                continue
+
+            os.write(key.data, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork UCI server for Antares")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="path of the unix socket")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="maximum number of running children")
+    parser.add_argument("--memory-limit", type=int, default=0, help="address space limit per child in mb")
+    parser.add_argument("--connect", metavar="SOCKET", help="connect stdin and stdout to a running server")
+
+    args = parser.parse_args()
+
+    if args.connect:
+        connect(args.connect)
+    else:
+        serve(args.socket, args.workers, args.memory_limit)
+
+
+if __name__ == "__main__":
+    main()
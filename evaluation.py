@@ -1,5 +1,6 @@
 
 
+from bitboard import ADJACENT_FILE_MASKS, FILE_MASKS, FORWARD_FILE_MASKS, PASSED_PAWN_MASKS, get_lsb_index
 from move import *
 from utilities import *         # contains Evaluation arrays
 
@@ -24,23 +25,25 @@ def evaluate_pawn(position, pos, pawn_rank):
     mid_score = 0
     end_score = 0
 
+    white_pawns = position.bitboards[WHITE_PAWN]
+    black_pawns = position.bitboards[BLACK_PAWN]
+
     piece_color = 0 if position.board[pos] == WHITE_PAWN else 1
     if piece_color == 0:
 
         mid_score += PAWN_PST_MID[i]
         end_score += PAWN_PST_END[i]
 
-        # Doubled pawns. The pawn we are checking is higher in row compared to
-        # the least advanced pawn in our column.
-        if row > pawn_rank[0][col]:
+        # Doubled pawns. One of our pawns is behind the pawn we are checking, in our column.
+        if white_pawns & FORWARD_FILE_MASKS[1][i]:
             mid_score -= DOUBLED_PAWN_PENALTY_MID
             end_score -= DOUBLED_PAWN_PENALTY_END
 
         # Isolated pawns. We do not have pawns on the columns next to our pawn.
-        if pawn_rank[0][col - 1] == 9 and pawn_rank[0][col + 1] == 9:
+        if not white_pawns & ADJACENT_FILE_MASKS[col - 1]:
 
             # If our opponent does not have a pawn in front of our pawn
-            if pawn_rank[1][col] == 0:
+            if not black_pawns & FILE_MASKS[col - 1]:
                 # The isolated pawn in the middle game is worse if the opponent
                 # has the semi open file to attack it.
                 mid_score -= 1.5 * ISOLATED_PAWN_PENALTY_MID
@@ -63,13 +66,12 @@ def evaluate_pawn(position, pos, pawn_rank):
 
             # If there's no enemy pawn in front of our pawn then it's even worse, since
             # we allow outposts and pieces to attack us easily
-            if pawn_rank[1][col] == 0:
+            if not black_pawns & FILE_MASKS[col - 1]:
                 # In the endgame with no pieces it wouldn't be a big deal, in some situations it could be better.
                 mid_score -= 3 * BACKWARDS_PAWN_PENALTY_MID
 
-        if row >= pawn_rank[1][col - 1]    \
-             and row >= pawn_rank[1][col]  \
-             and row >= pawn_rank[1][col + 1]:
+        # Passed pawns. No enemy pawn is in front of our pawn, in our column or the ones next to it.
+        if not black_pawns & PASSED_PAWN_MASKS[0][i]:
 
             mid_score += row * PASSED_PAWN_BONUS_MID
             end_score += row * PASSED_PAWN_BONUS_END
@@ -79,13 +81,13 @@ def evaluate_pawn(position, pos, pawn_rank):
         mid_score += PAWN_PST_MID[i ^ 56]
         end_score += PAWN_PST_END[i ^ 56]
 
-        if row < pawn_rank[1][col]:
+        if black_pawns & FORWARD_FILE_MASKS[0][i]:
             mid_score -= DOUBLED_PAWN_PENALTY_MID
             end_score -= DOUBLED_PAWN_PENALTY_END
 
-        if pawn_rank[1][col - 1] == 0 and pawn_rank[1][col + 1] == 0:
+        if not black_pawns & ADJACENT_FILE_MASKS[col - 1]:
 
-            if pawn_rank[0][col] == 9:
+            if not white_pawns & FILE_MASKS[col - 1]:
                 # The isolated pawn in the middle game is worse if the opponent
                 # has the semi open file to attack it.
                 mid_score -= 1.5 * ISOLATED_PAWN_PENALTY_MID
@@ -112,9 +114,7 @@ def evaluate_pawn(position, pos, pawn_rank):
                 # In the middle game it is worse since enemy pieces can use the semi-open file and outpost.
                 mid_score -= 3 * BACKWARDS_PAWN_PENALTY_MID
 
-        if row <= pawn_rank[0][col - 1]   \
-             and row <= pawn_rank[0][col] \
-             and row <= pawn_rank[0][col + 1]:
+        if not white_pawns & PASSED_PAWN_MASKS[1][i]:
 
             mid_score += (9 - row) * PASSED_PAWN_BONUS_MID
             end_score += (9 - row) * PASSED_PAWN_BONUS_END
@@ -217,10 +217,10 @@ def evaluate_bishop(position, pos):
 
 
 @nb.njit(cache=True)
-def evaluate_rook(position, pos, pawn_rank):
+def evaluate_rook(position, pos):
     piece = position.board[pos]
     i = MAILBOX_TO_STANDARD[pos]
-    col = i % 8 + 1
+    file_mask = FILE_MASKS[i % 8]
 
     piece_color = 0 if piece == WHITE_ROOK else 1
 
@@ -231,8 +231,8 @@ def evaluate_rook(position, pos, pawn_rank):
         mid_score += ROOK_PST_MID[i]
         end_score += ROOK_PST_END[i]
 
-        if pawn_rank[0][col] == 9:  # No pawn on this column
-            if pawn_rank[1][col] == 0:  # No enemy pawn on column
+        if not position.bitboards[WHITE_PAWN] & file_mask:  # No pawn on this column
+            if not position.bitboards[BLACK_PAWN] & file_mask:  # No enemy pawn on column
                 mid_score += ROOK_OPEN_FILE_BONUS_MID
                 end_score += ROOK_OPEN_FILE_BONUS_END
             else:
@@ -243,8 +243,8 @@ def evaluate_rook(position, pos, pawn_rank):
         mid_score += ROOK_PST_MID[i ^ 56]
         end_score += ROOK_PST_END[i ^ 56]
 
-        if pawn_rank[1][col] == 0:  # No pawn on this column
-            if pawn_rank[0][col] == 9:  # No enemy pawn on column
+        if not position.bitboards[BLACK_PAWN] & file_mask:  # No pawn on this column
+            if not position.bitboards[WHITE_PAWN] & file_mask:  # No enemy pawn on column
                 mid_score += ROOK_OPEN_FILE_BONUS_MID
                 end_score += ROOK_OPEN_FILE_BONUS_END
             else:
@@ -258,10 +258,10 @@ def evaluate_rook(position, pos, pawn_rank):
 
 
 @nb.njit(cache=True)
-def evaluate_queen(position, pos, pawn_rank):
+def evaluate_queen(position, pos):
     piece = position.board[pos]
     i = MAILBOX_TO_STANDARD[pos]
-    col = i % 8 + 1
+    file_mask = FILE_MASKS[i % 8]
 
     piece_color = 0 if piece == WHITE_QUEEN else 1
 
@@ -272,8 +272,8 @@ def evaluate_queen(position, pos, pawn_rank):
         mid_score += QUEEN_PST_MID[i]
         end_score += QUEEN_PST_END[i]
 
-        if pawn_rank[0][col] == 9:  # No pawn on this column
-            if pawn_rank[1][col] == 0:  # No enemy pawn on column
+        if not position.bitboards[WHITE_PAWN] & file_mask:  # No pawn on this column
+            if not position.bitboards[BLACK_PAWN] & file_mask:  # No enemy pawn on column
                 mid_score += QUEEN_OPEN_FILE_BONUS_MID
                 end_score += QUEEN_OPEN_FILE_BONUS_END
             else:
@@ -284,8 +284,8 @@ def evaluate_queen(position, pos, pawn_rank):
         mid_score += QUEEN_PST_MID[i ^ 56]
         end_score += QUEEN_PST_END[i ^ 56]
 
-        if pawn_rank[1][col] == 0:  # No pawn on this column
-            if pawn_rank[0][col] == 9:  # No enemy pawn on column
+        if not position.bitboards[BLACK_PAWN] & file_mask:  # No pawn on this column
+            if not position.bitboards[WHITE_PAWN] & file_mask:  # No enemy pawn on column
                 mid_score += QUEEN_OPEN_FILE_BONUS_MID
                 end_score += QUEEN_OPEN_FILE_BONUS_END
             else:
@@ -325,10 +325,10 @@ def evaluate_king(position, pos, pawn_rank):
             mid_score += evaluate_king_pawn(0, 6, pawn_rank) * 0.3  # F file pawn
 
         else:
-            for pawn_file in range(col - 1, col + 2):
-                if pawn_rank[0][pawn_file] == 9:
+            for pawn_file in range(col - 2, col + 1):
+                if not position.bitboards[WHITE_PAWN] & FILE_MASKS[pawn_file]:
                     mid_score -= 7
-                    if pawn_rank[1][pawn_file] == 0:
+                    if not position.bitboards[BLACK_PAWN] & FILE_MASKS[pawn_file]:
                         mid_score -= 15
 
     else:
@@ -347,10 +347,10 @@ def evaluate_king(position, pos, pawn_rank):
             mid_score += evaluate_king_pawn(1, 6, pawn_rank) * 0.3  # F file pawn
 
         else:
-            for pawn_file in range(col - 1, col + 2):
-                if pawn_rank[1][pawn_file] == 0:
+            for pawn_file in range(col - 2, col + 1):
+                if not position.bitboards[BLACK_PAWN] & FILE_MASKS[pawn_file]:
                     mid_score -= 7
-                    if pawn_rank[0][pawn_file] == 9:
+                    if not position.bitboards[WHITE_PAWN] & FILE_MASKS[pawn_file]:
                         mid_score -= 15
 
     return mid_score, end_score
@@ -413,8 +413,8 @@ def evaluate(position):
     black_end_scores = 0
 
     # We make a 10 size array for each side, and eight of them are used for storing
-    # the least advanced pawn. Storing this allows us to check for passed pawns,
-    # backwards pawns, isolated pawns and whatnot.
+    # the least advanced pawn. Storing this gives the distances of backwards pawns and the king's pawn-shield,
+    # the other pawn structure tests use the bitboards.
     # Having a ten element array gives padding on the side to prevent out of bounds exceptions.
     pawn_rank = np.zeros((2, 10), dtype=np.uint8)
 
@@ -429,27 +429,29 @@ def evaluate(position):
         pawn_rank[0][i] = 9
         pawn_rank[1][i] = 0
 
-    for pos in position.white_pieces:
-        piece = board[pos]
-        i = MAILBOX_TO_STANDARD[pos]
+    pawns = position.bitboards[WHITE_PAWN]
+    while pawns:
+        i = get_lsb_index(pawns)
         row = 8 - i // 8
         col = i % 8 + 1
 
-        if piece == WHITE_PAWN:
-            if row < pawn_rank[0][col]:
-                pawn_rank[0][col] = row
+        if row < pawn_rank[0][col]:
+            pawn_rank[0][col] = row
 
-    for pos in position.black_pieces:
-        piece = board[pos]
-        i = MAILBOX_TO_STANDARD[pos]
+        pawns &= pawns - nb.uint64(1)
+
+    pawns = position.bitboards[BLACK_PAWN]
+    while pawns:
+        i = get_lsb_index(pawns)
         row = 8 - i // 8
         col = i % 8 + 1
 
-        if piece == BLACK_PAWN:
-            if row > pawn_rank[1][col]:
-                pawn_rank[1][col] = row
+        if row > pawn_rank[1][col]:
+            pawn_rank[1][col] = row
+
+        pawns &= pawns - nb.uint64(1)
 
-    for pos in position.white_pieces:
+    for pos in position.piece_list[0][:position.piece_count[0]]:
 
         piece = board[pos]
 
@@ -470,10 +472,10 @@ def evaluate(position):
             scores = evaluate_bishop(position, pos)
 
         elif piece == WHITE_ROOK:
-            scores = evaluate_rook(position, pos, pawn_rank)
+            scores = evaluate_rook(position, pos)
 
         elif piece == WHITE_QUEEN:
-            scores = evaluate_queen(position, pos, pawn_rank)
+            scores = evaluate_queen(position, pos)
 
         else:
             scores = evaluate_king(position, pos, pawn_rank)
@@ -481,7 +483,7 @@ def evaluate(position):
         white_mid_scores += scores[0]
         white_end_scores += scores[1]
 
-    for pos in position.black_pieces:
+    for pos in position.piece_list[1][:position.piece_count[1]]:
 
         piece = board[pos]
 
@@ -502,10 +504,10 @@ def evaluate(position):
             scores = evaluate_bishop(position, pos)
 
         elif piece == BLACK_ROOK:
-            scores = evaluate_rook(position, pos, pawn_rank)
+            scores = evaluate_rook(position, pos)
 
         elif piece == BLACK_QUEEN:
-            scores = evaluate_queen(position, pos, pawn_rank)
+            scores = evaluate_queen(position, pos)
 
         else:
             scores = evaluate_king(position, pos, pawn_rank)
@@ -567,6 +569,46 @@ def evaluate(position):
     return SCORE_TYPE((position.side * -2 + 1) * (white_score - black_score) + TEMPO_BONUS)
 
 
+PST_MID = np.array((PAWN_PST_MID, KNIGHT_PST_MID, BISHOP_PST_MID, ROOK_PST_MID, QUEEN_PST_MID, KING_PST_MID))
+PST_END = np.array((PAWN_PST_END, KNIGHT_PST_END, BISHOP_PST_END, ROOK_PST_END, QUEEN_PST_END, KING_PST_END))
+
+
+# A cheap tapered evaluation of material and piece square tables only.
+# It compiles much faster than evaluate(), so it is used by the fallback search while the engine compiles.
+@nb.njit(cache=True)
+def evaluate_pst(position):
+
+    mid_scores = 0
+    end_scores = 0
+
+    game_phase = 0
+    board = position.board
+
+    for pos in position.piece_list[0][:position.piece_count[0]]:
+        piece = board[pos]
+        i = MAILBOX_TO_STANDARD[pos]
+
+        game_phase += GAME_PHASE_SCORES[piece]
+
+        mid_scores += PIECE_VALUES_MID[piece] + PST_MID[piece][i]
+        end_scores += PIECE_VALUES_END[piece] + PST_END[piece][i]
+
+    for pos in position.piece_list[1][:position.piece_count[1]]:
+        piece = board[pos] - BLACK_PAWN
+        i = MAILBOX_TO_STANDARD[pos] ^ 56
+
+        game_phase += GAME_PHASE_SCORES[piece]
+
+        mid_scores -= PIECE_VALUES_MID[piece] + PST_MID[piece][i]
+        end_scores -= PIECE_VALUES_END[piece] + PST_END[piece][i]
+
+    game_phase = min(game_phase, 24)  # in case of promotions
+
+    score = (mid_scores * game_phase + (24 - game_phase) * end_scores) / 24
+
+    return SCORE_TYPE((position.side * -2 + 1) * score + TEMPO_BONUS)
+
+
 # @nb.njit(SCORE_TYPE(Search.class_type.instance_type, MOVE_TYPE, MOVE_TYPE), cache=True)
 @nb.njit(cache=True)
 def score_move(engine, move, tt_move):
@@ -0,0 +1,92 @@
+"""
+Persistent transposition table.
+
+With the uci option 'Hash File' set, the transposition table is a memory mapping of that file instead of
+an anonymous allocation, so it survives restarts of the engine. The OS only pages in the buckets that are probed,
+so a resumed analysis starts with the table it left off with.
+
+The file starts with a header of one bucket in size, so the buckets stay aligned to cache lines:
+    magic, format version, entry size, entries per bucket, zobrist seed, bucket count
+A file whose header doesn't match the engine or the Hash size is recreated empty.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from search import set_hash_size
+from search_class import SearchStruct_set_transposition_table, get_tt_bucket_count
+from utilities import HASH_BUCKET_TYPE, HASH_ENTRY_TYPE, TT_BUCKET_BYTES, TT_BUCKET_SIZE, ZOBRIST_SEED
+
+
+HASH_FILE_MAGIC = b"ANTARES\0"
+HASH_FILE_VERSION = 2             # increase when the entry layout or its meaning changes
+HEADER_FORMAT = "<8sIIIQQ"
+HEADER_SIZE = TT_BUCKET_BYTES
+
+# The mapping backing the current table, if any
+mapped_file = None
+
+
+def get_header(bucket_count):
+    header = struct.pack(HEADER_FORMAT, HASH_FILE_MAGIC, HASH_FILE_VERSION, HASH_ENTRY_TYPE.itemsize,
+                         TT_BUCKET_SIZE, ZOBRIST_SEED, bucket_count)
+
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def is_hash_file_valid(path, header, file_size):
+    try:
+        with open(path, "rb") as f:
+            return f.read(HEADER_SIZE) == header and os.path.getsize(path) == file_size
+    except OSError:
+        return False
+
+
+def map_hash_file(engine, path, megabytes):
+    """
+    Backs the table of the engine with the file, returns True if the saved table was loaded
+    and False if the file was (re)created empty.
+    """
+    global mapped_file
+
+    bucket_count = get_tt_bucket_count(megabytes)
+    header = get_header(bucket_count)
+    file_size = HEADER_SIZE + bucket_count * TT_BUCKET_BYTES
+
+    loaded = is_hash_file_valid(path, header, file_size)
+
+    # The current table is released first, so the memory used never holds both tables
+    unmap_hash_file(engine, 1)
+
+    with open(path, "r+b" if loaded else "w+b") as f:
+        if not loaded:
+            # The file is sparse, and zero keys are empty entries
+            f.truncate(file_size)
+            f.write(header)
+            f.flush()
+
+        mapped_file = mmap.mmap(f.fileno(), file_size)
+
+    table = np.frombuffer(mapped_file, dtype=HASH_BUCKET_TYPE, offset=HEADER_SIZE, count=bucket_count)
+    SearchStruct_set_transposition_table(engine, table)
+
+    return loaded
+
+
+def save_hash_file():
+    if mapped_file is not None:
+        mapped_file.flush()
+
+
+def unmap_hash_file(engine, megabytes):
+    """Saves the mapped table, if any, and replaces it with an in memory table of the given size."""
+    global mapped_file
+
+    save_hash_file()
+
+    # The mapping is closed by the garbage collector once the table no longer references it
+    mapped_file = None
+    set_hash_size(engine, megabytes)
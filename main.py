@@ -2,72 +2,94 @@
 """
 UCI Handler
 """
-import math
 import sys
 import threading
 import time
 
-from cache_clearer import kill_numba_cache
-from move import get_move_from_uci, get_is_capture
-from position import make_move, parse_fen, is_attacked, make_readable_board
+from engine_build import is_build_fresh, load_engine, jit_engine
+from hash_file import map_hash_file, save_hash_file, unmap_hash_file
+from move import get_move_from_uci, get_uci_from_move
+from position import make_move, parse_fen, make_readable_board
 from position_class import init_position, PositionStruct_set_side
-from search import iterative_search, compile_engine, new_game
+from search import new_game, fallback_search, set_default_limits
 from search_class import init_search, SearchStruct_set_max_time, SearchStruct_set_max_depth,\
-    SearchStruct_set_repetition_index, SearchStruct_set_stopped
-from utilities import NO_MOVE
-
-
-def time_handler(engine, position, last_move, self_time, inc, movetime, movestogo):
-    rate = 20
-    if is_attacked(position, position.king_positions[position.side]):
-        rate -= 3
-    if get_is_capture(last_move):
-        rate -= 1.5
-
-    if movetime > 0:
-        time_amt = movetime * 0.9
-    elif inc > 0:
-        if self_time < inc:  # we always want to have more time than our increment
-            time_amt = self_time / (rate / 10)  # This ensures we use a lot of our remaining time, but
-                                                # since our increment is larger, it doesn't matter.
-        else:
-            # If our remaining time is less than the boundary, we should use less time than our increment
-            # to get back above the boundary.
-            bound = inc * math.sqrt(90000/inc)
-            time_amt = max(inc * 0.975 + (self_time - bound) / (rate * 2), self_time / (rate*10))
-    elif movestogo > 0:
-        time_amt = (self_time * 0.8 / movestogo) * (20 / rate)
-        if time_amt > self_time * 0.8:
-            time_amt = self_time * 0.85
-    elif self_time > 0:
-        time_amt = self_time / (rate + 5)
-    else:
-        time_amt = engine.max_time
+    SearchStruct_set_repetition_index, SearchStruct_set_stopped, SearchStruct_set_max_nodes, SearchStruct_set_max_mate, \
+    SearchStruct_set_multi_pv, SearchStruct_set_search_move_count, SearchStruct_set_soft_time
+from smp import search, start_helpers, stop_helpers
+from time_manager import allocate_time, record_move_time, reset_clock, DEFAULT_MOVE_OVERHEAD, MAX_MOVE_OVERHEAD
+from utilities import NO_MOVE, DEFAULT_HASH_SIZE, MAX_HASH_SIZE, MAX_THREADS, MAX_SEARCH_DEPTH, MAX_MOVES
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
-    SearchStruct_set_max_time(engine, int(time_amt))
+# ms, the time limit of searches that only end on 'stop' or 'ponderhit'
+INFINITE_TIME = 10 ** 12
 
+# The parameters of 'go', the list of moves after searchmoves ends at the next one
+GO_PARAMETERS = ("searchmoves", "ponder", "wtime", "btime", "winc", "binc", "movestogo",
+                 "depth", "nodes", "mate", "movetime", "infinite")
 
-def parse_go(engine, position, msg, last_move):
-    """parse 'go' uci command"""
+# The uci options, name: (type, default, min, max)
+UCI_OPTIONS = {
+    "Hash": ("spin", DEFAULT_HASH_SIZE, 1, MAX_HASH_SIZE),
+    "Hash File": ("string", "", None, None),
+    "Threads": ("spin", 1, 1, MAX_THREADS),
+    "Ponder": ("check", False, None, None),
+    "MultiPV": ("spin", 1, 1, MAX_MOVES),
+    "Move Overhead": ("spin", DEFAULT_MOVE_OVERHEAD, 0, MAX_MOVE_OVERHEAD),
+}
+
+
+def parse_go(engine, position, msg, last_move, move_overhead):
+    """
+    parse 'go' uci command
+    Returns the soft and hard limits planned for the move with 'go ponder', which only start counting at 'ponderhit',
+    otherwise None.
+    """
 
-    d = engine.max_depth
+    d = MAX_SEARCH_DEPTH
+    nodes = 0
+    mate = 0
 
     _, *params = msg.split()
 
+    search_moves = []
+    if "searchmoves" in params:
+        start_idx = params.index("searchmoves") + 1
+        end_idx = start_idx
+        while end_idx < len(params) and params[end_idx] not in GO_PARAMETERS:
+            end_idx += 1
+
+        search_moves = [get_move_from_uci(position, move) for move in params[start_idx:end_idx]]
+        params = params[:start_idx - 1] + params[end_idx:]
+
     wtime = 0
     btime = 0
     winc = 0
     binc = 0
     movetime = 0
     movestogo = 0
+    ponder = False
+    infinite = False
+
+    params = iter(params)
+    for p in params:
+        if p == "ponder":
+            ponder = True
+            continue
+        if p == "infinite":
+            infinite = True
+            continue
 
-    for p, v in zip(*2 * (iter(params),)):
+        v = next(params, "0")
         # print(p, v)
         if p == "depth":
-            d = int(v)
+            # The per ply tables of the search hold MAX_SEARCH_DEPTH plies
+            d = min(int(v), MAX_SEARCH_DEPTH)
         elif p == "nodes":
-            # n = int(v)
-            pass
+            nodes = int(v)
+        elif p == "mate":
+            mate = int(v)
         elif p == "movetime":
             movetime = int(v)
         elif p == "wtime":
@@ -88,28 +110,298 @@ def parse_go(engine, position, msg, last_move):
         self_time = btime
         inc = binc
 
-    time_handler(engine, position, last_move, self_time, inc, movetime, movestogo)
+    time_limits = allocate_time(position, last_move, self_time, inc, movetime, movestogo, move_overhead)
+
+    # Without a clock the search only ends on its depth, nodes or mate limit, or on 'stop'.
+    # A movetime search has no soft limit, it always takes the given time.
+    if infinite or time_limits is None:
+        SearchStruct_set_soft_time(engine, 0)
+        SearchStruct_set_max_time(engine, INFINITE_TIME)
+    else:
+        soft_time, hard_time = time_limits
+        SearchStruct_set_soft_time(engine, soft_time if not movetime else 0)
+        SearchStruct_set_max_time(engine, hard_time)
+
     SearchStruct_set_max_depth(engine, int(d))
+    SearchStruct_set_max_nodes(engine, nodes)
+    SearchStruct_set_max_mate(engine, mate)
+
+    # Search moves that aren't legal are left out by the root move list
+    engine.search_moves[:len(search_moves)] = search_moves
+    SearchStruct_set_search_move_count(engine, len(search_moves))
+
+    if ponder:
+        ponder_limits = (engine.soft_time, engine.max_time)
+        SearchStruct_set_soft_time(engine, 0)
+        SearchStruct_set_max_time(engine, INFINITE_TIME)
+        return ponder_limits
+
+    return None
+
+
+def parse_position(engine, position, tokens, last_move):
+    """parse 'position' uci command, returns the last move played"""
+
+    if len(tokens) < 2:
+        return last_move
+
+    if tokens[1] == "startpos":
+        parse_fen(position, START_FEN)
+        next_idx = 2
+
+    elif tokens[1] == "fen":
+        fen = " ".join(tokens[2:8])
+        parse_fen(position, fen)
+        next_idx = 8
+
+    else:
+        return last_move
+
+    if len(tokens) <= next_idx or tokens[next_idx] != "moves":
+        return last_move
+
+    SearchStruct_set_repetition_index(engine, 0)
+    for move in tokens[(next_idx + 1):]:
+        formatted_move = get_move_from_uci(position, move)
+        last_move = formatted_move
+        make_move(position, formatted_move)
+
+        SearchStruct_set_repetition_index(engine, engine.repetition_index + 1)
+        engine.repetition_table[engine.repetition_index] = position.hash_key
+
+        PositionStruct_set_side(position, position.side ^ 1)
+
+    return last_move
+
+
+def get_default_options():
+    return {name: default for name, (_, default, _, _) in UCI_OPTIONS.items()}
+
+
+def print_options():
+    for name, (option_type, default, minimum, maximum) in UCI_OPTIONS.items():
+        if option_type == "spin":
+            print(f"option name {name} type spin default {default} min {minimum} max {maximum}")
+        elif option_type == "check":
+            print(f"option name {name} type check default {str(default).lower()}")
+        else:
+            print(f"option name {name} type {option_type} default {default or '<empty>'}")
+
+
+def apply_hash_options(engine, options):
+    # The helpers are restarted on the new table
+    stop_helpers(engine)
+
+    if options["Hash File"]:
+        loaded = map_hash_file(engine, options["Hash File"], options["Hash"])
+        print("info string", "loaded" if loaded else "created", "hash file", options["Hash File"])
+    elif options["Threads"] > 1:
+        # The table is allocated in shared memory by start_helpers
+        unmap_hash_file(engine, 1)
+    else:
+        unmap_hash_file(engine, options["Hash"])
+
+    if options["Threads"] > 1:
+        start_helpers(engine, options["Threads"], options["Hash File"], options["Hash"])
+
+
+def parse_setoption(engine, options, tokens):
+    """parse 'setoption name <id> [value <x>]' uci command, the name may contain spaces"""
+
+    if "name" not in tokens:
+        return
+
+    name_idx = tokens.index("name") + 1
+    value_idx = tokens.index("value") if "value" in tokens else len(tokens)
+
+    name = " ".join(tokens[name_idx:value_idx])
+    value = " ".join(tokens[value_idx + 1:])
+
+    # Option names are case insensitive
+    name = next((option for option in UCI_OPTIONS if option.lower() == name.lower()), None)
+    if name is None:
+        return
+
+    option_type, _, minimum, maximum = UCI_OPTIONS[name]
+
+    if option_type == "spin":
+        # Like an unknown option, a value that isn't a number is ignored
+        try:
+            options[name] = max(minimum, min(maximum, int(value)))
+        except ValueError:
+            return
+    elif option_type == "check":
+        options[name] = value.lower() == "true"
+    elif option_type == "string":
+        options[name] = "" if value == "<empty>" else value
+
+    if name in ("Hash", "Hash File", "Threads"):
+        apply_hash_options(engine, options)
+    elif name == "MultiPV":
+        SearchStruct_set_multi_pv(engine, options[name])
+
+
+def fallback_go(position):
+    """answer 'go' with the fallback search while the full search is compiling"""
+
+    best_move, best_score = fallback_search(position)
+
+    print("info depth 1 score cp", best_score, "string fallback search, engine still compiling")
+    print("bestmove", get_uci_from_move(best_move) if best_move != NO_MOVE else "0000")
+
+
+def compile_uci(engine, position):
+    """
+    Compiles what the uci loop and the fallback search need by running them on a scratch engine and position.
+    This takes a few seconds compared to the full search, which is compiled afterwards.
+    """
+
+    last_move = parse_position(engine, position, "position startpos moves e2e4".split(), NO_MOVE)
+    parse_go(engine, position, "go wtime 1000 btime 1000", last_move, 0)
+
+    best_move, _ = fallback_search(position)
+    get_uci_from_move(best_move)
+
+    parse_setoption(engine, get_default_options(), "setoption name Hash value 1".split())
+    new_game(engine, True)
+    SearchStruct_set_stopped(engine, False)
+
+
+def print_bestmove(best_pv):
+    # No move at all in a mate or stalemate position
+    if not best_pv:
+        print("bestmove 0000")
+    elif len(best_pv) > 1:
+        print("bestmove", best_pv[0], "ponder", best_pv[1])
+    else:
+        print("bestmove", best_pv[0])
+
+
+def run_search(engine, position, position_tokens, bestmove_ready):
+    # Only the time of moves searched on the clock from 'go' on is measured
+    timed = bestmove_ready.is_set()
+
+    best_pv, _ = search(engine, position, position_tokens, False)
+
+    # A ponder or infinite search that reached its depth holds the bestmove back until 'ponderhit' or 'stop'
+    bestmove_ready.wait()
+    print_bestmove(best_pv)
+
+    if timed:
+        record_move_time(int(1000 * (time.time() - engine.start_time)))
+
+
+def start_search(engine, position, position_tokens, bestmove_ready):
+    """
+    Starts the search on its own thread, so the uci loop keeps reading commands. Returns the thread.
+    bestmove_ready is set unless the search is pondering or infinite.
+    """
+
+    engine.stop_flag[0] = 0
+
+    search_thread = threading.Thread(target=run_search, args=(engine, position, position_tokens, bestmove_ready))
+    search_thread.start()
+
+    return search_thread
+
+
+def ponder_hit(engine, bestmove_ready, ponder_limits):
+    """The ponder search goes on as a timed search, given the limits planned for the move from now on."""
+
+    if ponder_limits is not None and not bestmove_ready.is_set():
+        soft_time, hard_time = ponder_limits
+        elapsed_time = int(1000 * (time.time() - engine.start_time))
+
+        SearchStruct_set_soft_time(engine, elapsed_time + soft_time if soft_time else 0)
+        SearchStruct_set_max_time(engine, elapsed_time + hard_time)
+        bestmove_ready.set()
+
+
+def stop_search(engine, search_thread, bestmove_ready):
+    """Stops the search, if one is running, and waits for it to print its bestmove."""
+
+    if search_thread is not None:
+        # Polled by the search every 1024 nodes
+        engine.stop_flag[0] = 1
+        bestmove_ready.set()
+        search_thread.join()
+
+
+def compile_lazily(uci_ready, search_ready):
+    """
+    Compiles the engine in stages on its own engine and position, so the uci loop can run meanwhile.
+    uci_ready is set once 'position' and the fallback search can be used, search_ready once the full search can.
+    """
+
+    engine = init_search()
+    position = init_position()
+
+    compile_uci(engine, position)
+    uci_ready.set()
+
+    jit_engine(engine, position)
+    search_ready.set()
 
 
 def main():
     """
-    The main input/output loop.
-    This implements a slice of the UCI protocol.
+    Sets up the engine and runs the uci loop.
+
+    With --lazy, readyok is answered at once and the engine compiles in the background.
+    A 'go' received before the search is compiled is answered by the fallback search.
     """
 
-    start_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    lazy = "--lazy" in sys.argv[1:]
+
+    # The search thread prints info and bestmove on its own, which a gui reading a pipe
+    # would only receive once the buffer is flushed
+    sys.stdout.reconfigure(line_buffering=True)
 
     # f = open('/Users/alexandertian/Documents/PycharmProjects/AntaresChess/AntaresV3/debug_file.txt', 'w')
 
     main_position = init_position()
     main_engine = init_search()
 
-    start_time = time.time()
+    uci_ready = threading.Event()
+    search_ready = threading.Event()
+
+    # A fresh build (python engine_build.py) is loaded from the cache,
+    # otherwise we fall back to JIT compiling the engine. Lazy mode compiles in stages on its own structs.
+    if lazy:
+        set_default_limits(main_engine)
+        compile_thread = threading.Thread(target=compile_lazily, args=(uci_ready, search_ready), daemon=True)
+    elif is_build_fresh():
+        compile_thread = threading.Thread(target=load_engine, args=(main_engine, main_position))
+    else:
+        compile_thread = threading.Thread(target=jit_engine, args=(main_engine, main_position))
 
-    compile_thread = threading.Thread(target=compile_engine, args=(main_engine, main_position))
     compile_thread.start()
+
+    uci_loop(main_engine, main_position, compile_thread, lazy, uci_ready, search_ready)
+
+    sys.exit()
+
+
+def uci_loop(main_engine, main_position, compile_thread=None, lazy=False, uci_ready=None, search_ready=None):
+    """
+    The main input/output loop.
+    This implements a slice of the UCI protocol.
+
+    The engine is compiled by compile_thread, joined before it is used, or already compiled without one.
+
+    The search runs on its own thread, so 'stop', 'isready' and 'quit' are answered while it runs.
+    The commands changing the position or the engine stop the search first.
+    """
+
+    options = get_default_options()
+
+    start_time = time.time()
+
     last_move = NO_MOVE
+    position_tokens = ["position", "startpos"]
+    search_thread = None
+    bestmove_ready = threading.Event()
+    ponder_limits = None
 
     while True:
         msg = input().strip()
@@ -120,77 +412,84 @@ def main():
         tokens = msg.split()
 
         if msg == "quit":
-            SearchStruct_set_stopped(main_engine, True)
+            stop_search(main_engine, search_thread, bestmove_ready)
+            stop_helpers(main_engine)
+            save_hash_file()
             break
 
         if msg == "stop":
-            SearchStruct_set_stopped(main_engine, True)
+            # After 'go ponder' this is a ponder miss, the search is dropped and its bestmove ignored by the gui
+            stop_search(main_engine, search_thread, bestmove_ready)
+            search_thread = None
+            continue
+
+        elif msg == "ponderhit":
+            if search_thread is not None:
+                ponder_hit(main_engine, bestmove_ready, ponder_limits)
+            continue
 
         elif msg == "uci" or msg.startswith("uciok"):
             print("id name AntaresPy0.47")
             print("id author Alexander_Tian")
+            print_options()
             print("uciok")
             continue
 
         elif msg == "isready":
-            compile_thread.join()
+            if not lazy and compile_thread is not None:
+                compile_thread.join()
             print(time.time() - start_time, file=sys.stderr)
             print("readyok")
             continue
 
-        elif msg == "ucinewgame":
-            parse_fen(main_position, start_fen)
-            new_game(main_engine)
+        # In lazy mode the commands below wait for the uci functions to compile, which takes a few seconds
+        if lazy and (msg == "ucinewgame" or msg.startswith("position") or msg.startswith("go")
+                     or msg.startswith("setoption")):
+            uci_ready.wait()
+
+        # A ponder or infinite search waits for 'stop' or 'ponderhit' before its bestmove, so it is stopped here
+        # rather than joined, for the guis sending a new command without a 'stop' first
+        if search_thread is not None and (msg == "ucinewgame" or msg.startswith("position") or msg.startswith("go")
+                                          or msg.startswith("setoption")):
+            stop_search(main_engine, search_thread, bestmove_ready)
+            search_thread = None
+
+        if msg.startswith("setoption"):
+            # The table can't be replaced while the warm-up search is using it
+            if not lazy and compile_thread is not None:
+                compile_thread.join()
+            parse_setoption(main_engine, options, tokens)
+
+        if msg == "ucinewgame":
+            parse_fen(main_position, START_FEN)
+            # A hash file is kept across games, since it is meant to carry over
+            new_game(main_engine, not options["Hash File"])
+            reset_clock()
             last_move = NO_MOVE
+            position_tokens = ["position", "startpos"]
 
         elif msg.startswith("position"):
-            if len(tokens) < 2:
-                continue
-
-            if tokens[1] == "startpos":
-                parse_fen(main_position, start_fen)
-                next_idx = 2
-
-            elif tokens[1] == "fen":
-                fen = " ".join(tokens[2:8])
-                parse_fen(main_position, fen)
-                next_idx = 8
-
-            else:
-                continue
+            last_move = parse_position(main_engine, main_position, tokens, last_move)
+            # The helper searches are given the position the same way
+            position_tokens = tokens
 
-            if len(tokens) <= next_idx or tokens[next_idx] != "moves":
+        if msg.startswith("go"):
+            if lazy and not search_ready.is_set():
+                fallback_go(main_position)
                 continue
 
-            SearchStruct_set_repetition_index(main_engine, 0)
-            for move in tokens[(next_idx + 1):]:
-                formatted_move = get_move_from_uci(main_position, move)
-                last_move = formatted_move
-                make_move(main_position, formatted_move)
-
-                SearchStruct_set_repetition_index(main_engine, main_engine.repetition_index + 1)
-                main_engine.repetition_table[main_engine.repetition_index] = main_position.hash_key
-
-                PositionStruct_set_side(main_position, main_position.side ^ 1)
-
-        if msg.startswith("go"):
-            parse_go(main_engine, main_position, msg, last_move)
+            ponder_limits = parse_go(main_engine, main_position, msg, last_move, options["Move Overhead"])
 
-            # search_thread = threading.Thread(target=iterative_search, args=(main_engine, main_position, False))
-            # search_thread.start()
+            bestmove_ready = threading.Event()
+            if ponder_limits is None and "infinite" not in tokens:
+                bestmove_ready.set()
 
-            iterative_search(main_engine, main_position, False)
+            search_thread = start_search(main_engine, main_position, position_tokens, bestmove_ready)
 
             continue
 
     # f.close()
-    sys.exit()
-
-
-def clear_cache():
-    kill_numba_cache()
 
 
 if __name__ == "__main__":
     main()
-    # clear_cache()
@@ -56,7 +56,8 @@ def get_is_capture(move):
     return (move & 0x20000000) >> 29
 
 
-@nb.njit(cache=True)
+# The uci conversions are only used by the uci loop, and are kept in python
+# since Numba's string functions take many seconds to compile.
 def get_uci_from_move(move):
 
     uci_move = ""
@@ -89,7 +90,6 @@ def get_uci_from_move(move):
     return uci_move
 
 
-@nb.njit(cache=True)
 def get_move_from_uci(position, uci):
     promotion_piece = 0
     if len(uci) == 5:
@@ -1,222 +1,353 @@
 
 
+from bitboard import BETWEEN, KING_ATTACKS, LINES, PAWN_ATTACKS, get_lsb_index, get_piece_attacks
 from evaluation import score_move, score_capture
 from move import *
+from position import get_attackers, get_pinned, is_square_attacked, toggle_move
 # from position_class import Position
 # from search_class import Search
 
 
-# @nb.njit(nb.types.List(MOVE_TYPE)(Position.class_type.instance_type), cache=True)
+# The standard squares the kings and rooks stand on and pass through when castling, for each side and castling bit
+CASTLE_KING_SQUARES = np.array(((60, 62), (60, 58), (4, 6), (4, 2)), dtype=np.int64)       # from, to
+CASTLE_ROOK_SQUARES = np.array(((63, 61), (56, 59), (7, 5), (0, 3)), dtype=np.int64)       # from, to
+CASTLE_EMPTY_MASKS = np.array(((1 << 61) | (1 << 62), (1 << 57) | (1 << 58) | (1 << 59),
+                               (1 << 5) | (1 << 6), (1 << 1) | (1 << 2) | (1 << 3)), dtype=np.uint64)
+
+# The kinds of moves generate_legal_moves writes
+ALL_MOVES, CAPTURE_MOVES, QUIET_MOVES = range(3)
+
+# The stages of pick_next_move. The moves of the root come from the root move list.
+STAGE_TT_MOVE, STAGE_GENERATE_CAPTURES, STAGE_CAPTURES, STAGE_KILLERS, \
+    STAGE_GENERATE_QUIETS, STAGE_QUIETS, STAGE_ROOT_MOVES, STAGE_DONE = range(8)
+
+
 @nb.njit(cache=True)
-def get_pseudo_legal_moves(position):
-    moves = []
-    board = position.board
+def add_targets(moves, count, board, pos, piece, targets):
+    """Writes the moves of the piece to each target of the bitboard, returns the new count."""
+
+    while targets:
+        new_pos = STANDARD_TO_MAILBOX[get_lsb_index(targets)]
+        occupied = board[new_pos]
+
+        moves[count] = encode_move(pos, new_pos,
+                                   piece, occupied,
+                                   MOVE_TYPE_NORMAL, 0, 0 if occupied == EMPTY else 1)
+        count += 1
+
+        targets &= targets - nb.uint64(1)
+
+    return count
 
-    if position.side == 0:  # white
-        for pos in position.white_pieces:
-            piece = board[pos]
-
-            for increment in WHITE_INCREMENTS[piece]:
-                if increment == 0:
-                    break
-
-                new_pos = pos
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
-                    if occupied == PADDING or occupied < BLACK_PAWN:  # standing on own piece or outside of board
-                        break
-                    elif piece == WHITE_PAWN and increment in (-10, -20) and board[pos-10] != EMPTY:
-                        break
-                    elif piece == WHITE_PAWN and increment == -20 and (pos < 81 or occupied != EMPTY):
-                        break
-
-                    # En passant
-                    if piece == WHITE_PAWN and increment in (-11, -9) and occupied == EMPTY:
-                        if new_pos == position.ep_square:
-                            moves.append(encode_move(pos, new_pos,
-                                                     WHITE_PAWN, EMPTY,
-                                                     MOVE_TYPE_EP, 0, 0))
-                        break
-
-                    # Promotion
-                    elif piece == WHITE_PAWN and new_pos < 31:
-                        for j in range(WHITE_KNIGHT, WHITE_KING):
-                            moves.append(encode_move(pos, new_pos,
-                                                     WHITE_PAWN, occupied,
-                                                     MOVE_TYPE_PROMOTION, j, 1 if occupied < EMPTY else 0))
-                        break
-
-                    # Normal capture move
-                    if occupied < EMPTY:
-                        moves.append(encode_move(pos, new_pos,
-                                                 piece, occupied,
-                                                 MOVE_TYPE_NORMAL, 0, 1))
-                        break
-
-                    # Normal non-capture move
-                    moves.append(encode_move(pos, new_pos,
-                                             piece, occupied,
-                                             MOVE_TYPE_NORMAL, 0, 0))
-
-                    # if we are a non-sliding piece, or we have captured an opposing piece then stop
-                    if piece in (WHITE_PAWN, WHITE_KNIGHT, WHITE_KING):
-                        break
-
-                    # King side castle
-                    if position.castle_ability_bits & 1 == 1 and pos == H1 and board[new_pos-1] == WHITE_KING:
-                        moves.append(encode_move(E1, G1, WHITE_KING,
-                                                 EMPTY, MOVE_TYPE_CASTLE, 0, 0))
-                    # Queen side castle
-                    elif position.castle_ability_bits & 2 == 2 and pos == A1 and board[new_pos+1] == WHITE_KING:
-                        moves.append(encode_move(E1, C1, WHITE_KING,
-                                                 EMPTY, MOVE_TYPE_CASTLE, 0, 0))
 
-    else:
-        for pos in position.black_pieces:
-            piece = board[pos]
-
-            for increment in BLACK_INCREMENTS[piece - BLACK_PAWN]:
-                if increment == 0:
-                    break
-
-                new_pos = pos
-
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
-                    if occupied != EMPTY and occupied > WHITE_KING:  # standing on own piece or outside of board
-                        break
-                    elif piece == BLACK_PAWN and increment in (10, 20) and board[pos + 10] != EMPTY:
-                        break
-                    elif piece == BLACK_PAWN and increment == 20 and (pos > 38 or occupied != EMPTY):
-                        break
-
-                    # En passant
-                    if piece == BLACK_PAWN and increment in (11, 9) and occupied == EMPTY:
-                        if new_pos == position.ep_square:
-                            moves.append(encode_move(pos, new_pos,
-                                                     BLACK_PAWN, EMPTY,
-                                                     MOVE_TYPE_EP, 0, 0))
-                        break
-
-                    # Promotion
-                    elif piece == BLACK_PAWN and new_pos > 88:
-                        for j in range(BLACK_KNIGHT, BLACK_KING):
-                            moves.append(encode_move(pos, new_pos,
-                                                     BLACK_PAWN, occupied,
-                                                     MOVE_TYPE_PROMOTION, j, 1 if occupied < BLACK_PAWN else 0))
-                        break
-
-                    # Normal capture move
-                    if occupied < BLACK_PAWN:
-                        moves.append(encode_move(pos, new_pos,
-                                                 piece, occupied,
-                                                 MOVE_TYPE_NORMAL, 0, 1))
-                        break
-                    # Normal non-capture move
-                    moves.append(encode_move(pos, new_pos,
-                                             piece, occupied,
-                                             MOVE_TYPE_NORMAL, 0, 0))
-
-                    # if we are a non-sliding piece, or we have captured an opposing piece then stop
-                    if piece in (BLACK_PAWN, BLACK_KNIGHT, BLACK_KING):
-                        break
-
-                    # King side castle
-                    if position.castle_ability_bits & 4 == 4 and pos == H8 and board[new_pos-1] == BLACK_KING:
-                        moves.append(encode_move(E8, G8, BLACK_KING,
-                                                 EMPTY, MOVE_TYPE_CASTLE, 0, 0))
-                    # Queen side castle
-                    elif position.castle_ability_bits & 8 == 8 and pos == A8 and board[new_pos+1] == BLACK_KING:
-                        moves.append(encode_move(E8, C8, BLACK_KING,
-                                                 EMPTY, MOVE_TYPE_CASTLE, 0, 0))
-
-    return moves
-
-
-# @nb.njit(nb.types.List(MOVE_TYPE)(Position.class_type.instance_type), cache=True)
 @nb.njit(cache=True)
-def get_pseudo_legal_captures(position):
+def add_promotions(moves, count, pos, new_pos, pawn, occupied, kind):
+    """
+    Writes the promotions of the pawn, returns the new count. The captures only promote to a queen,
+    the captures promoting to the other pieces are left to the quiet moves.
+    """
+
+    is_capture = 0 if occupied == EMPTY else 1
+
+    first_piece = WHITE_QUEEN if kind == CAPTURE_MOVES else WHITE_KNIGHT
+    last_piece = WHITE_QUEEN if kind == QUIET_MOVES and is_capture else WHITE_KING
+
+    for piece in range(pawn + first_piece, pawn + last_piece):
+        moves[count] = encode_move(pos, new_pos,
+                                   pawn, occupied,
+                                   MOVE_TYPE_PROMOTION, piece, is_capture)
+        count += 1
+
+    return count
 
-    moves = []
+
+@nb.njit(cache=True)
+def generate_legal_moves(position, moves, kind):
+    """
+    Writes the legal moves of the kind into moves, a row of the move stack, and returns their count.
+    The captures and the quiet moves split the legal moves in two.
+
+    The checkers and the pinned pieces are found once. In double check only the king moves,
+    in check the other pieces may only capture the checker or block it, and a pinned piece
+    only moves along the line through its king. The king steps to squares that aren't attacked
+    with the king taken off the board, so it can't step back along the ray of a slider checking it.
+    """
+    count = 0
     board = position.board
+    side = position.side
+    pawn = side * BLACK_PAWN
+
+    own = position.occupancy[side]
+    enemies = position.occupancy[side ^ 1]
+    occupancy = own | enemies
+
+    king_pos = position.king_positions[side]
+    king_square = MAILBOX_TO_STANDARD[king_pos]
+    king_bit = nb.uint64(1) << nb.uint64(king_square)
 
-    if position.side == 0:  # white
-        for pos in position.white_pieces:
-            piece = board[pos]
-
-            for increment in WHITE_ATK_INCREMENTS[piece]:
-                if increment == 0:
-                    break
-
-                new_pos = pos
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
-
-                    if occupied == PADDING or occupied < BLACK_PAWN:  # if outside of board or own piece
-                        break
-                    if occupied < EMPTY:
-                        moves.append(encode_move(pos, new_pos,
-                                                 piece, occupied,
-                                                 MOVE_TYPE_NORMAL, 0, 1))
-                        break
-                    if piece in (WHITE_PAWN, WHITE_KNIGHT, WHITE_KING):  # if it is an opposing pawn, knight, or king
-                        break
+    checkers = get_attackers(position, king_square, occupancy)
+
+    # The squares the pieces may move to, the captures only go to the opponent's pieces and the quiet moves
+    # to the empty squares
+    if kind == CAPTURE_MOVES:
+        target_mask = enemies
+    elif kind == QUIET_MOVES:
+        target_mask = ~occupancy
     else:
-        for pos in position.black_pieces:
-            piece = board[pos]
+        target_mask = ~own
+
+    targets = KING_ATTACKS[king_square] & target_mask
+    while targets:
+        square = get_lsb_index(targets)
+
+        if not is_square_attacked(position, square, occupancy ^ king_bit):
+            count = add_targets(moves, count, board, king_pos, pawn + WHITE_KING, nb.uint64(1) << nb.uint64(square))
+
+        targets &= targets - nb.uint64(1)
+
+    # Double check
+    if checkers & (checkers - nb.uint64(1)):
+        return count
+
+    # In check, the squares capturing the checker or blocking it
+    check_mask = ~nb.uint64(0)
+
+    if checkers:
+        check_mask = checkers | BETWEEN[king_square][get_lsb_index(checkers)]
+
+    elif kind != CAPTURE_MOVES:
+        for castle in range(2 * side, 2 * side + 2):
+            if position.castle_ability_bits & (1 << castle)                             \
+                    and board[STANDARD_TO_MAILBOX[CASTLE_ROOK_SQUARES[castle][0]]] == pawn + WHITE_ROOK   \
+                    and not occupancy & CASTLE_EMPTY_MASKS[castle]                      \
+                    and not is_square_attacked(position, CASTLE_ROOK_SQUARES[castle][1], occupancy)    \
+                    and not is_square_attacked(position, CASTLE_KING_SQUARES[castle][1], occupancy):
+
+                moves[count] = encode_move(king_pos, STANDARD_TO_MAILBOX[CASTLE_KING_SQUARES[castle][1]],
+                                           pawn + WHITE_KING, EMPTY,
+                                           MOVE_TYPE_CASTLE, 0, 0)
+                count += 1
+
+    pinned = get_pinned(position, king_square, occupancy)
+
+    # Pawns move towards the lower squares for white, and promote on the last rank
+    push = 8 if side else -8
+    last_rank = (0, 7)[side]
+
+    for pos in position.piece_list[side][:position.piece_count[side]]:
+        piece = board[pos]
+        if piece == pawn + WHITE_KING:
+            continue
+
+        square = MAILBOX_TO_STANDARD[pos]
+        piece_mask = check_mask
+
+        if pinned & (nb.uint64(1) << nb.uint64(square)):
+            piece_mask &= LINES[king_square][square]
+
+        if piece != pawn:
+            targets = get_piece_attacks(piece - pawn, side, square, occupancy) & target_mask & piece_mask
+            count = add_targets(moves, count, board, pos, piece, targets)
+            continue
+
+        # Pawn captures
+        targets = PAWN_ATTACKS[side][square] & enemies & piece_mask
+        while targets:
+            new_square = get_lsb_index(targets)
+            new_pos = STANDARD_TO_MAILBOX[new_square]
+
+            if new_square // 8 == last_rank:
+                count = add_promotions(moves, count, pos, new_pos, pawn, board[new_pos], kind)
+            elif kind != QUIET_MOVES:
+                moves[count] = encode_move(pos, new_pos,
+                                           pawn, board[new_pos],
+                                           MOVE_TYPE_NORMAL, 0, 1)
+                count += 1
+
+            targets &= targets - nb.uint64(1)
+
+        if kind == CAPTURE_MOVES:
+            continue
+
+        # En passant, tested by removing both pawns from the occupancy, which also finds
+        # the pin of the two pawns standing between the king and a rook on their rank
+        if position.ep_square:
+            ep_square = MAILBOX_TO_STANDARD[position.ep_square]
+
+            if PAWN_ATTACKS[side][square] & (nb.uint64(1) << nb.uint64(ep_square)):
+                ep_occupancy = occupancy ^ (nb.uint64(1) << nb.uint64(square)) \
+                    ^ (nb.uint64(1) << nb.uint64(ep_square)) ^ (nb.uint64(1) << nb.uint64(ep_square - push))
+
+                if not get_attackers(position, king_square, ep_occupancy):
+                    moves[count] = encode_move(pos, position.ep_square,
+                                               pawn, EMPTY,
+                                               MOVE_TYPE_EP, 0, 0)
+                    count += 1
+
+        # Pawn pushes
+        new_square = square + push
+        if occupancy & (nb.uint64(1) << nb.uint64(new_square)):
+            continue
+
+        if piece_mask & (nb.uint64(1) << nb.uint64(new_square)):
+            new_pos = STANDARD_TO_MAILBOX[new_square]
+
+            if new_square // 8 == last_rank:
+                count = add_promotions(moves, count, pos, new_pos, pawn, EMPTY, kind)
+            else:
+                moves[count] = encode_move(pos, new_pos,
+                                           pawn, EMPTY,
+                                           MOVE_TYPE_NORMAL, 0, 0)
+                count += 1
 
-            for increment in BLACK_ATK_INCREMENTS[piece - BLACK_PAWN]:
-                if increment == 0:
-                    break
+        # Double pawn pushes from the starting rank
+        new_square += push
+        if square // 8 == (6, 1)[side] and not occupancy & (nb.uint64(1) << nb.uint64(new_square)) \
+                and piece_mask & (nb.uint64(1) << nb.uint64(new_square)):
+
+            moves[count] = encode_move(pos, STANDARD_TO_MAILBOX[new_square],
+                                       pawn, EMPTY,
+                                       MOVE_TYPE_NORMAL, 0, 0)
+            count += 1
+
+    return count
+
+
+# @nb.njit(nb.int64(Position.class_type.instance_type, MOVE_TYPE[::1]), cache=True)
+@nb.njit(cache=True)
+def get_legal_moves(position, moves):
+    """Writes the legal moves into moves, a row of the move stack, and returns their count."""
+    return generate_legal_moves(position, moves, ALL_MOVES)
 
-                new_pos = pos
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
 
-                    if occupied != EMPTY and occupied > WHITE_KING:  # standing on own piece or outside of board
-                        break
+# @nb.njit(nb.int64(Position.class_type.instance_type, MOVE_TYPE[::1]), cache=True)
+@nb.njit(cache=True)
+def get_legal_captures(position, moves):
+    """
+    Writes the legal captures into moves, a row of the move stack, and returns their count.
+    Pawns capturing onto the last rank promote to a queen, en passant isn't included.
+    """
+    return generate_legal_moves(position, moves, CAPTURE_MOVES)
 
-                    if occupied < BLACK_PAWN:
-                        moves.append(encode_move(pos, new_pos,
-                                                 piece, occupied,
-                                                 MOVE_TYPE_NORMAL, 0, 1))
-                        break
-                    if piece in (BLACK_PAWN, BLACK_KNIGHT, BLACK_KING):  # if it is an opposing pawn, knight, or king
-                        break
 
-    return moves
+# @nb.njit(nb.int64(Position.class_type.instance_type, MOVE_TYPE[::1]), cache=True)
+@nb.njit(cache=True)
+def get_legal_quiets(position, moves):
+    """
+    Writes the legal moves left out of the captures into moves, a row of the move stack, and returns their count:
+    the quiet moves with castling, en passant and the promotions, and the captures promoting to the other pieces.
+    """
+    return generate_legal_moves(position, moves, QUIET_MOVES)
 
 
-# @nb.njit(nb.types.List(SCORE_TYPE)(Search.class_type.instance_type, nb.types.List(MOVE_TYPE), MOVE_TYPE))
 @nb.njit(cache=True)
-def get_move_scores(engine, moves, tt_move):
-    scored_moves = []
+def is_legal_move(position, move):
+    """
+    Returns whether a move from the transposition table or the killers is legal in the position,
+    without generating the moves. It follows the rules of generate_legal_moves, so a move passes
+    when the generator would have written it.
+    """
+
+    board = position.board
+    side = position.side
+    pawn = side * BLACK_PAWN
+
+    from_pos = get_from_square(move)
+    to_pos = get_to_square(move)
+    selected = get_selected(move)
+    occupied = get_occupied(move)
+    move_type = get_move_type(move)
+    promotion_piece = get_promotion_piece(move)
+
+    # Our piece moves, to an empty square or one of the opponent's pieces
+    if not pawn <= selected <= pawn + WHITE_KING or from_pos >= 120 or board[from_pos] != selected:
+        return False
+
+    if to_pos >= 120 or board[to_pos] != occupied or get_is_capture(move) != (occupied != EMPTY):
+        return False
+
+    if occupied != EMPTY and (occupied < BLACK_PAWN) == (selected < BLACK_PAWN):
+        return False
+
+    from_square = MAILBOX_TO_STANDARD[from_pos]
+    to_square = MAILBOX_TO_STANDARD[to_pos]
+    to_bit = nb.uint64(1) << nb.uint64(to_square)
+
+    occupancy = position.occupancy[0] | position.occupancy[1]
+
+    if move_type == MOVE_TYPE_CASTLE:
+        for castle in range(2 * side, 2 * side + 2):
+            if from_square == CASTLE_KING_SQUARES[castle][0] and to_square == CASTLE_KING_SQUARES[castle][1]:
+                return selected == pawn + WHITE_KING and occupied == EMPTY and promotion_piece == 0   \
+                    and position.castle_ability_bits & (1 << castle)                                    \
+                    and board[STANDARD_TO_MAILBOX[CASTLE_ROOK_SQUARES[castle][0]]] == pawn + WHITE_ROOK \
+                    and not occupancy & CASTLE_EMPTY_MASKS[castle]                                      \
+                    and not is_square_attacked(position, from_square, occupancy)                        \
+                    and not is_square_attacked(position, CASTLE_ROOK_SQUARES[castle][1], occupancy)     \
+                    and not is_square_attacked(position, to_square, occupancy)
+
+        return False
+
+    if move_type == MOVE_TYPE_EP:
+        if selected != pawn or not position.ep_square or to_pos != position.ep_square or promotion_piece \
+                or not PAWN_ATTACKS[side][from_square] & to_bit:
+            return False
+
+    elif selected == pawn:
+        push = 8 if side else -8
+
+        # Pawns promote on the last rank and only there
+        if (move_type == MOVE_TYPE_PROMOTION) != (to_square // 8 == (0, 7)[side]):
+            return False
+        if move_type == MOVE_TYPE_PROMOTION and not pawn + WHITE_KNIGHT <= promotion_piece <= pawn + WHITE_QUEEN:
+            return False
+        if move_type == MOVE_TYPE_NORMAL and promotion_piece:
+            return False
+
+        if occupied != EMPTY:
+            if not PAWN_ATTACKS[side][from_square] & to_bit:
+                return False
+
+        # A push, or a double push from the starting rank over an empty square
+        elif to_square != from_square + push:
+            if to_square != from_square + 2 * push or from_square // 8 != (6, 1)[side] \
+                    or occupancy & (nb.uint64(1) << nb.uint64(from_square + push)):
+                return False
+
+    else:
+        if move_type != MOVE_TYPE_NORMAL or promotion_piece \
+                or not get_piece_attacks(selected - pawn, side, from_square, occupancy) & to_bit:
+            return False
+
+    # The move mustn't leave the king attacked, tested on the bitboards with the move made
+    toggle_move(position, move)
+
+    king_square = to_square if selected == pawn + WHITE_KING else MAILBOX_TO_STANDARD[position.king_positions[side]]
+    is_legal = not is_square_attacked(position, king_square, position.occupancy[0] | position.occupancy[1])
 
-    for move in moves:
-        scored_moves.append(score_move(engine, move, tt_move))
+    toggle_move(position, move)
 
-    return scored_moves
+    return is_legal
 
 
-# @nb.njit(nb.types.List(SCORE_TYPE)(nb.types.List(MOVE_TYPE)), cache=True)
+# @nb.njit(nb.void(Search.class_type.instance_type, MOVE_TYPE[::1], SCORE_TYPE[::1], nb.int64, MOVE_TYPE))
 @nb.njit(cache=True)
-def get_capture_scores(moves, tt_move):
-    scored_moves = []
+def get_move_scores(engine, moves, move_scores, move_count, tt_move):
+    for i in range(move_count):
+        move_scores[i] = score_move(engine, moves[i], tt_move)
 
-    for move in moves:
-        scored_moves.append(score_capture(move, tt_move))
 
-    return scored_moves
+# @nb.njit(nb.void(MOVE_TYPE[::1], SCORE_TYPE[::1], nb.int64, MOVE_TYPE), cache=True)
+@nb.njit(cache=True)
+def get_capture_scores(moves, move_scores, move_count, tt_move):
+    for i in range(move_count):
+        move_scores[i] = score_capture(moves[i], tt_move)
 
 
-# @nb.njit(nb.void(nb.types.List(MOVE_TYPE), nb.types.List(SCORE_TYPE), nb.uint8), cache=True)
+# @nb.njit(nb.void(MOVE_TYPE[::1], SCORE_TYPE[::1], nb.int64, nb.int64), cache=True)
 @nb.njit(cache=True)
-def sort_next_move(moves, move_scores, current_count):
-    for next_count in range(current_count, len(moves)):
+def sort_next_move(moves, move_scores, current_count, move_count):
+    for next_count in range(current_count, move_count):
         if move_scores[current_count] < move_scores[next_count]:
             current_move = moves[current_count]
             moves[current_count] = moves[next_count]
@@ -225,3 +356,89 @@ def sort_next_move(moves, move_scores, current_count):
             current_score = move_scores[current_count]
             move_scores[current_count] = move_scores[next_count]
             move_scores[next_count] = current_score
+
+
+@nb.njit(cache=True)
+def pick_next_move(engine, position, moves, move_scores, stage, index, move_count, tt_move):
+    """
+    Returns the next move of a node to search, with the stage, index and move count to pass to the next call,
+    or NO_MOVE once the moves run out.
+
+    The moves are generated in stages: the transposition table move, checked with is_legal_move, then the
+    captures, then the killers, again only checked, then the quiet moves. A cutoff by an early move
+    saves the generation of the later ones. The moves of one stage aren't picked again by another.
+    """
+
+    if stage == STAGE_TT_MOVE:
+        engine.picker_nodes += 1
+        stage = STAGE_GENERATE_CAPTURES
+
+        if tt_move != NO_MOVE and is_legal_move(position, nb.uint32(tt_move)):
+            return tt_move, stage, index, move_count
+
+    if stage == STAGE_GENERATE_CAPTURES:
+        engine.capture_generations += 1
+
+        move_count = get_legal_captures(position, moves)
+        get_capture_scores(moves, move_scores, move_count, tt_move)
+
+        stage = STAGE_CAPTURES
+        index = 0
+
+    if stage == STAGE_CAPTURES:
+        while index < move_count:
+            sort_next_move(moves, move_scores, index, move_count)
+            move = moves[index]
+            index += 1
+
+            if move != tt_move:
+                return move, stage, index, move_count
+
+        stage = STAGE_KILLERS
+        index = 0
+
+    first_killer = engine.killer_moves[0][engine.ply]
+    second_killer = engine.killer_moves[1][engine.ply]
+
+    if stage == STAGE_KILLERS:
+        if index == 0:
+            index = 1
+
+            if first_killer != NO_MOVE and first_killer != tt_move and is_legal_move(position, first_killer):
+                return first_killer, stage, index, move_count
+
+        stage = STAGE_GENERATE_QUIETS
+
+        if second_killer != NO_MOVE and second_killer != tt_move and second_killer != first_killer \
+                and is_legal_move(position, second_killer):
+            return second_killer, stage, index, move_count
+
+    if stage == STAGE_GENERATE_QUIETS:
+        engine.quiet_generations += 1
+
+        move_count = get_legal_quiets(position, moves)
+        get_move_scores(engine, moves, move_scores, move_count, tt_move)
+
+        stage = STAGE_QUIETS
+        index = 0
+
+    if stage == STAGE_QUIETS:
+        while index < move_count:
+            sort_next_move(moves, move_scores, index, move_count)
+            move = moves[index]
+            index += 1
+
+            if move != tt_move and move != first_killer and move != second_killer:
+                return move, stage, index, move_count
+
+        stage = STAGE_DONE
+
+    # The root move list, already ordered
+    if stage == STAGE_ROOT_MOVES:
+        if index < move_count:
+            sort_next_move(moves, move_scores, index, move_count)
+            return moves[index], stage, index + 1, move_count
+
+        stage = STAGE_DONE
+
+    return NO_MOVE, stage, index, move_count
@@ -3,15 +3,18 @@ import time
 
 from move_generator import *
 from position import *
+from position_class import PositionStruct_set_side
 
 
-@nb.njit(cache=False)
+@nb.njit(cache=True)
 def debug_perft(position, depth):
 
     if depth == 0:
         return 1, 0, 0, 0, 0, 0
 
-    moves = get_pseudo_legal_moves(position)
+    # Debugging only, so each node allocates its own moves
+    moves = np.zeros(MAX_MOVES, dtype=np.uint32)
+    move_count = get_legal_moves(position, moves)
 
     # -----
     current_ep = position.ep_square
@@ -25,14 +28,9 @@ def debug_perft(position, depth):
     promotion_amt = 0
     castle_amt = 0
 
-    for move in moves:
-
-        attempt = make_move(position, move)
-
-        if not attempt:
-            undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
-            continue
+    for move in moves[:move_count]:
 
+        make_move(position, move)
         position.side ^= 1
 
         if depth == 1:
@@ -67,12 +65,24 @@ def debug_perft(position, depth):
     return amt, capture_amt, ep_amt, check_amt, promotion_amt, castle_amt
 
 
-@nb.njit(cache=False)
+@nb.njit(cache=True)
+def get_perft_move_stack(depth):
+    # A row of moves per remaining depth, the root uses the last one
+    return np.zeros((max(depth, 1), MAX_MOVES), dtype=np.uint32)
+
+
+@nb.njit(cache=True)
 def fast_perft(position, depth):
+    return count_perft(position, depth, get_perft_move_stack(depth))
+
+
+@nb.njit(cache=True)
+def count_perft(position, depth, move_stack):
     if depth == 0:
         return 1
 
-    moves = get_pseudo_legal_moves(position)
+    moves = move_stack[depth - 1]
+    move_count = get_legal_moves(position, moves)
 
     # -----
     current_ep = position.ep_square
@@ -81,16 +91,11 @@ def fast_perft(position, depth):
 
     amt = 0
 
-    for move in moves:
-
-        attempt = make_move(position, move)
-
-        if not attempt:
-            undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
-            continue
+    for move in moves[:move_count]:
 
+        make_move(position, move)
         position.side ^= 1
-        amt += fast_perft(position, depth - 1)
+        amt += count_perft(position, depth - 1, move_stack)
         position.side ^= 1
 
         undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
@@ -98,47 +103,44 @@ def fast_perft(position, depth):
     return amt
 
 
-@nb.njit(cache=False)
 def uci_perft(position, depth):
-
-    with nb.objmode(start_time=nb.double):
-        start_time = time.time()
+    # Plain python, since the uci conversion of the moves isn't jitted. The subtrees are counted by count_perft.
+    start_time = time.time()
 
     # In case someone decides to run perft 0?
     if depth == 0:
         return 1
 
-    moves = get_pseudo_legal_moves(position)
+    move_stack = get_perft_move_stack(depth)
+    moves = move_stack[depth - 1]
+    move_count = get_legal_moves(position, moves)
     total_amt = 0
 
     # -----
     current_ep = position.ep_square
     current_castle_ability_bits = position.castle_ability_bits
     current_hash_key = position.hash_key
+    side = position.side
 
-    for move in moves:
-
-        attempt = make_move(position, move)
-
-        if not attempt:
-            undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
-            continue
+    for move in moves[:move_count]:
 
-        position.side ^= 1
-        amt = fast_perft(position, depth - 1)
+        make_move(position, move)
+        PositionStruct_set_side(position, side ^ 1)
+        amt = count_perft(position, depth - 1, move_stack)
         total_amt += amt
 
-        position.side ^= 1
+        PositionStruct_set_side(position, side)
         undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
 
         print("Move " + get_uci_from_move(move) + ": " + str(amt))
 
-    with nb.objmode:
-        end_time = time.time()
+    end_time = time.time()
+
+    print("nodes searched: " + str(total_amt))
+    print("perft speed: " + str(int(total_amt / max(end_time - start_time, 0.0001)) / 1000) + "kn/s")
+    print("total time: " + str(end_time - start_time))
 
-        print("nodes searched: " + str(total_amt))
-        print("perft speed: " + str(int(total_amt / (end_time - start_time)) / 1000) + "kn/s")
-        print("total time: " + str(end_time - start_time))
+    return total_amt
 
 
 '''
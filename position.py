@@ -14,29 +14,29 @@ Functions in this file:
 -undo_move
 -make_capture
 -undo_capture
+-load_position
+-parse_fen
 
 """
 
+from bitboard import BETWEEN, BISHOP_RAYS, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_RAYS, \
+    get_bishop_attacks, get_lsb_index, get_rook_attacks
 from move import *
 # from position_class import Position
 # from numba.typed import List
 
 
-PIECE_MATCHER = np.array((
-    'P',
-    'N',
-    'B',
-    'R',
-    'Q',
-    'K',
-))
+PIECE_MATCHER = "PNBRQK"
 
 
 @nb.njit(cache=True)
 def reset_position(position):
     position.board = np.zeros(120, dtype=np.uint8)
-    position.white_pieces = [nb.int64(1) for _ in range(0)]
-    position.black_pieces = [nb.int64(1) for _ in range(0)]
+    position.piece_list = np.zeros((2, 16), dtype=np.uint8)
+    position.piece_count = np.zeros(2, dtype=np.uint8)
+    position.piece_index = np.zeros(120, dtype=np.uint8)
+    position.bitboards = np.zeros(12, dtype=np.uint64)
+    position.occupancy = np.zeros(2, dtype=np.uint64)
     position.king_positions = np.zeros(2, dtype=np.uint8)
     position.castle_ability_bits = 0
     position.ep_square = 0
@@ -67,113 +67,187 @@ def compute_hash(position):
     return code
 
 
+@nb.njit(cache=True)
+def is_square_attacked(position, square, occupancy):
+    """
+    Returns whether the standard square is attacked by the opponent of the side to move,
+    with the sliding attacks blocked by the given occupancy.
+    """
+
+    side = position.side
+    bitboards = position.bitboards
+
+    # The pieces of the opponent, as indices into bitboards
+    pawn = (side ^ 1) * BLACK_PAWN
+    queens = bitboards[pawn + WHITE_QUEEN]
+
+    if KNIGHT_ATTACKS[square] & bitboards[pawn + WHITE_KNIGHT]:
+        return True
+    if PAWN_ATTACKS[side][square] & bitboards[pawn]:
+        return True
+    if KING_ATTACKS[square] & bitboards[pawn + WHITE_KING]:
+        return True
+
+    # The blockers are only looked at for the sliders lined up with the square
+    bishops = (bitboards[pawn + WHITE_BISHOP] | queens) & BISHOP_RAYS[square]
+    rooks = (bitboards[pawn + WHITE_ROOK] | queens) & ROOK_RAYS[square]
+
+    if bishops and get_bishop_attacks(square, occupancy) & bishops:
+        return True
+    if rooks and get_rook_attacks(square, occupancy) & rooks:
+        return True
+
+    return False
+
+
 # @nb.njit(nb.boolean(Position.class_type.instance_type, nb.int8), cache=True)
 @nb.njit(cache=True)
 def is_attacked(position, pos):
-    board = position.board
-    if position.side == 0:
-        for piece in (WHITE_QUEEN, WHITE_KNIGHT):
-            for increment in BLACK_ATK_INCREMENTS[piece]:
-                if increment == 0:
-                    break
-                new_pos = pos
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
-                    if occupied == PADDING or occupied < BLACK_PAWN:  # standing on own piece or outside of board
-                        break
-
-                    if occupied < EMPTY:
-                        if piece == occupied - BLACK_PAWN:
-                            return True
-
-                        if piece == WHITE_KNIGHT:  # if we are checking with knight and opponent piece is not knight
-                            break
-
-                        if occupied == BLACK_KNIGHT:  # if we are checking with a queen and opponent piece is a knight
-                            break
-
-                        if occupied == BLACK_KING:  # king
-                            if new_pos == pos + increment:
-                                return True
-                            break
-
-                        if occupied == BLACK_PAWN:  # pawn
-                            if new_pos == pos - 11 or \
-                                    new_pos == pos - 9:
-                                return True
-                            break
-
-                        if occupied == BLACK_BISHOP:  # bishop
-                            if increment in (-11, 11, 9, -9):
-                                return True
-                            break
-                        if occupied == BLACK_ROOK:  # rook
-                            if increment in (-10, 1, 10, -1):
-                                return True
-                            break
-
-                    if piece == WHITE_KNIGHT:  # if checking with knight
-                        break
+    """Returns whether the square is attacked by the opponent of the side to move, looked up in the bitboards."""
 
-    else:
-        for piece in (BLACK_QUEEN, BLACK_KNIGHT):
-            for increment in WHITE_ATK_INCREMENTS[piece-BLACK_PAWN]:
-                if increment == 0:
-                    break
-                new_pos = pos
-                while True:
-                    new_pos += increment
-                    occupied = board[new_pos]
-                    if occupied != EMPTY and occupied > WHITE_KING:  # standing on own piece or outside of board
-                        break
-
-                    if occupied < BLACK_PAWN:
-                        if piece == occupied + BLACK_PAWN:
-                            return True
-
-                        if piece == BLACK_KNIGHT:  # if we are checking with knight and opponent piece is not knight
-                            break
-                        if occupied == WHITE_KNIGHT:  # if we are checking with a queen and opponent piece is a knight
-                            break
-                        if occupied == WHITE_KING:  # king
-                            if new_pos == pos + increment:
-                                return True
-                            break
-
-                        if occupied == WHITE_PAWN:  # pawn
-                            if new_pos == pos + 11 or \
-                                    new_pos == pos + 9:
-                                return True
-                            break
-
-                        if occupied == WHITE_BISHOP:  # bishop
-                            if increment in (-11, 11, 9, -9):
-                                return True
-                            break
-                        if occupied == WHITE_ROOK:  # rook
-                            if increment in (-10, 1, 10, -1):
-                                return True
-                            break
-
-                    if piece == BLACK_KNIGHT:  # if checking with knight
-                        break
+    return is_square_attacked(position, MAILBOX_TO_STANDARD[pos], position.occupancy[0] | position.occupancy[1])
 
-    return False
+
+@nb.njit(cache=True)
+def get_attackers(position, square, occupancy):
+    """
+    Returns the bitboard of the opponent's pieces attacking the standard square, for the given occupancy.
+    Pieces missing from the occupancy, like a pawn captured en passant, don't attack.
+    """
+
+    side = position.side
+    bitboards = position.bitboards
+
+    pawn = (side ^ 1) * BLACK_PAWN
+    queens = bitboards[pawn + WHITE_QUEEN]
+
+    return (KNIGHT_ATTACKS[square] & bitboards[pawn + WHITE_KNIGHT]
+            | PAWN_ATTACKS[side][square] & bitboards[pawn]
+            | KING_ATTACKS[square] & bitboards[pawn + WHITE_KING]
+            | get_bishop_attacks(square, occupancy) & (bitboards[pawn + WHITE_BISHOP] | queens)
+            | get_rook_attacks(square, occupancy) & (bitboards[pawn + WHITE_ROOK] | queens)) & occupancy
+
+
+@nb.njit(cache=True)
+def get_pinned(position, king_square, occupancy):
+    """
+    Returns the bitboard of our pieces pinned to our king. A piece is pinned when it is
+    the only piece between the king and an opponent's slider lined up with it.
+    """
+
+    side = position.side
+    bitboards = position.bitboards
+
+    pawn = (side ^ 1) * BLACK_PAWN
+    queens = bitboards[pawn + WHITE_QUEEN]
+
+    snipers = (bitboards[pawn + WHITE_BISHOP] | queens) & BISHOP_RAYS[king_square] | \
+        (bitboards[pawn + WHITE_ROOK] | queens) & ROOK_RAYS[king_square]
+
+    pinned = nb.uint64(0)
+    while snipers:
+        blockers = BETWEEN[king_square][get_lsb_index(snipers)] & occupancy
+
+        # A single blocker
+        if blockers and not blockers & (blockers - nb.uint64(1)):
+            pinned |= blockers
+
+        snipers &= snipers - nb.uint64(1)
+
+    return pinned & position.occupancy[side]
+
+
+# The piece lists are updated in constant time through piece_index, without allocating.
+# A removed piece is replaced by the last piece of the list, so the order of the pieces changes
+# after a capture and its undo, like it did with the remove and append of the former lists.
+@nb.njit(cache=True)
+def add_piece(position, side, square):
+    index = position.piece_count[side]
+    position.piece_list[side][index] = square
+    position.piece_index[square] = index
+    position.piece_count[side] = index + 1
+
+
+@nb.njit(cache=True)
+def remove_piece(position, side, square):
+    index = position.piece_index[square]
+    last_index = position.piece_count[side] - 1
+    last_square = position.piece_list[side][last_index]
+
+    position.piece_list[side][index] = last_square
+    position.piece_index[last_square] = index
+    position.piece_count[side] = last_index
+
+
+@nb.njit(cache=True)
+def move_piece(position, side, from_square, to_square):
+    index = position.piece_index[from_square]
+    position.piece_list[side][index] = to_square
+    position.piece_index[to_square] = index
 
 
-# @nb.njit(nb.boolean(Position.class_type.instance_type, MOVE_TYPE), cache=True)
+@nb.njit(cache=True)
+def toggle_piece(bitboards, occupancy, piece, pos):
+    bit = nb.uint64(1) << nb.uint64(MAILBOX_TO_STANDARD[pos])
+    bitboards[piece] ^= bit
+    occupancy[piece // BLACK_PAWN] ^= bit
+
+
+@nb.njit(cache=True)
+def toggle_move(position, move):
+    """
+    Toggles the bits the move changes in the bitboards, which makes the move or undoes it.
+    The pieces are told apart by their color rather than by position.side, which make_move and undo_move share.
+    """
+
+    bitboards = position.bitboards
+    occupancy = position.occupancy
+
+    from_square = get_from_square(move)
+    to_square = get_to_square(move)
+    selected = get_selected(move)
+    move_type = get_move_type(move)
+
+    toggle_piece(bitboards, occupancy, selected, from_square)
+    toggle_piece(bitboards, occupancy,
+                 get_promotion_piece(move) if move_type == MOVE_TYPE_PROMOTION else selected, to_square)
+
+    if get_is_capture(move):
+        toggle_piece(bitboards, occupancy, get_occupied(move), to_square)
+
+    if move_type == MOVE_TYPE_EP:
+        if selected == WHITE_PAWN:
+            toggle_piece(bitboards, occupancy, BLACK_PAWN, to_square + 10)
+        else:
+            toggle_piece(bitboards, occupancy, WHITE_PAWN, to_square - 10)
+
+    elif move_type == MOVE_TYPE_CASTLE:
+        rook = WHITE_ROOK if selected == WHITE_KING else BLACK_ROOK
+
+        # Queen side castling
+        if to_square < from_square:
+            toggle_piece(bitboards, occupancy, rook, to_square - 2)
+            toggle_piece(bitboards, occupancy, rook, to_square + 1)
+        # King side castling
+        else:
+            toggle_piece(bitboards, occupancy, rook, to_square + 1)
+            toggle_piece(bitboards, occupancy, rook, to_square - 1)
+
+
+# @nb.njit(nb.void(Position.class_type.instance_type, MOVE_TYPE), cache=True)
 @nb.njit(cache=True)
 def make_move(position, move):
+    """Makes a legal move, the move generator only generates legal moves so no test is made here."""
 
     # Get move info
-    castled_pos = np.array([0, 0], dtype=np.int8)
     from_square = get_from_square(move)
     to_square = get_to_square(move)
     selected = get_selected(move)
     occupied = get_occupied(move)
     move_type = get_move_type(move)
 
+    toggle_move(position, move)
+
     # Normal move
     if move_type == MOVE_TYPE_NORMAL:
         # Set the piece to the target square and hash it
@@ -190,11 +264,11 @@ def make_move(position, move):
         if position.side == 0:
             position.board[to_square + 10] = EMPTY
             position.hash_key ^= PIECE_HASH_KEYS[BLACK_PAWN][MAILBOX_TO_STANDARD[to_square + 10]]
-            position.black_pieces.remove(to_square + 10)
+            remove_piece(position, 1, to_square + 10)
         else:
             position.board[to_square - 10] = EMPTY
             position.hash_key ^= PIECE_HASH_KEYS[WHITE_PAWN][MAILBOX_TO_STANDARD[to_square - 10]]
-            position.white_pieces.remove(to_square - 10)
+            remove_piece(position, 0, to_square - 10)
 
     # Castling move
     elif move_type == MOVE_TYPE_CASTLE:
@@ -204,30 +278,30 @@ def make_move(position, move):
 
         # Queen side castling
         if to_square < from_square:
-            castled_pos[0], castled_pos[1] = to_square - 2, to_square + 1  # A1/A8, D1/D8
+            rook_from, rook_to = to_square - 2, to_square + 1  # A1/A8, D1/D8
         # King side castling
         else:
-            castled_pos[0], castled_pos[1] = to_square + 1, to_square - 1  # H1/H8, F1/F8
+            rook_from, rook_to = to_square + 1, to_square - 1  # H1/H8, F1/F8
 
         # Move the rook and hash it
         if position.side == 0:
-            position.board[castled_pos[1]] = WHITE_ROOK
-            position.hash_key ^= PIECE_HASH_KEYS[WHITE_ROOK][MAILBOX_TO_STANDARD[castled_pos[1]]]
+            position.board[rook_to] = WHITE_ROOK
+            position.hash_key ^= PIECE_HASH_KEYS[WHITE_ROOK][MAILBOX_TO_STANDARD[rook_to]]
 
             # Remove the rook from the source square and hash it
-            position.board[castled_pos[0]] = EMPTY
-            position.hash_key ^= PIECE_HASH_KEYS[WHITE_ROOK][MAILBOX_TO_STANDARD[castled_pos[0]]]
+            position.board[rook_from] = EMPTY
+            position.hash_key ^= PIECE_HASH_KEYS[WHITE_ROOK][MAILBOX_TO_STANDARD[rook_from]]
 
-            position.white_pieces[position.white_pieces.index(castled_pos[0])] = castled_pos[1]
+            move_piece(position, 0, rook_from, rook_to)
         else:
-            position.board[castled_pos[1]] = BLACK_ROOK
-            position.hash_key ^= PIECE_HASH_KEYS[BLACK_ROOK][MAILBOX_TO_STANDARD[castled_pos[1]]]
+            position.board[rook_to] = BLACK_ROOK
+            position.hash_key ^= PIECE_HASH_KEYS[BLACK_ROOK][MAILBOX_TO_STANDARD[rook_to]]
 
             # Remove the rook from the source square and hash it
-            position.board[castled_pos[0]] = EMPTY
-            position.hash_key ^= PIECE_HASH_KEYS[BLACK_ROOK][MAILBOX_TO_STANDARD[castled_pos[0]]]
+            position.board[rook_from] = EMPTY
+            position.hash_key ^= PIECE_HASH_KEYS[BLACK_ROOK][MAILBOX_TO_STANDARD[rook_from]]
 
-            position.black_pieces[position.black_pieces.index(castled_pos[0])] = castled_pos[1]
+            move_piece(position, 1, rook_from, rook_to)
 
     # Promotion move
     elif move_type == MOVE_TYPE_PROMOTION:
@@ -240,35 +314,17 @@ def make_move(position, move):
     position.board[from_square] = EMPTY
     position.hash_key ^= PIECE_HASH_KEYS[selected][MAILBOX_TO_STANDARD[from_square]]
 
-    if position.side == 0:
-        position.white_pieces[position.white_pieces.index(from_square)] = to_square
-        if get_is_capture(move):
-            position.hash_key ^= PIECE_HASH_KEYS[occupied][MAILBOX_TO_STANDARD[to_square]]
-            position.black_pieces.remove(to_square)
-    else:
-        position.black_pieces[position.black_pieces.index(from_square)] = to_square
-        if get_is_capture(move):
-            position.hash_key ^= PIECE_HASH_KEYS[occupied][MAILBOX_TO_STANDARD[to_square]]
-            position.white_pieces.remove(to_square)
+    # The captured piece is removed first, since the moving piece takes over its piece_index entry
+    if get_is_capture(move):
+        position.hash_key ^= PIECE_HASH_KEYS[occupied][MAILBOX_TO_STANDARD[to_square]]
+        remove_piece(position, position.side ^ 1, to_square)
 
-    # Change the king position for check detection
+    move_piece(position, position.side, from_square, to_square)
+
+    # Change the king position, the move generator finds the checks and pins from it
     if selected == WHITE_KING or selected == BLACK_KING:
         position.king_positions[position.side] = to_square
 
-    # Legal move checking.
-    # Return False if we are in check after our move or castling isn't legal.
-    if is_attacked(position, position.king_positions[position.side]):
-        return False
-    elif castled_pos[0]:
-        # If we have castled, then we already checked to_square with is_attacked since the king moved.
-        # We then check the position of where the rook would be, and also where the king originally was
-        if is_attacked(position, castled_pos[1]):
-            return False
-        elif is_attacked(position, from_square):
-            return False
-
-    # --- The move is legal ---
-
     # Double pawn push
     if (selected == WHITE_PAWN or selected == BLACK_PAWN) and abs(to_square - from_square) == 20:
         if position.ep_square:
@@ -293,14 +349,14 @@ def make_move(position, move):
         position.castle_ability_bits &= ~(1 << 2)
         position.castle_ability_bits &= ~(1 << 3)
 
-    # Update the castling rights if necessary
-    if from_square == H1:
+    # Update the castling rights if necessary, when a rook leaves its corner or is captured on it
+    if from_square == H1 or to_square == H1:
         position.castle_ability_bits &= ~(1 << 0)
-    elif from_square == A1:
+    if from_square == A1 or to_square == A1:
         position.castle_ability_bits &= ~(1 << 1)
-    if to_square == H8:
+    if from_square == H8 or to_square == H8:
         position.castle_ability_bits &= ~(1 << 2)
-    elif to_square == A8:
+    if from_square == A8 or to_square == A8:
         position.castle_ability_bits &= ~(1 << 3)
 
     # After that we re-add the castling right hash
@@ -309,8 +365,6 @@ def make_move(position, move):
     # Switch hash side (actual side is switched in loop)
     position.hash_key ^= SIDE_HASH_KEY
 
-    return True
-
 
 # @nb.njit(nb.void(Position.class_type.instance_type, MOVE_TYPE, nb.int8, nb.uint8, nb.uint64), cache=True)
 @nb.njit(cache=True)
@@ -319,6 +373,9 @@ def undo_move(position, move, current_ep, current_castle_ability_bits, current_h
     # Restore hash
     position.hash_key = current_hash_key
 
+    # Toggling the bits of the move again restores the bitboards
+    toggle_move(position, move)
+
     # Get move info
     from_square = get_from_square(move)
     to_square = get_to_square(move)
@@ -331,10 +388,10 @@ def undo_move(position, move, current_ep, current_castle_ability_bits, current_h
         # Place the en passant captured pawn back and hash it
         if position.side == 0:
             position.board[to_square + 10] = BLACK_PAWN
-            position.black_pieces.append(to_square + 10)
+            add_piece(position, 1, to_square + 10)
         else:
             position.board[to_square - 10] = WHITE_PAWN
-            position.white_pieces.append(to_square - 10)
+            add_piece(position, 0, to_square - 10)
 
     # Castling move
     if move_type == MOVE_TYPE_CASTLE:
@@ -345,11 +402,11 @@ def undo_move(position, move, current_ep, current_castle_ability_bits, current_h
             if position.side == 0:
                 # Move the rook back
                 position.board[to_square - 2] = WHITE_ROOK
-                position.white_pieces[position.white_pieces.index(from_square - 1)] = to_square - 2
+                move_piece(position, 0, from_square - 1, to_square - 2)
             else:
                 # Move the rook back
                 position.board[to_square - 2] = BLACK_ROOK
-                position.black_pieces[position.black_pieces.index(from_square - 1)] = to_square - 2
+                move_piece(position, 1, from_square - 1, to_square - 2)
         # King side castle
         else:
             # Remove the rook from the destination square
@@ -357,20 +414,16 @@ def undo_move(position, move, current_ep, current_castle_ability_bits, current_h
             if position.side == 0:
                 # Move the rook back
                 position.board[to_square + 1] = WHITE_ROOK
-                position.white_pieces[position.white_pieces.index(from_square + 1)] = to_square + 1
+                move_piece(position, 0, from_square + 1, to_square + 1)
             else:
                 # Move the rook back
                 position.board[to_square + 1] = BLACK_ROOK
-                position.black_pieces[position.black_pieces.index(from_square + 1)] = to_square + 1
+                move_piece(position, 1, from_square + 1, to_square + 1)
 
-    if position.side == 0:
-        position.white_pieces[position.white_pieces.index(to_square)] = from_square
-        if get_is_capture(move):
-            position.black_pieces.append(to_square)
-    else:
-        position.black_pieces[position.black_pieces.index(to_square)] = from_square
-        if get_is_capture(move):
-            position.white_pieces.append(to_square)
+    # The moving piece is moved back first, since the captured piece takes over its piece_index entry
+    move_piece(position, position.side, to_square, from_square)
+    if get_is_capture(move):
+        add_piece(position, position.side ^ 1, to_square)
 
     # Place occupied piece/value back in the destination square
     # Set the source square back to the selected piece
@@ -410,65 +463,71 @@ def undo_null_move(position, current_ep, current_hash_key):
     position.hash_key = current_hash_key
 
 
-# @nb.njit(nb.void(Position.class_type.instance_type, nb.types.unicode_type), cache=True)
+# @nb.njit(nb.void(Position.class_type.instance_type, nb.uint8[:], nb.uint8, nb.int8, nb.uint8), cache=True)
 @nb.njit(cache=True)
-def parse_fen(position, fen_string):
+def load_position(position, board, castle_ability_bits, ep_square, side):
     reset_position(position)
 
+    # -- board and piece lists --
+    for pos in range(120):
+        piece = board[pos]
+        position.board[pos] = piece
+
+        if piece < BLACK_PAWN:
+            add_piece(position, 0, pos)
+            toggle_piece(position.bitboards, position.occupancy, piece, pos)
+        elif piece < EMPTY:
+            add_piece(position, 1, pos)
+            toggle_piece(position.bitboards, position.occupancy, piece, pos)
+
+        if piece == WHITE_KING:
+            position.king_positions[0] = pos
+        elif piece == BLACK_KING:
+            position.king_positions[1] = pos
+
+    position.castle_ability_bits = castle_ability_bits
+    position.ep_square = ep_square
+    position.side = side
+
+    position.hash_key = compute_hash(position)
+
+
+# The fen string is parsed in python, since Numba's string functions take many seconds to compile,
+# and the result is loaded into the position by load_position.
+def parse_fen(position, fen_string):
     fen_list = fen_string.strip().split()
     fen_board = fen_list[0]
     turn = fen_list[1]
 
     # -- boundaries for 12x10 mailbox --
-    pos = 21
-    for i in range(21):
-        position.board[i] = PADDING
+    board = np.full(120, PADDING, dtype=np.uint8)
 
     # -- parse board --
+    pos = 21
     for i in fen_board:
         if i == "/":
-            position.board[pos] = PADDING
-            position.board[pos + 1] = PADDING
             pos += 2
         elif i.isdigit():
             for j in range(ord(i) - 48):
-                position.board[pos] = EMPTY
+                board[pos] = EMPTY
                 pos += 1
         elif i.isalpha():
             idx = 0
             if i.islower():
                 idx = 6
-            piece = i.upper()
-            for j, p in enumerate(PIECE_MATCHER):
-                if piece == p:
-                    idx += j
-            position.board[pos] = idx
-
-            if idx < BLACK_PAWN:
-                position.white_pieces.append(pos)
-            else:
-                position.black_pieces.append(pos)
-
-            if i == 'K':
-                position.king_positions[0] = pos
-            elif i == 'k':
-                position.king_positions[1] = pos
+            board[pos] = idx + PIECE_MATCHER.index(i.upper())
             pos += 1
 
-    # -- boundaries for 12x10 mailbox --
-    for i in range(21):
-        position.board[pos + i] = PADDING
-
-    position.castle_ability_bits = 0
+    castle_ability_bits = 0
     for i in fen_list[2]:
         if i == "K":
-            position.castle_ability_bits |= 1
+            castle_ability_bits |= 1
         elif i == "Q":
-            position.castle_ability_bits |= 2
+            castle_ability_bits |= 2
         elif i == "k":
-            position.castle_ability_bits |= 4
+            castle_ability_bits |= 4
         elif i == "q":
-            position.castle_ability_bits |= 8
+            castle_ability_bits |= 8
 
     # -- en passant square --
     if len(fen_list[3]) > 1:
@@ -476,15 +535,15 @@ def parse_fen(position, fen_string):
 
         square = square[0] * 8 + square[1]
 
-        position.ep_square = STANDARD_TO_MAILBOX[square]
+        ep_square = STANDARD_TO_MAILBOX[square]
     else:
-        position.ep_square = 0
+        ep_square = 0
 
-    position.side = 0
+    side = 0
     if turn == "b":
-        position.side = 1
+        side = 1
 
-    position.hash_key = compute_hash(position)
+    load_position(position, board, castle_ability_bits, ep_square, side)
 
 
 # @nb.njit(nb.types.unicode_type(Position.class_type.instance_type), cache=True)
@@ -1,4 +1,3 @@
-import numba.core.types.containers
 import numpy as np
 import numba as nb
 from numba import njit
@@ -6,14 +5,19 @@ from numba.core import types
 from numba.experimental import jitclass
 from numba.experimental import structref
 
+import cache_manager  # noqa: F401, installs the engine's cache locator before anything is jitted
+
 # from numba.typed import List
 
 # Numba's experimental Jitclasses require info on the attributes of the class
 position_spec = [
-    ("board", nb.uint8[:]),
-    ("white_pieces", numba.types.List(nb.int64)),
-    ("black_pieces", numba.types.List(nb.int64)),
-    ("king_positions", nb.uint8[:]),
+    ("board", nb.uint8[::1]),
+    ("piece_list", nb.uint8[:, ::1]),     # per side, the squares of its pieces in the first piece_count entries
+    ("piece_count", nb.uint8[::1]),
+    ("piece_index", nb.uint8[::1]),       # per square, the index of its piece in the piece list of its side
+    ("bitboards", nb.uint64[::1]),        # per piece, the standard squares (bitboard.py) it stands on
+    ("occupancy", nb.uint64[::1]),        # per side, the squares of its pieces
+    ("king_positions", nb.uint8[::1]),
     ("castle_ability_bits", nb.uint8),
     ("ep_square", nb.int8),  # Cannot be u-ints because we do subtraction on it
     ("side", nb.uint8),
@@ -25,8 +29,11 @@ position_spec = [
 class Position:
     def __init__(self):
         self.board = np.zeros(120, dtype=np.uint8)
-        self.white_pieces = [nb.int64(1) for _ in range(0)]
-        self.black_pieces = [nb.int64(1) for _ in range(0)]
+        self.piece_list = np.zeros((2, 16), dtype=np.uint8)
+        self.piece_count = np.zeros(2, dtype=np.uint8)
+        self.piece_index = np.zeros(120, dtype=np.uint8)
+        self.bitboards = np.zeros(12, dtype=np.uint64)
+        self.occupancy = np.zeros(2, dtype=np.uint64)
         self.king_positions = np.zeros(2, dtype=np.uint8)
         self.castle_ability_bits = 0
         self.ep_square = 0
@@ -42,26 +49,41 @@ class PositionStructType(types.StructRef):
 
 class PositionStruct(structref.StructRefProxy):
     def __new__(cls, board,
-                white_pieces,
-                black_pieces,
+                piece_list,
+                piece_count,
+                piece_index,
+                bitboards,
+                occupancy,
                 king_positions,
                 castle_ability_bits,
                 ep_square, side, hash_key):
 
-        return structref.StructRefProxy.__new__(cls, board, white_pieces, black_pieces,
-            king_positions, castle_ability_bits, ep_square, side, hash_key)
+        return structref.StructRefProxy.__new__(cls, board, piece_list, piece_count, piece_index,
+            bitboards, occupancy, king_positions, castle_ability_bits, ep_square, side, hash_key)
 
     @property
     def board(self):
         return PositionStruct_get_board(self)
 
     @property
-    def white_pieces(self):
-        return PositionStruct_get_white_pieces(self)
+    def piece_list(self):
+        return PositionStruct_get_piece_list(self)
+
+    @property
+    def piece_count(self):
+        return PositionStruct_get_piece_count(self)
+
+    @property
+    def piece_index(self):
+        return PositionStruct_get_piece_index(self)
 
     @property
-    def black_pieces(self):
-        return PositionStruct_get_black_pieces(self)
+    def bitboards(self):
+        return PositionStruct_get_bitboards(self)
+
+    @property
+    def occupancy(self):
+        return PositionStruct_get_occupancy(self)
 
     @property
     def king_positions(self):
@@ -90,13 +112,28 @@ def PositionStruct_get_board(self):
 
 
 @njit(cache=True)
-def PositionStruct_get_white_pieces(self):
-    return self.white_pieces
+def PositionStruct_get_piece_list(self):
+    return self.piece_list
 
 
 @njit(cache=True)
-def PositionStruct_get_black_pieces(self):
-    return self.black_pieces
+def PositionStruct_get_piece_count(self):
+    return self.piece_count
+
+
+@njit(cache=True)
+def PositionStruct_get_piece_index(self):
+    return self.piece_index
+
+
+@njit(cache=True)
+def PositionStruct_get_bitboards(self):
+    return self.bitboards
+
+
+@njit(cache=True)
+def PositionStruct_get_occupancy(self):
+    return self.occupancy
 
 
 @njit(cache=True)
@@ -129,15 +166,21 @@ def PositionStruct_set_side(position, s):
     position.side = s
 
 
-structref.define_proxy(PositionStruct, PositionStructType, ["board", "white_pieces", "black_pieces",
+structref.define_proxy(PositionStruct, PositionStructType, ["board", "piece_list", "piece_count", "piece_index",
+                                                            "bitboards", "occupancy",
                                                             "king_positions", "castle_ability_bits",
                                                             "ep_square", "side", "hash_key"])
 
+# The concrete type of a PositionStruct instance, used for explicit signatures
+POSITION_STRUCT_TYPE = PositionStructType(position_spec)
+
 
 @njit(cache=True)
 def init_position():
     position = PositionStruct(np.zeros(120, dtype=np.uint8),
-                              [nb.int64(1) for _ in range(0)], [nb.int64(1) for _ in range(0)],
+                              np.zeros((2, 16), dtype=np.uint8), np.zeros(2, dtype=np.uint8),
+                              np.zeros(120, dtype=np.uint8),
+                              np.zeros(12, dtype=np.uint64), np.zeros(2, dtype=np.uint64),
                               np.zeros(2, dtype=np.uint8), nb.uint8(0), nb.int8(0), nb.uint8(0), nb.uint64(0))
 
     return position
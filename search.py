@@ -16,7 +16,9 @@ from transposition import *
 
 from position_class import PositionStruct_set_side
 from search_class import SearchStruct_set_max_depth, SearchStruct_set_max_time, SearchStruct_set_start_time, \
-                         SearchStruct_set_current_search_depth
+                         SearchStruct_set_current_search_depth, allocate_transposition_table, \
+                         get_tt_bucket_count, SearchStruct_set_max_nodes, SearchStruct_set_max_mate, \
+                         SearchStruct_set_multipv_index, SearchStruct_set_verbose, SearchStruct_set_soft_time
 
 
 # @nb.njit(nb.float64(), cache=True)
@@ -42,23 +44,55 @@ def reset_search(engine):
     engine.killer_moves = np.zeros((2, engine.max_depth), dtype=np.uint32)
     engine.history_moves = np.zeros((12, 64), dtype=np.uint32)
 
+    # Entries not used since a few searches become the first to be replaced
+    engine.tt_generation = (engine.tt_generation + 1) & 0xFF
+    engine.tt_probes = 0
+    engine.tt_hits = 0
+
+    engine.picker_nodes = 0
+    engine.capture_generations = 0
+    engine.quiet_generations = 0
+
     engine.stopped = False
 
 
 # @nb.njit(nb.void(Search.class_type.instance_type), cache=True)
 @nb.njit(cache=True)
-def new_game(engine):
+def new_game(engine, clear_table=True):
     reset_search(engine)
-    engine.repetition_table = np.zeros(REPETITION_TABLE_SIZE, dtype=np.uint64)
+    engine.repetition_table[:] = 0
     engine.repetition_index = 0
-    engine.transposition_table = np.zeros(MAX_HASH_SIZE, dtype=NUMBA_HASH_TYPE)
+
+    if clear_table:
+        clear_tt(engine)
+
+
+@nb.njit(cache=True)
+def set_hash_size(engine, megabytes):
+    # The old table is released first, so the memory used never reaches the old and new sizes together
+    engine.transposition_table = allocate_transposition_table(1)
+    engine.transposition_table = allocate_transposition_table(get_tt_bucket_count(megabytes))
 
 
 # @nb.njit(nb.void(Search.class_type.instance_type), cache=True)
 @nb.njit(cache=True)
 def update_search(engine):
+    # 'go nodes' is a hard limit, also in the first iterations, so it stays within 1024 nodes of the limit
+    if engine.max_nodes and engine.node_count >= engine.max_nodes:
+        engine.stopped = True
+        return
+
+    # The first iterations always finish otherwise, so there is a move to return
+    if engine.current_search_depth < engine.min_depth:
+        return
+
+    # The stop flag is set by the uci thread or the main lazy SMP process, checked before the clock as it costs a load
+    if engine.stop_flag[0]:
+        engine.stopped = True
+        return
+
     elapsed_time = 1000 * (get_time() - engine.start_time)
-    if elapsed_time >= engine.max_time and engine.current_search_depth >= engine.min_depth:
+    if elapsed_time >= engine.max_time:
         engine.stopped = True
 
 
@@ -72,9 +106,125 @@ def detect_repetition(engine, position):
     return False
 
 
+@nb.njit(cache=True)
+def is_search_move(engine, move):
+    if not engine.search_move_count:
+        return True
+
+    for i in range(engine.search_move_count):
+        if engine.search_moves[i] == move:
+            return True
+
+    return False
+
+
+@nb.njit(cache=True)
+def init_root_moves(engine, position):
+    """
+    Fills the root move list with the legal moves, sorted like the moves of any other node.
+    With 'go searchmoves', only the legal moves among the search moves are kept.
+    """
+
+    moves = engine.move_stack[0]
+    move_scores = engine.score_stack[0]
+
+    move_count = get_legal_moves(position, moves)
+    get_move_scores(engine, moves, move_scores, move_count, probe_tt_move(engine, position))
+
+    root_move_count = 0
+    for current_move_index in range(move_count):
+        sort_next_move(moves, move_scores, current_move_index, move_count)
+        move = moves[current_move_index]
+
+        if is_search_move(engine, move):
+            engine.root_moves[root_move_count] = move
+            engine.root_scores[root_move_count] = -INF
+            engine.root_nodes[root_move_count] = 0
+            engine.root_pv_lengths[root_move_count] = 0
+            root_move_count += 1
+
+    engine.root_move_count = root_move_count
+    engine.multipv_index = 0
+
+
+@nb.njit(cache=True)
+def get_root_moves(engine, moves, move_scores):
+    """Writes the root moves left for the current pv line with equal scores to keep their order, returns their count."""
+
+    move_count = 0
+    for i in range(engine.multipv_index, engine.root_move_count):
+        moves[move_count] = engine.root_moves[i]
+        move_scores[move_count] = 0
+        move_count += 1
+
+    return move_count
+
+
+@nb.njit(cache=True)
+def update_root_move(engine, root_index, move, nodes, score):
+    """
+    Records the search of a root move. A move that raised alpha is the new best move of the node,
+    its pv is the move followed by the pv of the next ply.
+    """
+    engine.root_nodes[root_index] = nodes
+    engine.root_scores[root_index] = score
+
+    if score != -INF:
+        pv_length = min(max(engine.pv_length[1], 1), engine.root_pvs.shape[1])
+
+        engine.root_pvs[root_index][0] = move
+        for next_ply in range(1, pv_length):
+            engine.root_pvs[root_index][next_ply] = engine.pv_table[1][next_ply]
+
+        engine.root_pv_lengths[root_index] = pv_length
+
+
+@nb.njit(cache=True)
+def sort_root_moves(engine):
+    """
+    Sorts the root moves left for the current pv line by their last score, then by the nodes of their last search.
+    The best move comes first, followed by the moves that were best for a while before it, then by the moves
+    that took the most effort to refute, as those are the likeliest to become best at the next depth.
+    An insertion sort keeps the order of equal moves and is quick on a list that is mostly sorted already.
+    """
+    for i in range(engine.multipv_index + 1, engine.root_move_count):
+        move = engine.root_moves[i]
+        score = engine.root_scores[i]
+        nodes = engine.root_nodes[i]
+        pv = engine.root_pvs[i].copy()
+        pv_length = engine.root_pv_lengths[i]
+
+        j = i
+        while j > engine.multipv_index and (engine.root_scores[j - 1] < score or
+                                            (engine.root_scores[j - 1] == score and engine.root_nodes[j - 1] < nodes)):
+            engine.root_moves[j] = engine.root_moves[j - 1]
+            engine.root_scores[j] = engine.root_scores[j - 1]
+            engine.root_nodes[j] = engine.root_nodes[j - 1]
+            engine.root_pvs[j] = engine.root_pvs[j - 1]
+            engine.root_pv_lengths[j] = engine.root_pv_lengths[j - 1]
+            j -= 1
+
+        engine.root_moves[j] = move
+        engine.root_scores[j] = score
+        engine.root_nodes[j] = nodes
+        engine.root_pvs[j] = pv
+        engine.root_pv_lengths[j] = pv_length
+
+
+@nb.njit(cache=True)
+def report_current_move(engine, move, move_number):
+    # Only printed after a while, so short searches don't flood the gui
+    if 1000 * (get_time() - engine.start_time) >= CURRMOVE_DELAY:
+        depth = engine.current_search_depth
+
+        with nb.objmode():
+            print("info depth", depth, "currmove", get_uci_from_move(move), "currmovenumber", move_number)
+
+
 # @nb.njit(SCORE_TYPE(Search.class_type.instance_type,
 # |                    Position.class_type.instance_type, SCORE_TYPE, SCORE_TYPE, nb.int8))
-@nb.njit(cache=False)
+# nogil lets the uci thread read commands while the search runs, get_time takes the gil back for a moment
+@nb.njit(cache=True, nogil=True)
 def qsearch(engine, position, alpha, beta, depth):
 
     # Update the search progress every 1024 nodes
@@ -107,7 +257,9 @@ def qsearch(engine, position, alpha, beta, depth):
     if static_eval >= beta:
         return static_eval
 
-    if depth == 0:
+    # The moves of each qsearch ply go to the rows of the move stack after the ply of the negamax node it started from
+    stack_index = engine.ply + engine.max_qdepth - depth
+    if depth == 0 or stack_index >= MAX_PLY:
         return static_eval
 
     # Using a variable to record the hash flag
@@ -121,17 +273,19 @@ def qsearch(engine, position, alpha, beta, depth):
     # If our static evaluation has improved after the last move.
     alpha = max(alpha, static_eval)
 
-    # Retrieving all pseudo legal captures as a list of [Move class]
-    moves = get_pseudo_legal_captures(position)
+    # Retrieving all legal captures into the move stack
+    moves = engine.move_stack[stack_index]
+    move_scores = engine.score_stack[stack_index]
 
-    move_scores = get_capture_scores(moves, tt_move)
+    move_count = get_legal_captures(position, moves)
+    get_capture_scores(moves, move_scores, move_count, tt_move)
 
     best_score = static_eval
     best_move = NO_MOVE
 
     # Iterate through the noisy moves (captures) and search recursively with qsearch (quiescence search)
-    for current_move_index in range(len(moves)):
-        sort_next_move(moves, move_scores, current_move_index)
+    for current_move_index in range(move_count):
+        sort_next_move(moves, move_scores, current_move_index, move_count)
         move = moves[current_move_index]
 
         # Delta / Futility pruning
@@ -141,11 +295,7 @@ def qsearch(engine, position, alpha, beta, depth):
             continue
 
         # Make the capture
-        attempt = make_move(position, move)
-        if not attempt:
-            undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
-            continue
-
+        make_move(position, move)
         position.side ^= 1
 
         return_eval = -qsearch(engine, position, -beta, -alpha, depth - 1)
@@ -176,7 +326,7 @@ def qsearch(engine, position, alpha, beta, depth):
 
 # @nb.njit(SCORE_TYPE(Search.class_type.instance_type,
 # |                   Position.class_type.instance_type, SCORE_TYPE, SCORE_TYPE, nb.int8))
-@nb.njit(cache=False)
+@nb.njit(cache=True, nogil=True)
 def negamax(engine, position, alpha, beta, depth, do_null):
 
     # Initialize PV length
@@ -188,8 +338,9 @@ def negamax(engine, position, alpha, beta, depth, do_null):
         return 0
 
     # Start quiescence search at the end of regular negamax search to counter the horizon effect.
-    if depth == 0:
-        return qsearch(engine, position, alpha, beta, engine.max_qdepth)
+    # The per ply tables hold max_depth plies, so check extensions can't go past it.
+    if depth == 0 or engine.ply >= engine.max_depth:
+        return qsearch(engine, position, alpha, beta, nb.int64(engine.max_qdepth))
 
     # Increase node count after checking for terminal nodes since that would be counting double
     # nodes with quiescent search
@@ -208,18 +359,13 @@ def negamax(engine, position, alpha, beta, depth, do_null):
         depth += 1
 
     # Get a value from probe_tt_entry that will correspond to either returning a score immediately
-    # or returning no hash entry, or returning move int to sort
-    tt_value = probe_tt_entry(engine, position, alpha, beta, depth)
+    # or returning no hash entry, or returning move int to sort.
+    # The root is not probed, it always searches its moves from the root move list.
+    tt_value = probe_tt_entry(engine, position, alpha, beta, depth) if engine.ply else NO_HASH_ENTRY
     tt_move = NO_MOVE
 
     # A score was given to return
     if tt_value < NO_HASH_ENTRY:
-
-        if not engine.ply:
-            move = engine.transposition_table[position.hash_key % MAX_HASH_SIZE].move
-            engine.pv_table[0][0] = move
-            engine.pv_length[0] = 1
-
         return tt_value
 
     # Use a tt entry move to sort moves
@@ -269,7 +415,8 @@ def negamax(engine, position, alpha, beta, depth, do_null):
         # engine.repetition_table[engine.repetition_index] = position.hash_key
 
         # We will reduce the depth since the opponent gets two moves in a row to improve their position
-        return_eval = -negamax(engine, position, -beta, -beta + 1, depth - 1 - reduction, False)
+        # nb.boolean() drops the literal type of the flag, which would otherwise compile a second overload.
+        return_eval = -negamax(engine, position, -beta, -beta + 1, depth - 1 - reduction, nb.boolean(False))
         engine.ply -= 1
         # engine.repetition_index -= 1
 
@@ -279,38 +426,53 @@ def negamax(engine, position, alpha, beta, depth, do_null):
         if return_eval >= beta:
             return beta
 
-    # Retrieving the pseudo legal moves in the current position as a list of integers
-    # Score the moves
-    moves = get_pseudo_legal_moves(position)
-    move_scores = get_move_scores(engine, moves, tt_move)
+    # The moves are picked in stages into the row of the ply in the move stack, no memory is allocated per node.
+    # The root searches the root move list.
+    moves = engine.move_stack[engine.ply]
+    move_scores = engine.score_stack[engine.ply]
+
+    if engine.ply:
+        stage = STAGE_TT_MOVE
+        move_count = 0
+    else:
+        stage = STAGE_ROOT_MOVES
+        move_count = get_root_moves(engine, moves, move_scores)
+
+    # nb.int64() drops the literal type of the index, which would otherwise compile a second overload of the picker
+    move_index = nb.int64(0)
 
     raised_alpha = False
 
+    # The root index and the node count before the search of a root move
+    root_index = 0
+    root_nodes = engine.node_count
+
     # Best move to save for TT
     best_move = NO_MOVE
     best_score = -INF
 
     # Iterate through moves and recursively search with Negamax
-    for current_move_index in range(len(moves)):
+    while True:
 
-        # Sort the next move. If an early move causes a cutoff then we have saved time
-        # by only sorting one or a few moves rather than the whole list.
-        sort_next_move(moves, move_scores, current_move_index)
-        move = moves[current_move_index]
+        # Pick the next move. If an early move causes a cutoff then we have saved time
+        # by only generating and sorting the moves up to it.
+        move, stage, move_index, move_count = pick_next_move(engine, position, moves, move_scores,
+                                                             stage, move_index, move_count, tt_move)
+        if move == NO_MOVE:
+            break
 
-        if current_move_index == 0:
+        if legal_moves == 0:
             best_move = move
 
-        # Make the move
-        attempt = make_move(position, move)
+        if not engine.ply:
+            root_index = engine.multipv_index + legal_moves
+            root_nodes = engine.node_count
 
-        # The move put us in check, therefore it was not legal, and we must disregard it
-        if not attempt:
-            undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
-            continue
+            if engine.verbose:
+                report_current_move(engine, move, root_index + 1)
 
-        # We proceed since the move is legal
-        # Flip the position for the opposing player
+        # Make the move, and flip the position for the opposing player
+        make_move(position, move)
         position.side ^= 1
 
         # increase ply and repetition index
@@ -330,31 +492,33 @@ def negamax(engine, position, alpha, beta, depth, do_null):
                 and get_move_type(move) == 0                                                \
                 and not get_is_capture(move):
 
-            reduction = math.sqrt(depth) * 0.5 + math.sqrt(legal_moves) * 0.55 - 0.3
+            # The float is kept in its own variable so that reduction (and therefore the depth passed
+            # to negamax) stays an integer; the recursive call must keep a single signature to be cached.
+            lmr_reduction = math.sqrt(depth) * 0.5 + math.sqrt(legal_moves) * 0.55 - 0.3
 
-            reduction -= pv_node
+            lmr_reduction -= pv_node
 
-            reduction -= is_killer_move
+            lmr_reduction -= is_killer_move
 
-            reduction -= engine.history_moves[get_selected(move)][MAILBOX_TO_STANDARD[get_to_square(move)]] / 20000
+            lmr_reduction -= engine.history_moves[get_selected(move)][MAILBOX_TO_STANDARD[get_to_square(move)]] / 20000
 
             # We don't want to go straight to quiescence search from LMR.
-            reduction = min(depth - 2, max(1, int(reduction)))
+            reduction = min(depth - 2, max(1, int(lmr_reduction)))
 
         # PVS
         if legal_moves == 0:
-            return_eval = -negamax(engine, position, -beta, -alpha, depth - reduction - 1, True)
+            return_eval = -negamax(engine, position, -beta, -alpha, depth - reduction - 1, nb.boolean(True))
         else:
-            return_eval = -negamax(engine, position, -alpha - 1, -alpha, depth - reduction - 1, True)
+            return_eval = -negamax(engine, position, -alpha - 1, -alpha, depth - reduction - 1, nb.boolean(True))
 
         # The move was actually good, so we can try a zero window search at full depth
         if return_eval > alpha and reduction and legal_moves != 0:
-            return_eval = -negamax(engine, position, -alpha - 1, -alpha, depth - 1, True)
+            return_eval = -negamax(engine, position, -alpha - 1, -alpha, depth - 1, nb.boolean(True))
 
         # Either the full depth zero window search returned above alpha, or
         # The reduced alpha - beta window search returned above alpha
         if return_eval > alpha and reduction:
-            return_eval = -negamax(engine, position, -beta, -alpha, depth - 1, True)
+            return_eval = -negamax(engine, position, -beta, -alpha, depth - 1, nb.boolean(True))
 
         # Decrease the ply and repetition index
         engine.ply -= 1
@@ -368,6 +532,11 @@ def negamax(engine, position, alpha, beta, depth, do_null):
         if engine.stopped:
             return 0
 
+        # The root move list keeps the effort and the result of each move to order the next search
+        if not engine.ply:
+            update_root_move(engine, root_index, move, engine.node_count - root_nodes,
+                             return_eval if return_eval > alpha else -INF)
+
         # The move is better than other moves searched
         if return_eval > best_score:
             best_score = return_eval
@@ -401,7 +570,7 @@ def negamax(engine, position, alpha, beta, depth, do_null):
                         engine.killer_moves[1][engine.ply] = engine.killer_moves[0][engine.ply]
                         engine.killer_moves[0][engine.ply] = move
 
-                    if -MATE_SCORE < best_score < MATE_SCORE:
+                    if -MATE_SCORE < best_score < MATE_SCORE and engine.ply:
                         record_tt_entry(engine, position, best_score, HASH_FLAG_BETA, best_move, depth)
 
                     return best_score
@@ -416,7 +585,8 @@ def negamax(engine, position, alpha, beta, depth, do_null):
     elif legal_moves == 0 and in_check:
         return -MATE_SCORE - depth
 
-    if -MATE_SCORE < best_score < MATE_SCORE:
+    # The root isn't recorded, with MultiPV its score leaves out the moves of the previous pv lines
+    if -MATE_SCORE < best_score < MATE_SCORE and engine.ply:
         record_tt_entry(engine, position, best_score, tt_hash_flag, best_move, depth)
 
     # We return our best score possible. This is an 'All node' and we have failed low
@@ -426,7 +596,7 @@ def negamax(engine, position, alpha, beta, depth, do_null):
 # An iterative search approach to negamax
 # @nb.njit(nb.void(Search.class_type.instance_type, Position.class_type.instance_type, nb.boolean), cache=True)
 # @nb.njit(cache=False)
-def iterative_search(engine, position, compiling):
+def iterative_search(engine, position, compiling, start_depth=1):
 
     # engine.start_time = get_time()
     SearchStruct_set_start_time(engine, get_time())
@@ -436,50 +606,75 @@ def iterative_search(engine, position, compiling):
 
     original_side = position.side
 
+    # The legal moves of the root, kept in order of their last search
+    init_root_moves(engine, position)
+    SearchStruct_set_verbose(engine, not compiling)
+
+    # With MultiPV, each iteration searches the root once per pv line, leaving out the best moves of the lines before.
+    # Every line keeps its own aspiration window, pv and score.
+    line_count = max(1, min(engine.multi_pv, engine.root_move_count))
+
     # Prepare window for negamax search
-    alpha = -INF
-    beta = INF
+    line_windows = [(-INF, INF) for _ in range(line_count)]
+    line_pvs = [["" for _ in range(0)] for _ in range(line_count)]
+    line_scores = [0 for _ in range(line_count)]
 
-    running_depth = 1
+    # The helper searches of lazy SMP (smp.py) start at staggered depths
+    running_depth = start_depth
 
     best_pv = ["" for _ in range(0)]
     best_score = 0
 
-    average_branching_factor = 1
-    prev_node_count = 1
-    full_searches = 0  # These are the number of searches that aren't returned from TT immediately.
+    # The iterations the best move has stayed the best, and its score on the last one, for the time manager.
+    # The move is the one reported, the first move of best_pv.
+    best_move = ""
+    best_move_stability = 0
+    previous_score = 0
 
     while running_depth <= engine.max_depth:
-
         # Reset engine variables
         # engine.current_search_depth = running_depth
         SearchStruct_set_current_search_depth(engine, running_depth)
 
-        # Negamax search
-        returned = negamax(engine, position, alpha, beta, running_depth, False)
+        for line in range(line_count):
+            SearchStruct_set_multipv_index(engine, line)
 
-        # Reset the window
-        if returned <= alpha or returned >= beta:
-            alpha = -INF
-            beta = INF
-            continue
+            # Negamax search
+            alpha, beta = line_windows[line]
+            returned = negamax(engine, position, alpha, beta, running_depth, False)
+
+            # Reset the window
+            if (returned <= alpha or returned >= beta) and not engine.stopped:
+                returned = negamax(engine, position, -INF, INF, running_depth, False)
+
+            if engine.stopped:
+                break
+
+            # Adjust aspiration window
+            line_windows[line] = (returned - ASPIRATION_VAL, returned + ASPIRATION_VAL)
+
+            # The best move of the line comes first, the next lines search the root moves after it
+            sort_root_moves(engine)
+
+            # Obtain principle variation line
+            pv_line = []
+            for c in range(engine.root_pv_lengths[line] if engine.root_move_count else 0):
+                pv_line.append(get_uci_from_move(engine.root_pvs[line][c]))
+                # position.side ^= 1
+                PositionStruct_set_side(position, position.side ^ 1)
 
-        # Adjust aspiration window
-        alpha = returned - ASPIRATION_VAL
-        beta = returned + ASPIRATION_VAL
+            # position.side = original_side
+            PositionStruct_set_side(position, original_side)
 
-        # Obtain principle variation line and print it
-        pv_line = []
-        for c in range(engine.pv_length[0]):
-            pv_line.append(get_uci_from_move(engine.pv_table[0][c]))
-            # position.side ^= 1
-            PositionStruct_set_side(position, position.side ^ 1)
+            line_pvs[line] = pv_line
+            line_scores[line] = returned
 
-        # position.side = original_side
-        PositionStruct_set_side(position, original_side)
+        # A line failing low or high can score above the lines before it, so the lines are reported by score,
+        # and the best comes from the first. Lines without a pv, not searched yet, go last.
+        lines = sorted(zip(line_scores, line_pvs), key=lambda entry: (not entry[1], -entry[0]))
 
-        best_pv = pv_line if not engine.stopped and len(pv_line) else best_pv
-        best_score = returned if not engine.stopped else best_score
+        best_score = lines[0][0]
+        best_pv = lines[0][1] if len(lines[0][1]) else best_pv
 
         lapsed_time = get_time() - engine.start_time
 
@@ -487,37 +682,92 @@ def iterative_search(engine, position, compiling):
             running_depth -= 1
 
         if not compiling:
-            print("info depth", running_depth, "score cp", best_score,
-                  "time", int(lapsed_time * 1000), "nodes", engine.node_count,
-                  "nps", int(engine.node_count / max(lapsed_time, 0.0001)), "pv", ' '.join(best_pv))
+            for line in range(line_count):
+                # Without MultiPV the output stays as it always was
+                multipv = ("multipv", line + 1) if line_count > 1 else ()
+                line_score, line_pv = lines[line]
+                line_pv = best_pv if line == 0 else line_pv
+
+                print("info depth", running_depth, *multipv, "score cp", line_score,
+                      "time", int(lapsed_time * 1000), "nodes", engine.node_count,
+                      "nps", int(engine.node_count / max(lapsed_time, 0.0001)), "pv", ' '.join(line_pv))
 
         if engine.stopped:
             break
 
-        if best_score >= MATE_SCORE:
+        # Mates aren't stored in the table, so the pv of a mate score is the whole mating line
+        if best_score >= MATE_SCORE and (not engine.max_mate or (len(best_pv) + 1) // 2 <= engine.max_mate):
             break
 
-        if engine.node_count != running_depth and running_depth > 1:
+        reported_move = best_pv[0] if len(best_pv) else ""
+
+        if reported_move == best_move:
+            best_move_stability += 1
+        else:
+            best_move = reported_move
+            best_move_stability = 0
 
-            if full_searches >= 1:
-                average_branching_factor *= full_searches
-                average_branching_factor += engine.node_count / prev_node_count * 3
-                average_branching_factor /= full_searches + 3
+        # The soft limit is extended while the best move or its score change, and shortened once the best move
+        # is settled and took most of the nodes. Otherwise the search runs to its hard limit, max_time.
+        if engine.soft_time and running_depth > 1:
+            stability_scale = STABILITY_SCALES[min(best_move_stability, len(STABILITY_SCALES) - 1)]
 
-                uncertainty = ((running_depth / (running_depth + 3)) + (full_searches / (full_searches + 2))) / 2
+            root_nodes = engine.root_nodes[:engine.root_move_count].sum()
+            best_move_effort = engine.root_nodes[0] / root_nodes if root_nodes else 0.5
+            effort_scale = 1.5 - best_move_effort
 
-                if average_branching_factor * uncertainty * lapsed_time * 1000 > engine.max_time:
-                    break
+            score_scale = min(max(1 + (previous_score - best_score) / SCORE_DROP_SCALE, 0.75), 2.0)
 
-            full_searches += 1
+            if lapsed_time * 1000 > engine.soft_time * stability_scale * effort_scale * score_scale:
+                break
 
-        prev_node_count = engine.node_count
+        previous_score = best_score
         running_depth += 1
 
-    if not compiling:
-        print("bestmove", best_pv[0])
+    # A node limit can stop the first iteration before it has a pv, the first root move is returned then
+    if not len(best_pv) and engine.root_move_count:
+        best_pv = [get_uci_from_move(engine.root_moves[0])]
+
+    # The caller prints the bestmove, since it may have to wait for a 'ponderhit'
+    return best_pv
 
-    return
+
+# A one ply search picking the legal move with the best material and piece square table evaluation.
+# It compiles in a fraction of the time negamax takes, so it can answer a 'go' while the search is compiling.
+@nb.njit(cache=True)
+def fallback_search(position):
+
+    # Saving information to undo moves successfully.
+    current_ep = position.ep_square
+    current_hash_key = position.hash_key
+    current_castle_ability_bits = position.castle_ability_bits
+
+    best_move = NO_MOVE
+    best_score = -INF
+
+    moves = np.zeros(MAX_MOVES, dtype=np.uint32)
+    for move in moves[:get_legal_moves(position, moves)]:
+
+        make_move(position, move)
+        position.side ^= 1
+        score = -evaluate_pst(position)
+        position.side ^= 1
+
+        undo_move(position, move, current_ep, current_castle_ability_bits, current_hash_key)
+
+        if score > best_score:
+            best_score = score
+            best_move = move
+
+    return best_move, best_score
+
+
+def set_default_limits(engine):
+    SearchStruct_set_max_time(engine, 10)
+    SearchStruct_set_soft_time(engine, 0)
+    SearchStruct_set_max_depth(engine, 30)
+    SearchStruct_set_max_nodes(engine, 0)
+    SearchStruct_set_max_mate(engine, 0)
 
 
 def compile_engine(engine, position):
@@ -527,8 +777,7 @@ def compile_engine(engine, position):
     SearchStruct_set_max_depth(engine, 2)
     SearchStruct_set_max_time(engine, 20)
     iterative_search(engine, position, True)
-    SearchStruct_set_max_time(engine, 10)
-    SearchStruct_set_max_depth(engine, 30)
+    set_default_limits(engine)
 
     return
 
@@ -6,24 +6,47 @@ from numba.core import types
 from numba.experimental import jitclass
 from numba.experimental import structref
 
+# The field order and array layouts match SearchStruct, so the spec also describes its type.
 search_spec = [
     ("max_depth", nb.uint16),
     ("max_qdepth", nb.uint16),
-    ("max_time", nb.uint64),        # seconds
     ("min_depth", nb.uint16),
-    ("current_search_depth", nb.uint16),
-    ("ply", nb.uint16),             # opposite of depth counter
+    ("current_search_depth", nb.int16),
+    ("ply", nb.int16),              # opposite of depth counter
+    ("max_time", nb.uint64),        # milliseconds
+    ("soft_time", nb.uint64),       # milliseconds, no iteration is started after it, 0 for none
+    ("max_nodes", nb.uint64),       # 0 for no node limit
+    ("max_mate", nb.uint16),        # moves, a search for a mate stops once one this short is found, 0 for none
+    ("multi_pv", nb.uint16),        # principal variations searched, set with the uci MultiPV option
     ("start_time", nb.double),
     ("node_count", nb.uint64),
-    ("pv_table", MOVE_TYPE[:, :]),  # implementation of pv and pv scoring comes from TSCP engine
-    ("pv_length", nb.uint16[:]),
-    ("killer_moves", MOVE_TYPE[:, :]),
-    ("history_moves", nb.uint32[:, :]),
-    ("transposition_table", NUMBA_HASH_TYPE[:]),
-    ("repetition_table", nb.uint64[:]),
+    ("pv_table", MOVE_TYPE[:, ::1]),  # implementation of pv and pv scoring comes from TSCP engine
+    ("pv_length", nb.uint16[::1]),
+    ("killer_moves", MOVE_TYPE[:, ::1]),
+    ("history_moves", nb.uint32[:, ::1]),
+    ("transposition_table", types.Array(NUMBA_HASH_TYPE, 1, "C", aligned=False)),
+    ("tt_generation", nb.uint8),    # incremented every search, to age the tt entries
+    ("tt_probes", nb.uint64),
+    ("tt_hits", nb.uint64),
+    ("picker_nodes", nb.uint64),    # nodes whose moves went through the staged move picker
+    ("capture_generations", nb.uint64),     # calls of the capture generator by the picker
+    ("quiet_generations", nb.uint64),       # and of the quiet one, the others were cut off before
+    ("repetition_table", nb.uint64[::1]),
     ("repetition_index", nb.uint16),
-    ("stopped", nb.boolean)
-
+    ("stopped", nb.boolean),
+    ("stop_flag", nb.uint8[::1]),   # set from outside the search to stop it, may be shared between processes
+    ("root_moves", MOVE_TYPE[::1]), # the legal moves at the root, in the order they are searched
+    ("root_move_count", nb.uint16),
+    ("root_scores", SCORE_TYPE[::1]),       # per root move, its last score or -INF if it failed low
+    ("root_nodes", nb.uint64[::1]),         # per root move, the nodes of its last search
+    ("root_pvs", MOVE_TYPE[:, ::1]),        # per root move, its pv the last time it was the best move
+    ("root_pv_lengths", nb.uint16[::1]),
+    ("multipv_index", nb.uint16),   # the root moves before it hold the best moves of the previous pv lines
+    ("search_moves", MOVE_TYPE[::1]), # 'go searchmoves', when there are any the root only searches these
+    ("search_move_count", nb.uint16),
+    ("verbose", nb.boolean),        # prints info currmove lines, only the main search does
+    ("move_stack", MOVE_TYPE[:, ::1]), # per ply, the moves generated by negamax and then by qsearch
+    ("score_stack", SCORE_TYPE[:, ::1]),  # the ordering scores of the moves in move_stack
 ]
 
 
@@ -39,6 +62,10 @@ class Search:
         self.ply = 0
 
         self.max_time = 10000
+        self.soft_time = 0
+        self.max_nodes = 0
+        self.max_mate = 0
+        self.multi_pv = 1
         self.start_time = 0
 
         self.node_count = 0
@@ -51,12 +78,31 @@ class Search:
         # History moves [piece][square]
         self.history_moves = np.zeros((12, 64), dtype=np.uint32)
 
-        self.transposition_table = np.zeros(MAX_HASH_SIZE, dtype=NUMBA_HASH_TYPE)
+        self.transposition_table = np.zeros(get_tt_bucket_count(DEFAULT_HASH_SIZE), dtype=NUMBA_HASH_TYPE)
+        self.tt_generation = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.picker_nodes = 0
+        self.capture_generations = 0
+        self.quiet_generations = 0
 
         self.repetition_table = np.zeros(REPETITION_TABLE_SIZE, dtype=np.uint64)
         self.repetition_index = 0
 
         self.stopped = False
+        self.stop_flag = np.zeros(1, dtype=np.uint8)
+        self.root_moves = np.zeros(MAX_MOVES, dtype=np.uint32)
+        self.root_move_count = 0
+        self.root_scores = np.zeros(MAX_MOVES, dtype=np.int32)
+        self.root_nodes = np.zeros(MAX_MOVES, dtype=np.uint64)
+        self.root_pvs = np.zeros((MAX_MOVES, MAX_SEARCH_DEPTH), dtype=np.uint32)
+        self.root_pv_lengths = np.zeros(MAX_MOVES, dtype=np.uint16)
+        self.multipv_index = 0
+        self.search_moves = np.zeros(MAX_MOVES, dtype=np.uint32)
+        self.search_move_count = 0
+        self.verbose = False
+        self.move_stack = np.zeros((MAX_PLY, MAX_MOVES), dtype=np.uint32)
+        self.score_stack = np.zeros((MAX_PLY, MAX_MOVES), dtype=np.int32)
 
         # self.aspiration_window = 65  # in centi pawns
 
@@ -69,16 +115,22 @@ class SearchStructType(types.StructRef):
 
 class SearchStruct(structref.StructRefProxy):
     def __new__(cls, max_depth, max_qdepth, min_depth,
-                current_search_depth, ply, max_time, start_time, node_count,
+                current_search_depth, ply, max_time, soft_time, max_nodes, max_mate, multi_pv, start_time, node_count,
                 pv_table, pv_length, killer_moves, history_moves,
-                transposition_table, repetition_table, repetition_index,
-                stopped):
+                transposition_table, tt_generation, tt_probes, tt_hits,
+                picker_nodes, capture_generations, quiet_generations,
+                repetition_table, repetition_index, stopped, stop_flag,
+                root_moves, root_move_count, root_scores, root_nodes, root_pvs, root_pv_lengths,
+                multipv_index, search_moves, search_move_count, verbose, move_stack, score_stack):
 
         return structref.StructRefProxy.__new__(cls, max_depth, max_qdepth, min_depth,
-                current_search_depth, ply, max_time, start_time, node_count,
+                current_search_depth, ply, max_time, soft_time, max_nodes, max_mate, multi_pv, start_time, node_count,
                 pv_table, pv_length, killer_moves, history_moves,
-                transposition_table, repetition_table, repetition_index,
-                stopped)
+                transposition_table, tt_generation, tt_probes, tt_hits,
+                picker_nodes, capture_generations, quiet_generations,
+                repetition_table, repetition_index, stopped, stop_flag,
+                root_moves, root_move_count, root_scores, root_nodes, root_pvs, root_pv_lengths,
+                multipv_index, search_moves, search_move_count, verbose, move_stack, score_stack)
 
     @property
     def max_depth(self):
@@ -104,6 +156,22 @@ class SearchStruct(structref.StructRefProxy):
     def max_time(self):
         return SearchStruct_get_max_time(self)
 
+    @property
+    def soft_time(self):
+        return SearchStruct_get_soft_time(self)
+
+    @property
+    def max_nodes(self):
+        return SearchStruct_get_max_nodes(self)
+
+    @property
+    def max_mate(self):
+        return SearchStruct_get_max_mate(self)
+
+    @property
+    def multi_pv(self):
+        return SearchStruct_get_multi_pv(self)
+
     @property
     def start_time(self):
         return SearchStruct_get_start_time(self)
@@ -132,6 +200,30 @@ class SearchStruct(structref.StructRefProxy):
     def transposition_table(self):
         return SearchStruct_get_transposition_table(self)
 
+    @property
+    def tt_generation(self):
+        return SearchStruct_get_tt_generation(self)
+
+    @property
+    def tt_probes(self):
+        return SearchStruct_get_tt_probes(self)
+
+    @property
+    def tt_hits(self):
+        return SearchStruct_get_tt_hits(self)
+
+    @property
+    def picker_nodes(self):
+        return SearchStruct_get_picker_nodes(self)
+
+    @property
+    def capture_generations(self):
+        return SearchStruct_get_capture_generations(self)
+
+    @property
+    def quiet_generations(self):
+        return SearchStruct_get_quiet_generations(self)
+
     @property
     def repetition_table(self):
         return SearchStruct_get_repetition_table(self)
@@ -144,6 +236,58 @@ class SearchStruct(structref.StructRefProxy):
     def stopped(self):
         return SearchStruct_get_stopped(self)
 
+    @property
+    def stop_flag(self):
+        return SearchStruct_get_stop_flag(self)
+
+    @property
+    def root_moves(self):
+        return SearchStruct_get_root_moves(self)
+
+    @property
+    def root_move_count(self):
+        return SearchStruct_get_root_move_count(self)
+
+    @property
+    def root_scores(self):
+        return SearchStruct_get_root_scores(self)
+
+    @property
+    def root_nodes(self):
+        return SearchStruct_get_root_nodes(self)
+
+    @property
+    def root_pvs(self):
+        return SearchStruct_get_root_pvs(self)
+
+    @property
+    def root_pv_lengths(self):
+        return SearchStruct_get_root_pv_lengths(self)
+
+    @property
+    def multipv_index(self):
+        return SearchStruct_get_multipv_index(self)
+
+    @property
+    def search_moves(self):
+        return SearchStruct_get_search_moves(self)
+
+    @property
+    def search_move_count(self):
+        return SearchStruct_get_search_move_count(self)
+
+    @property
+    def verbose(self):
+        return SearchStruct_get_verbose(self)
+
+    @property
+    def move_stack(self):
+        return SearchStruct_get_move_stack(self)
+
+    @property
+    def score_stack(self):
+        return SearchStruct_get_score_stack(self)
+
 
 @njit(cache=True)
 def SearchStruct_get_max_depth(self):
@@ -175,6 +319,26 @@ def SearchStruct_get_max_time(self):
     return self.max_time
 
 
+@njit(cache=True)
+def SearchStruct_get_soft_time(self):
+    return self.soft_time
+
+
+@njit(cache=True)
+def SearchStruct_get_max_nodes(self):
+    return self.max_nodes
+
+
+@njit(cache=True)
+def SearchStruct_get_max_mate(self):
+    return self.max_mate
+
+
+@njit(cache=True)
+def SearchStruct_get_multi_pv(self):
+    return self.multi_pv
+
+
 @njit(cache=True)
 def SearchStruct_get_start_time(self):
     return self.start_time
@@ -210,6 +374,36 @@ def SearchStruct_get_transposition_table(self):
     return self.transposition_table
 
 
+@njit(cache=True)
+def SearchStruct_get_tt_generation(self):
+    return self.tt_generation
+
+
+@njit(cache=True)
+def SearchStruct_get_tt_probes(self):
+    return self.tt_probes
+
+
+@njit(cache=True)
+def SearchStruct_get_tt_hits(self):
+    return self.tt_hits
+
+
+@njit(cache=True)
+def SearchStruct_get_picker_nodes(self):
+    return self.picker_nodes
+
+
+@njit(cache=True)
+def SearchStruct_get_capture_generations(self):
+    return self.capture_generations
+
+
+@njit(cache=True)
+def SearchStruct_get_quiet_generations(self):
+    return self.quiet_generations
+
+
 @njit(cache=True)
 def SearchStruct_get_repetition_table(self):
     return self.repetition_table
@@ -225,11 +419,91 @@ def SearchStruct_get_stopped(self):
     return self.stopped
 
 
+@njit(cache=True)
+def SearchStruct_get_stop_flag(self):
+    return self.stop_flag
+
+
+@njit(cache=True)
+def SearchStruct_get_root_moves(self):
+    return self.root_moves
+
+
+@njit(cache=True)
+def SearchStruct_get_root_move_count(self):
+    return self.root_move_count
+
+
+@njit(cache=True)
+def SearchStruct_get_root_scores(self):
+    return self.root_scores
+
+
+@njit(cache=True)
+def SearchStruct_get_root_nodes(self):
+    return self.root_nodes
+
+
+@njit(cache=True)
+def SearchStruct_get_root_pvs(self):
+    return self.root_pvs
+
+
+@njit(cache=True)
+def SearchStruct_get_root_pv_lengths(self):
+    return self.root_pv_lengths
+
+
+@njit(cache=True)
+def SearchStruct_get_multipv_index(self):
+    return self.multipv_index
+
+
+@njit(cache=True)
+def SearchStruct_get_search_moves(self):
+    return self.search_moves
+
+
+@njit(cache=True)
+def SearchStruct_get_search_move_count(self):
+    return self.search_move_count
+
+
+@njit(cache=True)
+def SearchStruct_get_verbose(self):
+    return self.verbose
+
+
+@njit(cache=True)
+def SearchStruct_get_move_stack(self):
+    return self.move_stack
+
+
+@njit(cache=True)
+def SearchStruct_get_score_stack(self):
+    return self.score_stack
+
+
 @njit(cache=True)
 def SearchStruct_set_max_time(engine, t):
     engine.max_time = t
 
 
+@njit(cache=True)
+def SearchStruct_set_soft_time(engine, t):
+    engine.soft_time = t
+
+
+@njit(cache=True)
+def SearchStruct_set_max_nodes(engine, n):
+    engine.max_nodes = n
+
+
+@njit(cache=True)
+def SearchStruct_set_max_mate(engine, m):
+    engine.max_mate = m
+
+
 @njit(cache=True)
 def SearchStruct_set_start_time(engine, t):
     engine.start_time = t
@@ -252,12 +526,76 @@ def SearchStruct_set_current_search_depth(engine, d):
 def SearchStruct_set_stopped(engine, s):
     engine.stopped = s
 
+@njit(cache=True)
+def SearchStruct_set_transposition_table(engine, t):
+    engine.transposition_table = t
+
+@njit(cache=True)
+def SearchStruct_set_tt_generation(engine, g):
+    engine.tt_generation = g
+
+@njit(cache=True)
+def SearchStruct_set_stop_flag(engine, f):
+    engine.stop_flag = f
+
+
+@njit(cache=True)
+def SearchStruct_set_multi_pv(engine, m):
+    engine.multi_pv = m
+
+
+@njit(cache=True)
+def SearchStruct_set_multipv_index(engine, i):
+    engine.multipv_index = i
+
+
+@njit(cache=True)
+def SearchStruct_set_search_move_count(engine, c):
+    engine.search_move_count = c
+
+
+@njit(cache=True)
+def SearchStruct_set_verbose(engine, v):
+    engine.verbose = v
+
 
 structref.define_proxy(SearchStruct, SearchStructType, ["max_depth", "max_qdepth", "min_depth",
-                "current_search_depth", "ply", "max_time", "start_time", "node_count",
+                "current_search_depth", "ply", "max_time", "soft_time", "max_nodes", "max_mate", "multi_pv",
+                "start_time", "node_count",
                 "pv_table", "pv_length", "killer_moves", "history_moves",
-                "transposition_table", "repetition_table", "repetition_index",
-                "stopped"])
+                "transposition_table", "tt_generation", "tt_probes", "tt_hits",
+                "picker_nodes", "capture_generations", "quiet_generations",
+                "repetition_table", "repetition_index", "stopped", "stop_flag",
+                "root_moves", "root_move_count", "root_scores", "root_nodes", "root_pvs", "root_pv_lengths",
+                "multipv_index", "search_moves", "search_move_count", "verbose", "move_stack", "score_stack"])
+
+# The concrete type of a SearchStruct instance, used for explicit signatures
+SEARCH_STRUCT_TYPE = SearchStructType(search_spec)
+
+
+@njit(cache=True)
+def get_tt_bucket_count(megabytes):
+    """
+    Returns the largest power of two number of buckets fitting in the megabytes,
+    so that a bucket is indexed by masking the hash key instead of a modulo.
+    """
+    bucket_count = 1
+    while bucket_count * 2 * TT_BUCKET_BYTES <= megabytes * 1024 * 1024:
+        bucket_count *= 2
+
+    return bucket_count
+
+
+@njit(cache=True)
+def allocate_transposition_table(size):
+    """
+    Allocates a zeroed table of size buckets, starting on a cache line boundary
+    so that every bucket sits in exactly one cache line.
+    """
+    buffer = np.zeros(size * TT_BUCKET_BYTES + TT_BUCKET_BYTES, dtype=np.uint8)
+    offset = (-buffer.ctypes.data) % TT_BUCKET_BYTES
+
+    return buffer[offset:offset + size * TT_BUCKET_BYTES].view(HASH_BUCKET_TYPE)
 
 
 @njit(cache=True)
@@ -268,16 +606,39 @@ def init_search():
                           current_search_depth=nb.int16(0),
                           ply=nb.int16(0),
                           max_time=nb.uint64(10000),
+                          soft_time=nb.uint64(0),
+                          max_nodes=nb.uint64(0),
+                          max_mate=nb.uint16(0),
+                          multi_pv=nb.uint16(1),
                           start_time=nb.double(0),
                           node_count=nb.uint64(0),
                           pv_table=np.zeros((64, 64), dtype=np.uint32),
                           pv_length=np.zeros(65, dtype=np.uint16),
                           killer_moves=np.zeros((2, 64), dtype=np.uint32),
                           history_moves=np.zeros((12, 64), dtype=np.uint32),
-                          transposition_table=np.zeros(MAX_HASH_SIZE, dtype=NUMBA_HASH_TYPE),
+                          transposition_table=allocate_transposition_table(get_tt_bucket_count(DEFAULT_HASH_SIZE)),
+                          tt_generation=nb.uint8(0),
+                          tt_probes=nb.uint64(0),
+                          tt_hits=nb.uint64(0),
+                          picker_nodes=nb.uint64(0),
+                          capture_generations=nb.uint64(0),
+                          quiet_generations=nb.uint64(0),
                           repetition_table=np.zeros(REPETITION_TABLE_SIZE, dtype=np.uint64),
                           repetition_index=nb.uint16(0),
-                          stopped=False
+                          stopped=False,
+                          stop_flag=np.zeros(1, dtype=np.uint8),
+                          root_moves=np.zeros(MAX_MOVES, dtype=np.uint32),
+                          root_move_count=nb.uint16(0),
+                          root_scores=np.zeros(MAX_MOVES, dtype=np.int32),
+                          root_nodes=np.zeros(MAX_MOVES, dtype=np.uint64),
+                          root_pvs=np.zeros((MAX_MOVES, MAX_SEARCH_DEPTH), dtype=np.uint32),
+                          root_pv_lengths=np.zeros(MAX_MOVES, dtype=np.uint16),
+                          multipv_index=nb.uint16(0),
+                          search_moves=np.zeros(MAX_MOVES, dtype=np.uint32),
+                          search_move_count=nb.uint16(0),
+                          verbose=False,
+                          move_stack=np.zeros((MAX_PLY, MAX_MOVES), dtype=np.uint32),
+                          score_stack=np.zeros((MAX_PLY, MAX_MOVES), dtype=np.int32)
                           )
 
 
@@ -0,0 +1,80 @@
+"""
+Transposition table in shared memory.
+
+The table of one engine is allocated in a multiprocessing.shared_memory block, and the engines of
+worker processes started with multiprocessing attach to it by name, so every process searches on the same table.
+No locks are taken: transposition.py stores the key of each entry XORed with its data,
+so an entry torn by two processes writing it at once reads as a miss.
+
+    memory = create_shared_table(engine, megabytes)
+    # in each worker, with memory.name and the bucket count of the table
+    worker_memory = attach_shared_table(worker_engine, name, bucket_count)
+    ...
+    release_shared_table(worker_engine, worker_memory, False)
+    release_shared_table(engine, memory, True)
+"""
+
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from search import set_hash_size
+from search_class import SearchStruct_set_transposition_table, get_tt_bucket_count
+from transposition import clear_tt
+from utilities import HASH_BUCKET_TYPE, TT_BUCKET_BYTES
+
+
+def get_shared_table(memory, bucket_count):
+    # Shared memory is page aligned, so the buckets are aligned to cache lines
+    return np.frombuffer(memory.buf, dtype=HASH_BUCKET_TYPE, count=bucket_count)
+
+
+def create_shared_table(engine, megabytes):
+    """Replaces the table of the engine with an empty shared one, returns the shared memory block."""
+
+    bucket_count = get_tt_bucket_count(megabytes)
+
+    # The current table is released first, so the memory used never holds both tables
+    set_hash_size(engine, 1)
+
+    memory = shared_memory.SharedMemory(create=True, size=bucket_count * TT_BUCKET_BYTES)
+    SearchStruct_set_transposition_table(engine, get_shared_table(memory, bucket_count))
+    clear_tt(engine)
+
+    return memory
+
+
+def attach_shared_table(engine, name, bucket_count):
+    """Replaces the table of the engine with the shared table created under that name."""
+
+    set_hash_size(engine, 1)
+
+    # The block belongs to the process that created it. Before python 3.13 attaching also registers it with
+    # the resource tracker, which is shared with the creator by the processes started from multiprocessing
+    if sys.version_info >= (3, 13):
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        memory = shared_memory.SharedMemory(name=name)
+
+    SearchStruct_set_transposition_table(engine, get_shared_table(memory, bucket_count))
+
+    return memory
+
+
+def release_shared_table(engine, memory, unlink):
+    """
+    Gives the engine a private table again and closes the block,
+    unlink frees the block and is only done by the process that created it.
+    """
+
+    set_hash_size(engine, 1)
+
+    try:
+        memory.close()
+    except BufferError:
+        # A view of the table is still alive somewhere, the mapping is closed with it
+        pass
+
+    if unlink:
+        memory.unlink()
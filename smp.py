@@ -0,0 +1,164 @@
+"""
+Lazy SMP.
+
+With the uci option Threads above 1, the search runs in Threads - 1 helper processes next to the main one.
+Numba code can't share a SearchStruct between threads, so each helper is a process with its own engine
+(killers, history, pv and repetition tables) and all of them search on one transposition table,
+in shared memory (shared_table.py) or in the Hash File mapped by every process.
+
+On 'go' the helpers search the same position without printing anything, half of them one ply deeper
+than the main search. They only communicate through the table: the entries they store cut off and order
+the main search, which reports the bestmove as usual. The helpers are then stopped through a shared flag
+checked every 1024 nodes.
+
+Helpers are spawned, so they load the compiled kernels from the cache in a second or two instead of compiling.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from search import iterative_search
+from search_class import SearchStruct_set_stop_flag, get_tt_bucket_count
+from shared_table import attach_shared_table, create_shared_table, release_shared_table
+
+
+# The helper processes with the connections to them, the shared memory block of the table
+# (None with a hash file) and the block holding the stop flag
+helpers = []
+table_memory = None
+stop_memory = None
+
+
+def run_helper(connection, stop_name, table_name, hash_file, megabytes, index):
+    """The loop of a helper process, answers each 'go' with the node count once its search is stopped."""
+
+    from engine_build import is_build_fresh, load_engine
+    from hash_file import map_hash_file
+    from main import parse_position
+    from position_class import init_position
+    from search import compile_engine, new_game
+    from search_class import init_search, SearchStruct_set_max_depth, SearchStruct_set_max_time, \
+        SearchStruct_set_tt_generation, SearchStruct_set_search_move_count
+    from utilities import NO_MOVE
+
+    engine = init_search()
+    position = init_position()
+
+    if is_build_fresh():
+        load_engine(engine, position)
+    else:
+        compile_engine(engine, position)
+
+    # Attached after the warm-up search, which would write to the table
+    if hash_file:
+        map_hash_file(engine, hash_file, megabytes)
+        table = None
+    else:
+        table = attach_shared_table(engine, table_name, get_tt_bucket_count(megabytes))
+
+    stop_block = shared_memory.SharedMemory(name=stop_name)
+    SearchStruct_set_stop_flag(engine, np.frombuffer(stop_block.buf, dtype=np.uint8, count=1))
+
+    connection.send("ready")
+
+    while True:
+        command = connection.recv()
+        if command[0] == "quit":
+            break
+
+        _, position_tokens, max_depth, tt_generation, search_moves = command
+
+        new_game(engine, False)
+        parse_position(engine, position, position_tokens, NO_MOVE)
+
+        # Entries are aged by the generation of the main search
+        SearchStruct_set_tt_generation(engine, tt_generation)
+        SearchStruct_set_max_depth(engine, max_depth)
+        SearchStruct_set_max_time(engine, 10 ** 12)
+
+        engine.search_moves[:len(search_moves)] = search_moves
+        SearchStruct_set_search_move_count(engine, len(search_moves))
+
+        iterative_search(engine, position, True, 1 + index % 2)
+
+        connection.send(engine.node_count)
+
+    if table is not None:
+        release_shared_table(engine, table, False)
+
+    SearchStruct_set_stop_flag(engine, np.zeros(1, dtype=np.uint8))
+    stop_block.close()
+
+
+def start_helpers(engine, thread_count, hash_file, megabytes):
+    """
+    Starts thread_count - 1 helpers searching on the table of the engine, and waits until they are ready.
+    Without a hash file, the table of the engine is replaced by an empty shared one.
+    """
+    global table_memory, stop_memory
+
+    if not hash_file:
+        table_memory = create_shared_table(engine, megabytes)
+
+    stop_memory = shared_memory.SharedMemory(create=True, size=1)
+    get_stop_flag()[0] = 0
+
+    context = multiprocessing.get_context("spawn")
+
+    for index in range(thread_count - 1):
+        connection, helper_connection = context.Pipe()
+        process = context.Process(target=run_helper, daemon=True,
+                                  args=(helper_connection, stop_memory.name,
+                                        table_memory.name if table_memory else None, hash_file, megabytes, index))
+        process.start()
+        helpers.append((process, connection))
+
+    for _, connection in helpers:
+        connection.recv()
+
+
+def stop_helpers(engine):
+    """Stops the helpers, if any, and frees the shared table. The engine is left with a table of 1 mb."""
+    global table_memory, stop_memory
+
+    for process, connection in helpers:
+        connection.send(("quit",))
+        process.join()
+
+    helpers.clear()
+
+    if table_memory is not None:
+        release_shared_table(engine, table_memory, True)
+        table_memory = None
+
+    if stop_memory is not None:
+        stop_memory.close()
+        stop_memory.unlink()
+        stop_memory = None
+
+
+def get_stop_flag():
+    return np.frombuffer(stop_memory.buf, dtype=np.uint8, count=1)
+
+
+def search(engine, position, position_tokens, compiling):
+    """
+    Runs iterative_search with the helpers searching alongside,
+    returns the principal variation and the node count of all processes.
+    """
+
+    if not helpers:
+        best_pv = iterative_search(engine, position, compiling)
+        return best_pv, engine.node_count
+
+    get_stop_flag()[0] = 0
+    for _, connection in helpers:
+        search_moves = list(engine.search_moves[:engine.search_move_count])
+        connection.send(("go", position_tokens, engine.max_depth, engine.tt_generation, search_moves))
+
+    best_pv = iterative_search(engine, position, compiling)
+
+    get_stop_flag()[0] = 1
+    return best_pv, engine.node_count + sum(connection.recv() for _, connection in helpers)
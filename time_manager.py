@@ -0,0 +1,104 @@
+"""
+Time management.
+
+A timed search gets two limits. The soft limit is the time the move should take: once an iteration ends past it,
+scaled by how settled the search is, no new iteration is started. The hard limit, checked by the search every
+1024 nodes, is where an iteration is cut off, so a search whose best move or score keeps changing can take
+up to HARD_TIME_SCALE times the soft limit without risking the clock.
+
+The overhead of a move (the time between the gui sending 'go' and receiving 'bestmove' that the search doesn't see)
+is the uci option Move Overhead, plus the lag measured over the game: after each timed move, the clock the gui
+reports next is compared with the clock the move should have left.
+"""
+
+from move import get_is_capture
+from position import is_attacked
+
+
+# Moves the remaining time is spread over in sudden death, and the most with a movestogo
+MOVES_HORIZON = 40
+MAX_MOVES_HORIZON = 50
+
+# The hard limit as a multiple of the soft limit, and the largest parts of the remaining time each may take
+HARD_TIME_SCALE = 4
+MAX_SOFT_TIME_PART = 0.25
+MAX_HARD_TIME_PART = 0.5
+
+# ms, the uci option Move Overhead
+DEFAULT_MOVE_OVERHEAD = 30
+MAX_MOVE_OVERHEAD = 5000
+
+# ms, the largest lag the measure trusts, larger differences come from a clock the gui has reset
+MAX_MEASURED_LAG = 1000
+
+# The clock given with the last 'go' of the game, its time and increment, the time taken by the move
+# (0 when it isn't measured) and the lag measured so far, all in ms
+clock = {"time": 0, "inc": 0, "used": 0, "lag": 0}
+
+
+def reset_clock():
+    """On 'ucinewgame', the lag of the last game isn't carried over."""
+
+    clock.update(time=0, inc=0, used=0, lag=0)
+
+
+def measure_lag(self_time):
+    """Compares the clock of the gui with the one the last move should have left, and returns the lag so far."""
+
+    if clock["used"] and self_time > 0:
+        lag = clock["time"] + clock["inc"] - clock["used"] - self_time
+
+        # A single slow move is remembered for a few moves, so the lag decays instead of being averaged away
+        if 0 <= lag <= MAX_MEASURED_LAG:
+            clock["lag"] = max(clock["lag"] * 3 // 4, lag)
+
+    return clock["lag"]
+
+
+def record_move_time(used):
+    """
+    Called with the ms from 'go' to 'bestmove' of a move searched on the clock.
+    Moves that were pondered or had no clock aren't measured.
+    """
+
+    if clock["time"]:
+        clock["used"] = max(used, 1)
+
+
+def allocate_time(position, last_move, self_time, inc, movetime, movestogo, move_overhead):
+    """
+    Returns the soft and the hard limit of the move in ms, or None without a clock.
+    With movetime, both limits are the given time.
+    """
+
+    overhead = move_overhead + measure_lag(self_time)
+    clock.update(time=self_time if movetime <= 0 else 0, inc=inc, used=0)
+
+    if movetime > 0:
+        movetime = max(movetime - overhead, 1)
+        return movetime, movetime
+
+    if self_time <= 0:
+        return None
+
+    available = max(self_time - overhead, 1)
+
+    # In check or after a capture, which is often answered by a recapture, a little more time is taken
+    rate = 20
+    if is_attacked(position, position.king_positions[position.side]):
+        rate -= 3
+    if get_is_capture(last_move):
+        rate -= 1.5
+
+    moves_left = min(movestogo, MAX_MOVES_HORIZON) if movestogo > 0 else MOVES_HORIZON
+
+    # The last move before the time control may use most of the time
+    if moves_left == 1:
+        max_soft_part = max_hard_part = 0.9
+    else:
+        max_soft_part, max_hard_part = MAX_SOFT_TIME_PART, MAX_HARD_TIME_PART
+
+    soft_time = min((available / moves_left + inc * 0.75) * (20 / rate), available * max_soft_part)
+    hard_time = min(soft_time * HARD_TIME_SCALE, available * max_hard_part)
+
+    return max(int(soft_time), 1), max(int(hard_time), 1)
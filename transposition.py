@@ -1,70 +1,188 @@
+from utilities import *
 
 
-from utilities import *
+# The table is made of buckets of TT_BUCKET_SIZE entries, each bucket fitting in one cache line.
+# Entries found by a probe get the current generation, so the ones still in use are not aged out.
+#
+# The table may be shared by several processes writing without locks (shared_table.py),
+# so the key of an entry is stored XORed with a check of its data. An entry torn by two processes
+# writing it at once then fails the verification and reads as a miss. The fields of an entry are
+# read once into locals, so a write happening after the verification can't mix into the result.
+
+
+@nb.njit(cache=True)
+def get_tt_bucket(engine, hash_key):
+    # The number of buckets is a power of two, so the low bits of the key index the table
+    return engine.transposition_table[hash_key & nb.uint64(len(engine.transposition_table) - 1)].entries
+
+
+@nb.njit(cache=True)
+def get_tt_key(hash_key):
+    # The lowest bit is always set, so that an empty entry never matches
+    return nb.uint32((hash_key >> nb.uint64(32)) | nb.uint64(1))
+
+
+@nb.njit(cache=True)
+def get_data_check(move, score, depth, flag, generation):
+    # Folds the data of an entry into 32 bits, the values are cast to the types they are stored as
+    return nb.uint32(move) ^ nb.uint32(nb.int32(score)) ^ \
+        (nb.uint32(nb.uint8(nb.int8(depth))) | nb.uint32(flag) << 8 | nb.uint32(generation) << 16)
+
+
+@nb.njit(cache=True)
+def get_entry_key(entry):
+    # The verification key of the entry, 0 for an empty entry
+    return entry.key ^ get_data_check(entry.move, entry.score, entry.depth, entry.flag, entry.generation)
+
+
+@nb.njit(cache=True)
+def write_tt_entry(entry, key, score, flag, move, depth, generation):
+    entry.score = score
+    entry.flag = flag
+    entry.move = move
+    entry.depth = depth
+    entry.generation = generation
+    entry.key = key ^ get_data_check(move, score, depth, flag, generation)
+
+
+@nb.njit(cache=True)
+def clear_tt(engine):
+    # Clears the table in place without reallocating it, a zeroed entry is empty
+    table = engine.transposition_table
+
+    for i in range(len(table)):
+        for j in range(TT_BUCKET_SIZE):
+            write_tt_entry(table[i].entries[j], 0, 0, 0, 0, 0, 0)
+
+    engine.tt_generation = 0
 
 
 @nb.njit(cache=True)
 def probe_tt_entry(engine, position, alpha, beta, depth):
-    entry = engine.transposition_table[position.hash_key % MAX_HASH_SIZE]
+    entries = get_tt_bucket(engine, position.hash_key)
+    key = get_tt_key(position.hash_key)
+    engine.tt_probes += 1
+
+    for i in range(TT_BUCKET_SIZE):
+        entry = entries[i]
+
+        entry_key = entry.key
+        entry_score = entry.score
+        entry_flag = entry.flag
+        entry_move = entry.move
+        entry_depth = entry.depth
+        entry_generation = entry.generation
 
-    if entry.key == position.hash_key:
-        if entry.depth >= depth:
+        if entry_key ^ get_data_check(entry_move, entry_score, entry_depth, entry_flag, entry_generation) == key:
+            engine.tt_hits += 1
 
-            score = entry.score
+            if entry_generation != engine.tt_generation:
+                write_tt_entry(entry, key, entry_score, entry_flag, entry_move, entry_depth, engine.tt_generation)
 
-            if entry.flag == HASH_FLAG_EXACT:
-                return score
-            if entry.flag == HASH_FLAG_ALPHA and entry.score <= alpha:
-                return score
-            if entry.flag == HASH_FLAG_BETA and entry.score >= beta:
-                return score
+            if entry_depth >= depth:
 
-        return USE_HASH_MOVE + entry.move
+                if entry_flag == HASH_FLAG_EXACT:
+                    return entry_score
+                if entry_flag == HASH_FLAG_ALPHA and entry_score <= alpha:
+                    return entry_score
+                if entry_flag == HASH_FLAG_BETA and entry_score >= beta:
+                    return entry_score
+
+            return USE_HASH_MOVE + entry_move
 
     return NO_HASH_ENTRY
 
 
 @nb.njit(cache=True)
-def record_tt_entry(engine, position, score, flag, move, depth):
-    index = position.hash_key % MAX_HASH_SIZE
+def probe_tt_move(engine, position):
+    entries = get_tt_bucket(engine, position.hash_key)
+    key = get_tt_key(position.hash_key)
 
-    if engine.transposition_table[index].key != position.hash_key     \
-            or depth > engine.transposition_table[index].depth        \
-            or flag == HASH_FLAG_EXACT:
+    for i in range(TT_BUCKET_SIZE):
+        entry_move = entries[i].move
 
-        engine.transposition_table[index].key = position.hash_key
-        engine.transposition_table[index].depth = depth
-        engine.transposition_table[index].flag = flag
-        engine.transposition_table[index].score = score
-        engine.transposition_table[index].move = move
+        if get_entry_key(entries[i]) == key:
+            return entry_move
+
+    return NO_MOVE
 
 
 @nb.njit(cache=True)
-def probe_tt_entry_q(engine, position, alpha, beta):
-    entry = engine.transposition_table[position.hash_key % MAX_HASH_SIZE]
+def get_replacement_index(engine, entries, key):
+    """
+    Returns the index of the entry holding the same position or an empty entry,
+    otherwise the one with the lowest depth - TT_AGE_WEIGHT * age.
+    """
+    replace_index = 0
+    replace_score = INF
+
+    for i in range(TT_BUCKET_SIZE):
+        entry_key = get_entry_key(entries[i])
+        if entry_key == key or entry_key == 0:
+            return i
+
+        age = (engine.tt_generation - entries[i].generation) & 0xFF
+        score = entries[i].depth - TT_AGE_WEIGHT * age
+
+        if score < replace_score:
+            replace_index = i
+            replace_score = score
 
-    if entry.key == position.hash_key:
-        score = entry.score
+    return replace_index
 
-        if entry.flag == HASH_FLAG_EXACT:
-            return score
-        if entry.flag == HASH_FLAG_ALPHA and entry.score <= alpha:
-            return score
-        if entry.flag == HASH_FLAG_BETA and entry.score >= beta:
-            return score
-        return USE_HASH_MOVE + entry.move
+
+@nb.njit(cache=True)
+def record_tt_entry(engine, position, score, flag, move, depth):
+    entries = get_tt_bucket(engine, position.hash_key)
+    key = get_tt_key(position.hash_key)
+    entry = entries[get_replacement_index(engine, entries, key)]
+
+    if get_entry_key(entry) != key                     \
+            or depth > entry.depth                      \
+            or flag == HASH_FLAG_EXACT                  \
+            or entry.generation != engine.tt_generation:
+
+        write_tt_entry(entry, key, score, flag, move, depth, engine.tt_generation)
+
+
+@nb.njit(cache=True)
+def probe_tt_entry_q(engine, position, alpha, beta):
+    entries = get_tt_bucket(engine, position.hash_key)
+    key = get_tt_key(position.hash_key)
+    engine.tt_probes += 1
+
+    for i in range(TT_BUCKET_SIZE):
+        entry = entries[i]
+
+        entry_key = entry.key
+        entry_score = entry.score
+        entry_flag = entry.flag
+        entry_move = entry.move
+        entry_depth = entry.depth
+        entry_generation = entry.generation
+
+        if entry_key ^ get_data_check(entry_move, entry_score, entry_depth, entry_flag, entry_generation) == key:
+            engine.tt_hits += 1
+
+            if entry_generation != engine.tt_generation:
+                write_tt_entry(entry, key, entry_score, entry_flag, entry_move, entry_depth, engine.tt_generation)
+
+            if entry_flag == HASH_FLAG_EXACT:
+                return entry_score
+            if entry_flag == HASH_FLAG_ALPHA and entry_score <= alpha:
+                return entry_score
+            if entry_flag == HASH_FLAG_BETA and entry_score >= beta:
+                return entry_score
+            return USE_HASH_MOVE + entry_move
 
     return NO_HASH_ENTRY
 
 
 @nb.njit(cache=True)
 def record_tt_entry_q(engine, position, score, flag, move):
-    index = position.hash_key % MAX_HASH_SIZE
-
-    if engine.transposition_table[index].key != position.hash_key:
+    entries = get_tt_bucket(engine, position.hash_key)
+    key = get_tt_key(position.hash_key)
+    entry = entries[get_replacement_index(engine, entries, key)]
 
-        engine.transposition_table[index].key = position.hash_key
-        engine.transposition_table[index].depth = -1
-        engine.transposition_table[index].flag = flag
-        engine.transposition_table[index].score = score
-        engine.transposition_table[index].move = move
+    if get_entry_key(entry) != key:
+        write_tt_entry(entry, key, score, flag, move, -1, engine.tt_generation)
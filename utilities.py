@@ -2,10 +2,16 @@
 import numpy as np
 import numba as nb
 
+import cache_manager  # noqa: F401, installs the engine's cache locator before anything is jitted
 
-np.random.seed(1)
 
-MAX_HASH_SIZE       = 0x3640E2  # 64 mb
+# The zobrist keys are generated from this seed, a saved hash file is only valid for the same keys
+ZOBRIST_SEED = 1
+np.random.seed(ZOBRIST_SEED)
+
+DEFAULT_HASH_SIZE   = 64        # mb, set with the uci Hash option
+MAX_HASH_SIZE       = 65536     # mb
+MAX_THREADS         = 128       # searching processes, set with the uci Threads option
 NO_HASH_ENTRY       = 2000000
 USE_HASH_MOVE       = 3000000
 REPETITION_TABLE_SIZE = 500
@@ -18,11 +24,19 @@ MATE_SCORE          = 100000
 ASPIRATION_VAL      = 50
 
 # Search Constants
+MAX_SEARCH_DEPTH    = 64        # plies, the depth limit of a 'go' without one
+MAX_MOVES           = 256       # more than the legal moves of any position
+MAX_PLY             = 128       # rows of the move stack, the plies of negamax then those of qsearch
+CURRMOVE_DELAY      = 1000      # ms of search before the root moves are reported with 'info currmove'
 FULL_DEPTH_MOVES    = 2
 REDUCTION_LIMIT     = 3
 FUTILITY_MIN_DEPTH = 2
 FUTILITY_MARGIN_PER_DEPTH = 150
 
+# Time Management Constants, the soft limit of a timed search is scaled by how settled the search is
+STABILITY_SCALES    = (2.0, 1.4, 1.1, 0.9, 0.8)     # by the iterations the best move has stayed the best
+SCORE_DROP_SCALE    = 100       # cp of score drop doubling the time, a rising score takes up to a quarter less
+
 # Piece/Move/Position Constants
 MOVE_TYPE_NORMAL    = 0
 MOVE_TYPE_EP        = 1
@@ -62,10 +76,24 @@ SCORE_TYPE = nb.int32
 MOVE_TYPE = nb.uint32
 
 # This allows for a structured array similar to a C struct
-# This is 18 bytes
-NUMBA_HASH_TYPE = nb.from_dtype(np.dtype(
-    [("key", np.uint64), ("score", np.int32), ("flag", np.uint8), ("move", np.uint32), ("depth", np.int8)]
-))
+# An entry is 16 bytes, and a bucket holds 4 of them in the 64 bytes of a cache line,
+# so a probe only touches one cache line.
+# The key is the upper half of the hash key, as the lower bits already select the bucket.
+TT_BUCKET_SIZE = 4
+TT_BUCKET_BYTES = 64
+
+HASH_ENTRY_TYPE = np.dtype(
+    [("key", np.uint32), ("move", np.uint32), ("score", np.int32), ("depth", np.int8), ("flag", np.uint8),
+     ("generation", np.uint8), ("padding", np.uint8)]
+)
+
+# When a bucket is full the entry with the lowest depth - TT_AGE_WEIGHT * age is replaced,
+# the age being the number of searches since the entry was last used.
+TT_AGE_WEIGHT = 8
+
+HASH_BUCKET_TYPE = np.dtype([("entries", HASH_ENTRY_TYPE, TT_BUCKET_SIZE)])
+
+NUMBA_HASH_TYPE = nb.from_dtype(HASH_BUCKET_TYPE)
 
 STANDARD_TO_MAILBOX = np.array((
     21, 22, 23, 24, 25, 26, 27, 28,
@@ -95,43 +123,6 @@ MAILBOX_TO_STANDARD = np.array((
 ))
 
 
-WHITE_INCREMENTS = np.array((
-    (-11,  -9, -10, -20,   0,   0,   0,   0),  # Pawn
-    (-21, -19,  -8,  12,  21,  19,   8, -12),  # Knight
-    (-11,  11,   9,  -9,   0,   0,   0,   0),
-    (-10,   1,  10,  -1,   0,   0,   0,   0),
-    (-11,  11,   9,  -9, -10,   1,  10,  -1),
-    (-11, -10,  -9,   1,  11,  10,   9,  -1)
-))
-
-BLACK_INCREMENTS = np.array((
-    ( 11,   9,  10,  20,   0,   0,   0,   0),
-    (-21, -19,  -8,  12,  21,  19,   8, -12),
-    (-11,  11,   9,  -9,   0,   0,   0,   0),
-    (-10,   1,  10,  -1,   0,   0,   0,   0),
-    (-11,  11,   9,  -9, -10,   1,  10,  -1),
-    (-11, -10,  -9,   1,  11,  10,   9,  -1)
-))
-
-WHITE_ATK_INCREMENTS = np.array((
-    (-11,  -9,   0,   0,   0,   0,   0,   0),
-    (-21, -19,  -8,  12,  21,  19,   8, -12),
-    (-11,  11,   9,  -9,   0,   0,   0,   0),
-    (-10,   1,  10,  -1,   0,   0,   0,   0),
-    (-11,  11,   9,  -9, -10,   1,  10,  -1),
-    (-11, -10,  -9,   1,  11,  10,   9,  -1)
-))
-
-BLACK_ATK_INCREMENTS = np.array((
-    ( 11,   9,   0,   0,   0,   0,   0,   0),
-    (-21, -19,  -8,  12,  21,  19,   8, -12),
-    (-11,  11,   9,  -9,   0,   0,   0,   0),
-    (-10,   1,  10,  -1,   0,   0,   0,   0),
-    (-11,  11,   9,  -9, -10,   1,  10,  -1),
-    (-11, -10,  -9,   1,  11,  10,   9,  -1)
-))
-
-
 GAME_PHASE_SCORES = np.array((0, 1, 1, 2, 4, 0))
 PIECE_VALUES_MID = np.array((82, 326, 352, 486, 982, 0))  # I like even numbers :D especially 2 and 6
 PIECE_VALUES_END = np.array((96, 292, 304, 512, 936, 0))